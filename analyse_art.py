@@ -2,49 +2,227 @@
 
 # Load in the likes and dislikes from the pickle files.
 import os
+import json
 import pickle
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
-from tkinter import W
-from colorsys import hsv_to_rgb
-from PIL import Image
-import numpy as np
+from painting_dataset import PaintingDataset, split_path
+from colour_stats import colour_statistics, compare, histogram_image, palette_image, swatch_image
 
+# Fewer new pickles than this are unpickled in-process; starting a pool costs more
+MIN_POOL_FILES = 16
 
 
-def load_list_of_paintings(painting_dir):
-    painting_list = []
-    for painting in painting_dir.glob('*.pickle'):
-        with open(painting, 'rb') as fp:
-            f = pickle.load(fp)
-            painting_list.append(f)
-    return painting_list
+# Bump when the manifest's meaning changes; older manifests are rebuilt
+MANIFEST_VERSION = 2
+
+
+def manifest_path(painting_dir):
+    """Return where a split's pickle manifest is kept (data/like -> data/like.manifest.json)."""
+    painting_dir = Path(painting_dir)
+    return painting_dir.with_name(painting_dir.name + ".manifest.json")
+
+
+def pickle_cache_path(painting_dir):
+    """Return the dataset legacy pickles are loaded into (data/like -> data/like.pickles.paintings)."""
+    painting_dir = Path(painting_dir)
+    return painting_dir.with_name(painting_dir.name + ".pickles.paintings")
+
+
+def _read_manifest(painting_dir):
+    # pickle file name -> [mtime_ns, size, index in the pickle cache, or None if the
+    # painting is in the split's own dataset (copied there by painting_dataset.py migrate)]
+    try:
+        with open(manifest_path(painting_dir)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return manifest["files"] if manifest.get("version") == MANIFEST_VERSION else {}
+
+
+def _write_manifest(painting_dir, files):
+    # Write then rename, so an interrupted run leaves the previous manifest intact
+    path = manifest_path(painting_dir)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, f)
+    os.replace(tmp, path)
+
+
+def _scan_pickles(painting_dir):
+    # pickle file name -> [mtime_ns, size]; one stat per file, nothing is opened
+    stamps = {}
+    try:
+        with os.scandir(painting_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".pickle"):
+                    stat = entry.stat()
+                    stamps[entry.name] = [stat.st_mtime_ns, stat.st_size]
+    except FileNotFoundError:
+        pass
+    return stamps
+
+
+def _unpickle_painting(pickle_path):
+    # Top-level so the process pool can pickle it; plain lists travel back faster than a DataFrame
+    with open(pickle_path, "rb") as f:
+        df = pickle.load(f)
+    return list(df["start_points"]), list(df["marks"]), list(df["mark_specs"])
+
+
+def _sync(painting_dir, workers=None, batch_size=500):
+    # Reconcile the manifest with the pickles on disk, returning the split's
+    # dataset, the pickle cache and a generator that loads new pickles into the cache.
+    # The split's dataset is only read: art.py appends to it.
+    painting_dir = Path(painting_dir)
+    split = PaintingDataset(split_path(painting_dir))
+    cache = PaintingDataset(pickle_cache_path(painting_dir))
+    files = _read_manifest(painting_dir)
+    on_disk = _scan_pickles(painting_dir)
+    before = dict(files)
+
+    # A pickle that went away leaves its painting where it is; only its entry goes.
+    for name in [name for name in files if name not in on_disk]:
+        del files[name]
+
+    # A pickle rewritten in place is loaded again, replacing its cached painting.
+    changed = [name for name, entry in files.items() if on_disk[name] != entry[:2]]
+    stale = {files[name][2] for name in changed if files[name][2] is not None}
+    for name in changed:
+        del files[name]
+    if stale:
+        renumbered = cache.compact(stale)
+        files = {name: entry[:2] + [None if entry[2] is None else renumbered[entry[2]]]
+                 for name, entry in files.items()}
+
+    new = sorted(name for name in on_disk if name not in files)
+    if new:
+        # Pickles already copied into the split by painting_dataset.py migrate aren't loaded twice.
+        migrated = {split.png_path(i) for i in range(len(split))}
+        for name in list(new):
+            if str((painting_dir / name).with_suffix(".png")) in migrated:
+                files[name] = on_disk[name] + [None]
+                new.remove(name)
+    if files != before:
+        _write_manifest(painting_dir, files)
+    return split, cache, _load_new(painting_dir, cache, files, on_disk, new, workers, batch_size)
+
+
+def _load_new(painting_dir, cache, files, on_disk, new, workers, batch_size):
+    if not new:
+        return
+    workers = workers or os.cpu_count() or 1
+    if len(new) < MIN_POOL_FILES:
+        workers = 1
+    batch = []
+
+    def flush():
+        first = len(cache)
+        cache.append([painting[:4] for painting in batch])
+        for offset, painting in enumerate(batch):
+            files[painting[4]] = on_disk[painting[4]] + [first + offset]
+        _write_manifest(painting_dir, files)
+        batch.clear()
+
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as executor:
+        paths = [painting_dir / name for name in new]
+        if executor is None:
+            results = map(_unpickle_painting, paths)
+        else:
+            results = executor.map(_unpickle_painting, paths, chunksize=max(1, len(paths) // (workers * 8)))
+        for name, (start_points, marks, mark_specs) in zip(new, results):
+            png_path = str((painting_dir / name).with_suffix(".png"))
+            batch.append((start_points, marks, mark_specs, png_path, name))
+            yield {"start_points": start_points, "marks": marks, "mark_specs": mark_specs, "png_path": png_path}
+            if len(batch) >= batch_size:
+                flush()
+    if batch:
+        flush()
+
+
+def iter_paintings(painting_dir, workers=None, batch_size=500):
+    """
+    Stream every painting of a split, unpickling only pickles that are new or changed.
+
+    Paintings come from the split's own dataset (see painting_dataset.py) and
+    from a cache of its legacy pickles (data/like.pickles.paintings). A
+    manifest of (mtime, size) per pickle records which cached painting each
+    pickle became. Stored paintings are yielded straight from the
+    memory-mapped datasets; new pickles are then unpickled across a process
+    pool, yielded as they arrive and appended to the cache in batches.
+
+    A pickle rewritten in place replaces its cached painting. A deleted
+    pickle keeps its painting; only its manifest entry is dropped. The split's
+    own dataset is never written.
+
+    Args:
+        painting_dir: directory of the split's pickles (e.g. data/like)
+        workers: processes to unpickle with (defaults to the number of CPUs)
+        batch_size: new paintings appended to the cache (and the manifest saved) at a time
+
+    Yields:
+        Paintings as dicts of start_points, marks, mark_specs and png_path
+    """
+    split, cache, new_paintings = _sync(painting_dir, workers, batch_size)
+    for dataset in (split, cache):
+        for index in range(len(dataset)):
+            yield dataset.painting(index)
+    yield from new_paintings
+
+
+def update_corpus(painting_dir, workers=None):
+    """
+    Bring a split's pickle cache up to date, reading only new or changed pickles.
+
+    Returns:
+        [the split's PaintingDataset, its pickle cache]; colour_stats takes the list as one corpus
+    """
+    split, cache, new_paintings = _sync(painting_dir, workers)
+    for _ in new_paintings:
+        pass
+    return [split, cache]
+
+
+def load_list_of_paintings(painting_dir, workers=None):
+    """Load every painting of a split (cached and new pickles) into a list of dicts."""
+    return list(iter_paintings(painting_dir, workers))
 
 
 def make_a_colour_mark_image(painting_list, savename):
     """Make an image out of colours I liked."""
-    # Make a list of every colour used.
-    colours = []
-    for p in painting_list:
-        marks = p['mark_specs']
-        for m in marks:
-            colours.extend(m[0])
-    # Find the biggest width of a square the image could fill.
-    width = int(np.sqrt(len(colours)/3))
-    print(width)
-    # Make a square image with pixels as the mark colours.
-    img = Image.frombytes('RGB', (width, width), bytes(colours))
+    # One pixel per mark colour, filled a chunk at a time (see colour_stats.swatch_image).
+    img = swatch_image(painting_list)
+    print(img.width)
     img.show()
     img.save(savename)
 
 
+def save_colour_histograms(stats, prefix):
+    """Save the palette and the hue, saturation, value, opacity and pen width histograms as prefix_<name>.png."""
+    palette_image(stats).save(f"{prefix}_palette.png")
+    for feature in ("hue", "saturation", "value", "opacity", "width"):
+        histogram_image(stats, feature).save(f"{prefix}_{feature}.png")
+
+
 if __name__ == '__main__':
 
     # Load data for liked and disliked paintings.
     liked_dir = Path('./data/like')
     disliked_dir = Path('./data/dislike')
-    liked_paintings = load_list_of_paintings(liked_dir)
-    disliked_paintings = load_list_of_paintings(disliked_dir)
-    print(f"loaded {len(liked_paintings)} I liked and {len(disliked_paintings)} I didn't.")
+    liked_paintings = update_corpus(liked_dir)
+    disliked_paintings = update_corpus(disliked_dir)
+    print(f"loaded {sum(map(len, liked_paintings))} I liked and {sum(map(len, disliked_paintings))} I didn't.")
 
     make_a_colour_mark_image(liked_paintings, 'liked.png')
-    make_a_colour_mark_image(disliked_paintings, 'disliked.png')
\ No newline at end of file
+    make_a_colour_mark_image(disliked_paintings, 'disliked.png')
+
+    # Colour histograms of each split, and how they differ.
+    liked_stats = colour_statistics(liked_paintings)
+    disliked_stats = colour_statistics(disliked_paintings)
+    print("liked:", liked_stats.summary())
+    print("disliked:", disliked_stats.summary())
+    differences = compare(liked_stats, disliked_stats)
+    print("how different (total variation):", differences["total_variation"])
+    save_colour_histograms(liked_stats, 'liked')
+    save_colour_histograms(disliked_stats, 'disliked')
@@ -0,0 +1,91 @@
+"""
+Looping gait animations for honses.
+
+Only the legs and tail move, and draw_honse draws them last, so the
+background, body, neck, head and mane are rasterized once into a static layer.
+Each frame is a copy of that layer with the legs and tail drawn on top at
+that frame's angles.
+"""
+
+import random
+import numpy as np
+from draw_honse import build_honse_body, build_honse_limbs
+from rasterizers import get_rasterizer
+
+# Leg angles (front left, front right, back left, back right) the gait cycle
+# passes through. The first keyframe is the still pose, so frame 0 matches
+# the still image of the same honse.
+GAIT_KEYFRAMES = {
+    "standing": [(0, 0, 0, 0)],                           # Legs stay put; only the tail sways
+    "walking": [(15, -15, -15, 15), (-15, 15, 15, -15)],  # Diagonal pairs swap
+    "running": [(30, 30, -30, -30), (-20, -20, 20, 20)],  # Stretch out, then gather
+    "rearing": [(-60, -60, 0, 0), (-40, -75, 0, 0)],      # Pawing with the front legs
+}
+
+# How far the tail swings either side of its angle, in degrees
+TAIL_SWAY = 10
+
+
+def gait_cycle(leg_pose, frames=12):
+    """
+    Interpolate one loop of a gait.
+
+    Args:
+        leg_pose: one of the draw_honse leg poses
+        frames: number of frames in the loop
+
+    Returns:
+        A list of (leg angles, tail angle offset) per frame
+    """
+    keyframes = np.array(GAIT_KEYFRAMES.get(leg_pose, GAIT_KEYFRAMES["standing"]), dtype=np.float64)
+    phase = np.arange(frames) / frames
+
+    # Ease between consecutive keyframes, wrapping around to the first
+    position = phase * len(keyframes)
+    index = np.floor(position).astype(int)
+    ease = ((1 - np.cos(np.pi * (position - index))) / 2)[:, None]
+    angles = keyframes[index] * (1 - ease) + keyframes[(index + 1) % len(keyframes)] * ease
+
+    sway = TAIL_SWAY * np.sin(2 * np.pi * phase)
+    return [(list(leg_angles), offset) for leg_angles, offset in zip(angles.tolist(), sway.tolist())]
+
+
+def render_gait_frames(background, center_x, center_y, params=None, size_factor=1.0, rng=None,
+                       frames=12, rasterizer="pillow"):
+    """
+    Render a looping gait cycle of one honse.
+
+    Args:
+        background: PIL Image to draw on (not modified)
+        center_x: x-coordinate of the horse's center
+        center_y: y-coordinate of the horse's center
+        params: dictionary of parameters to customize the horse appearance
+        size_factor: scaling factor for the horse (1.0 is original size)
+        rng: random.Random used for mane and tail strands (defaults to the random module)
+        frames: number of frames in the loop
+        rasterizer: name of the rasterizer backend
+
+    Returns:
+        (list of RGB PIL Images, dictionary of the parameters used)
+    """
+    rng = rng or random
+    backend = get_rasterizer(rasterizer)
+
+    # Static layer: background, body, neck, head and mane, drawn once
+    static = background.copy()
+    body, params = build_honse_body(center_x, center_y, params, size_factor, rng)
+    backend.render(static, body)
+
+    # Every frame replays the same tail strands
+    tail_state = rng.getstate()
+
+    images = []
+    for leg_angles, tail_offset in gait_cycle(params["leg_pose"], frames):
+        frame = static.copy()
+        tail_rng = random.Random()
+        tail_rng.setstate(tail_state)
+        limbs, _ = build_honse_limbs(center_x, center_y, params, size_factor, tail_rng,
+                                     leg_angles=leg_angles,
+                                     tail_angle=params["tail_angle"] + tail_offset)
+        images.append(backend.render(frame, limbs))
+    return images, params
@@ -15,14 +15,17 @@ Todo:
 - Try it out with different source images, stop when something looks cool enough.
 """
 
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
+from pathlib import Path
 from aggdraw import Draw, Symbol, Pen, Brush
-import sklearn as sk
 from PIL import Image
 import numpy as np
-import random
-import pandas as pd
-from random import random, choice
+from painting_dataset import PaintingDataset, split_path
+import argparse
+import os
+import time
 import pickle
 
 MAXIMUM_STROKE_SIZE = 500
@@ -32,135 +35,205 @@ MAXIMUM_PEN_WIDTH = 10
 N_MARKS = 100
 PEN_BIAS = 0.4
 MIN_OPACITY = 150
+CANVAS_SIZE = (600, 800)
+STROKE_LETTERS = np.array(list("MLHVCSQTZ"))
+# One path command: a letter and two numbers
+STROKE_FORMAT = "%s%.1f %.1f"
 
 
-def add_a_mark_to_the_canvas(canvas, symbol_params, pen, start_point):
+def add_a_mark_to_the_canvas(canvas, symbol_params, pen, start_point, flush=True):
     """Add a symbol to the canvas using a brush or pen."""
     # Turn the parameters into a command.
-    print(symbol_params)
     symbol = Symbol(symbol_params)
     # Apply the symbol to the canvas.
     canvas.symbol(start_point, symbol, pen)
+    if flush:
+        canvas.flush()
+
+
+def paint(start_points, marks, mark_makers, size=CANVAS_SIZE):
+    """Paint every mark onto a new black canvas, flushing to the image once at the end."""
+    image = Image.new("RGB", size)
+    canvas = Draw(image)
+    for start_point, mark, mark_maker in zip(start_points, marks, mark_makers):
+        add_a_mark_to_the_canvas(canvas, mark, mark_maker, start_point, flush=False)
     canvas.flush()
+    return image
 
 
 def gen_sentence_of_strokes(letters, sizes, movements):
-    sentence = []
-    for l, s, m in zip(letters, sizes, movements):
-        sentence.append(f"{l}{s} {m}")
-    sentence = " ".join(sentence)
-    return sentence
-
-
-def get_mark_maker():
-    # Randomly select a brush or pen.
-    use_pen = random() > PEN_BIAS
-    # Generate a random colour.
-    r_colour = lambda : int(random()*255)
-    color = (r_colour(), r_colour(), r_colour())
-    # Generate a random opacity.
-    opacity = int(MIN_OPACITY + random()*(255-MIN_OPACITY))
-    # Generate a random width.
-    width = int(random()*MAXIMUM_PEN_WIDTH)
-    # Create a mark maker
-    if use_pen:
-        mark_spec = (color, width, opacity)
-        return Pen(*mark_spec), mark_spec
-    else:
-        mark_spec = (color, opacity, None)
-        return Brush(*mark_spec[:2]), mark_spec
-
-
-def gen_random_marks():
-    # Generate the symbols that will decorate the canvas (random pen and brushstrokes).
-    gen_stroke_size = lambda : random()*MAXIMUM_STROKE_SIZE
+    """Join path commands (a letter, a size and a movement each) into one path string."""
+    commands = np.empty((len(letters), 3), dtype=object)
+    commands[:, 0] = letters
+    commands[:, 1] = sizes
+    commands[:, 2] = movements
+    # One %-format over the whole path instead of an f-string per command
+    return " ".join([STROKE_FORMAT] * len(letters)) % tuple(commands.ravel().tolist())
+
+
+def gen_random_marks(rng=None):
+    """
+    Generate the symbols that will decorate the canvas (random pen and brushstrokes).
+
+    Every command of every mark is drawn from rng in a few vectorized calls.
+
+    Returns:
+        (list of (x, y) start points, list of path strings)
+    """
+    rng = rng if rng is not None else np.random.default_rng()
 
     # Create all the brushstroke paths; randomly.
-    start_points = []
-    marks = []
-    stroke_lengths = (np.random.random(N_MARKS)*MAXIMUM_STROKE_SIZE).astype(int)
-    for length in stroke_lengths:
-        start_point = ((random()*MAXIMUM_START_POINT,
-                        random()*MAXIMUM_START_POINT))
-        valid_letters = "MLHVCSQTZ"
-        letters = [choice(valid_letters) for x in range(length)]
-        sizes = [gen_stroke_size() for x in range(length)]
-        movements = [gen_stroke_size() for x in range(length)]
-        mark = gen_sentence_of_strokes(letters, sizes, movements)
-        start_points.append(start_point)
-        marks.append(mark)
-    
-    return start_points, marks 
-
-
-def gen_random_mark_makers():
-    # Create all the pens and brushes randomly, and record the variables we used for them.
-    mark_makers = []
-    mark_specs = []
-    for _ in range(N_MARKS):
-        mm, ms = get_mark_maker()
-        mark_makers.append(mm)
-        mark_specs.append(ms)
-    print(mark_makers)
-    return mark_makers, mark_specs
+    stroke_lengths = (rng.random(N_MARKS) * MAXIMUM_STROKE_SIZE).astype(int)
+    start_points = rng.random((N_MARKS, 2)) * MAXIMUM_START_POINT
+    total = stroke_lengths.sum()
+    letters = STROKE_LETTERS[rng.integers(0, len(STROKE_LETTERS), total)]
+    sizes = rng.random(total) * MAXIMUM_STROKE_SIZE
+    movements = rng.random(total) * MAXIMUM_STROKE_SIZE
+
+    # Cut the commands into one path per mark.
+    ends = np.cumsum(stroke_lengths)
+    marks = [gen_sentence_of_strokes(letters[end - length:end], sizes[end - length:end],
+                                     movements[end - length:end])
+             for length, end in zip(stroke_lengths.tolist(), ends.tolist())]
+    return [tuple(point) for point in start_points.tolist()], marks
+
+
+def gen_random_mark_makers(rng=None):
+    """Create all the pens and brushes randomly, and record the variables we used for them."""
+    rng = rng if rng is not None else np.random.default_rng()
+    # Randomly select a brush or pen, with a random colour, opacity and width.
+    use_pen = (rng.random(N_MARKS) > PEN_BIAS).tolist()
+    colours = (rng.random((N_MARKS, 3)) * 255).astype(int).tolist()
+    opacities = (MIN_OPACITY + rng.random(N_MARKS) * (255 - MIN_OPACITY)).astype(int).tolist()
+    widths = (rng.random(N_MARKS) * MAXIMUM_PEN_WIDTH).astype(int).tolist()
+
+    mark_specs = [(tuple(colour), width, opacity) if pen else (tuple(colour), opacity, None)
+                  for pen, colour, opacity, width in zip(use_pen, colours, opacities, widths)]
+    return [mark_maker_from_spec(mark_spec) for mark_spec in mark_specs], mark_specs
+
+
+def mark_maker_from_spec(mark_spec):
+    # Pens are saved as (colour, width, opacity), brushes as (colour, opacity, None).
+    if mark_spec[2]:
+        return Pen(*mark_spec)
+    return Brush(*mark_spec[:2])
+
+
+def paint_random_painting(painting_seed=None):
+    """
+    Paint a random picture.
+
+    Args:
+        painting_seed: seed for every random choice, so the same seed paints the same picture
+
+    Returns:
+        (image, start_points, marks, mark_specs)
+    """
+    rng = np.random.default_rng(painting_seed)
+    start_points, marks = gen_random_marks(rng)
+    mark_makers, mark_specs = gen_random_mark_makers(rng)
+    return paint(start_points, marks, mark_makers), start_points, marks, mark_specs
+
+
+def save_painting(image, start_points, marks, mark_specs, filename, dataset):
+    """Save a painting as filename.png and append instructions to re-create it to a dataset split."""
+    image.save(filename + ".png")
+    dataset.append([(start_points, marks, mark_specs, filename + ".png")])
+
+
+def recreate_painting(dataset, index):
+    """Re-paint painting index of a dataset split from its saved marks."""
+    painting = dataset.painting(index)
+    mark_makers = [mark_maker_from_spec(mark_spec) for mark_spec in painting['mark_specs']]
+    return paint(painting['start_points'], painting['marks'], mark_makers)
 
 
 def load_and_recreate_an_image(filename):
-    # Recreate the image and check it looks the same.
+    # Recreate an image saved with a pickle (before datasets; see painting_dataset.py migrate).
     # Load description.
     df2 = pickle.load(open(filename.replace('.png', '.pickle'), 'rb'))
-    # Set up a blank canvas.
-
-    image = Image.fromarray(np.zeros((800, 600, 3)), mode="RGB")
-    canvas = Draw(image)
 
-    # Re-create the markmaker for the mark, then apply saved params.
+    # Re-create the markmaker for each mark, then paint them all with the saved params.
     start_points = df2['start_points'].values
     marks = df2['marks'].values
-    mark_specs = df2['mark_specs'].values
-
-    for start_point, mark, mark_spec in zip(start_points, marks, mark_specs):
-        # Re-create a pen or a brush.
-        if mark_spec[2]:
-            mark_maker = Pen(*mark_spec)
+    mark_makers = [mark_maker_from_spec(mark_spec) for mark_spec in df2['mark_specs'].values]
+    return paint(start_points, marks, mark_makers)
+
+
+def _paint_and_save(job):
+    # Top-level so the process pool can pickle it. The worker saves the PNG;
+    # the marks go back to the parent, the only process appending to the dataset.
+    painting_seed, out_dir = job
+    png_path = str(Path(out_dir) / f"art_{painting_seed}.png")
+    image, start_points, marks, mark_specs = paint_random_painting(painting_seed)
+    image.save(png_path)
+    return start_points, marks, mark_specs, png_path
+
+
+def generate_paintings(count, out_dir, workers=None, first_seed=0, batch_size=100):
+    """
+    Paint count random pictures headlessly across a process pool.
+
+    Painting i uses seed first_seed + i and is saved as out_dir/art_<seed>.png,
+    so a run can be repeated or extended with a new first_seed. The marks are
+    appended to the out_dir.paintings dataset in batches.
+
+    Returns:
+        The PaintingDataset the paintings were added to
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    dataset = PaintingDataset(split_path(out_dir))
+    jobs = [(first_seed + i, out_dir) for i in range(count)]
+    workers = workers or os.cpu_count() or 1
+
+    batch = []
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as executor:
+        if executor is None:
+            results = map(_paint_and_save, jobs)
         else:
-            mark_maker = Brush(*mark_spec[:2])
-        # Re-create the symbol
-        add_a_mark_to_the_canvas(canvas, mark, mark_maker, start_point)
-
+            results = executor.map(_paint_and_save, jobs, chunksize=max(1, count // (workers * 8)))
+        for painting in results:
+            batch.append(painting)
+            if len(batch) >= batch_size:
+                dataset.append(batch)
+                batch = []
+    dataset.append(batch)
+    return dataset
 
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Paint random pictures and sort them by taste.")
+    parser.add_argument("--count", type=int,
+                        help="paint this many pictures without showing them or asking about them")
+    parser.add_argument("--out", default="data/generated", help="directory for --count paintings")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes to paint with")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first --count painting")
+    args = parser.parse_args()
+
+    # Headless: paint a whole corpus at once.
+    if args.count:
+        start = time.perf_counter()
+        dataset = generate_paintings(args.count, args.out, args.workers, args.seed)
+        elapsed = time.perf_counter() - start
+        print(f"Painted {args.count} pictures into {args.out} in {elapsed:.1f}s "
+              f"({args.count / elapsed:.1f} per second); {dataset.path} holds {len(dataset)}")
+        raise SystemExit
+
     # Keep asking the user about paintings until they quit.
     while True:
 
-        # Set up a canvas to paint on.
-        image = Image.fromarray(np.zeros((800, 600, 3)), mode="RGB")
-        canvas = Draw(image)
-
         # Add Symbols with Pens and Brushes; paint that picture!
-        start_points, marks = gen_random_marks()
-        mark_makers, mark_specs = gen_random_mark_makers()
-        for start_point, mark, mark_maker in zip(start_points, marks, mark_makers):
-            add_a_mark_to_the_canvas(canvas, mark, mark_maker, start_point)
-        
+        image, start_points, marks, mark_specs = paint_random_painting()
+
         # Prompt the user, save into a the like or dislike folder based on critique.
         image.show()
         response = input("Do you like it? (y/n)")
         save_dir = {'y':'like', 'n':'dislike'}[response]
 
-        # Save the image.
+        # Save the image, and instructions for how to re-create it in the split's dataset.
         now = datetime.now()
         filename = f"data/{save_dir}/art_{now.strftime('%Y_%m_%d_%H_%M_%S')}"
-        image.save(filename + ".png")
-        image.close()
-
-        # Save instructions for how to re-create the image in a DataFrame.
-        df = pd.DataFrame()
-        df['start_points'] = start_points
-        df['marks'] = marks
-        df['mark_specs'] = mark_specs
-
-        # Save it.
-        df.to_pickle(filename + '.pickle')
\ No newline at end of file
+        save_painting(image, start_points, marks, mark_specs, filename,
+                      PaintingDataset(split_path(f"data/{save_dir}")))
+        image.close()
\ No newline at end of file
@@ -0,0 +1,245 @@
+"""
+Indexed storage for generated artifacts (images and their params).
+
+Artifacts get content-hash IDs, so identical renders share one file and IDs
+never collide. Files live in sharded subdirectories (static/images/ab/cd/...)
+and are tracked in a local SQLite index. A byte quota is enforced by evicting
+the least recently used artifacts, so disk usage and directory sizes stay
+bounded however long the app runs.
+"""
+
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    filename     TEXT PRIMARY KEY,
+    kind         TEXT NOT NULL,
+    artifact_id  TEXT NOT NULL,
+    path         TEXT NOT NULL,
+    size         INTEGER NOT NULL,
+    created_at   REAL NOT NULL,
+    last_access  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_last_access ON artifacts (last_access);
+CREATE INDEX IF NOT EXISTS artifacts_artifact_id ON artifacts (artifact_id);
+
+-- Running total of artifact sizes, kept by triggers so the quota check
+-- doesn't scan the table (and stays right with several worker processes)
+CREATE TABLE IF NOT EXISTS artifact_totals (
+    id     INTEGER PRIMARY KEY CHECK (id = 0),
+    bytes  INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO artifact_totals SELECT 0, COALESCE(SUM(size), 0) FROM artifacts;
+CREATE TRIGGER IF NOT EXISTS artifacts_add_bytes AFTER INSERT ON artifacts
+BEGIN
+    UPDATE artifact_totals SET bytes = bytes + NEW.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS artifacts_remove_bytes AFTER DELETE ON artifacts
+BEGIN
+    UPDATE artifact_totals SET bytes = bytes - OLD.size WHERE id = 0;
+END;
+"""
+
+
+def content_id(data, length=16):
+    """Return a content-hash ID for data (the first length hex digits of its SHA-256)."""
+    return hashlib.sha256(data).hexdigest()[:length]
+
+
+class ArtifactStore:
+    """Content-addressed, sharded, size-bounded storage with a SQLite index."""
+
+    def __init__(self, root, db_path, writer, max_bytes=1024 * 1024 * 1024, shard_depth=2, write_wait=2.0):
+        """
+        Args:
+            root: directory artifacts are stored under
+            db_path: path of the SQLite index
+            writer: WriteBehindWriter that performs the actual writes and deletes
+            max_bytes: byte quota; least recently used artifacts are evicted above it
+            shard_depth: number of two-character subdirectory levels
+            write_wait: longest to wait, in seconds, for a file another process is still writing
+        """
+        self.root = root
+        self.db_path = db_path
+        self.writer = writer
+        self.max_bytes = max_bytes
+        self.shard_depth = shard_depth
+        self.write_wait = write_wait
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.dedup_hits = 0
+
+    def _db(self):
+        # One connection per process; SQLite connections must not cross a fork
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+
+    def shard_path(self, artifact_id, filename):
+        """Return the on-disk path for a file belonging to artifact_id."""
+        shards = [artifact_id[i * 2:i * 2 + 2] for i in range(self.shard_depth)]
+        return os.path.join(self.root, *shards, filename)
+
+    def put(self, kind, data, ext, artifact_id=None, variant=None):
+        """
+        Store data as an artifact, deduplicating identical content.
+
+        Args:
+            kind: artifact kind, used as the filename prefix (e.g. "honse", "herd")
+            data: bytes to store
+            ext: file extension without the dot
+            artifact_id: ID to store under (defaults to the content hash of data);
+                pass the image's ID to keep its params next to it
+            variant: optional suffix for extra files of the same artifact
+                (e.g. "thumbnail"); they are evicted together with it
+
+        Returns:
+            (artifact_id, filename)
+        """
+        artifact_id = artifact_id or content_id(data)
+        suffix = f"_{variant}" if variant else ""
+        filename = f"{kind}_{artifact_id}{suffix}.{ext}"
+        path = self.shard_path(artifact_id, filename)
+        now = time.time()
+
+        with self._lock:
+            db = self._db()
+            with db:
+                updated = db.execute(
+                    "UPDATE artifacts SET last_access = ? WHERE filename = ?", (now, filename)
+                ).rowcount
+                if updated:
+                    self.dedup_hits += 1
+                else:
+                    db.execute(
+                        "INSERT INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (filename, kind, artifact_id, path, len(data), now, now),
+                    )
+        if updated:
+            return artifact_id, filename
+
+        # Outside the lock: submit blocks while the writer is backed up
+        try:
+            self.writer.submit(path, data, on_error=self._forget)
+        except Exception:
+            # Don't leave an index entry for a file that will never exist
+            self._forget(path)
+            raise
+        with self._lock:
+            self._enforce_quota(keep=artifact_id)
+        return artifact_id, filename
+
+    def _forget(self, path):
+        # Drop the row of a file whose write failed, so the next put of the same
+        # content writes it again instead of counting a dedup hit
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute("DELETE FROM artifacts WHERE filename = ?", (os.path.basename(path),))
+
+    def lookup(self, filename):
+        """Return the path of a stored file (marking it recently used), or None."""
+        with self._lock:
+            db = self._db()
+            with db:
+                row = db.execute("SELECT path FROM artifacts WHERE filename = ?", (filename,)).fetchone()
+                if row is not None:
+                    db.execute("UPDATE artifacts SET last_access = ? WHERE filename = ?",
+                               (time.time(), filename))
+        return row[0] if row else None
+
+    def read(self, filename):
+        """Return the contents of a stored file (even if its write is in flight), or None."""
+        path = self.lookup(filename)
+        if path is None:
+            return None
+        data = self.pending(path)
+        if data is not None:
+            return data
+        if not self.wait_for_file(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def pending(self, path):
+        """Return the bytes of path if its write is still in flight, else None."""
+        return self.writer.pending(path)
+
+    def wait_for_file(self, path, interval=0.01):
+        """
+        Wait up to write_wait seconds for path to be on disk; returns whether it is.
+
+        The index is shared by every worker process but each one writes behind
+        its own queue, so a file saved by another worker can be indexed a
+        little before it lands. Files are renamed into place, so once path
+        exists it is complete.
+        """
+        deadline = time.monotonic() + self.write_wait
+        while not os.path.isfile(path):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+        return True
+
+    def total_bytes(self):
+        """Return the total size of all stored artifacts."""
+        with self._lock:
+            return self._total_bytes(self._db())
+
+    @staticmethod
+    def _total_bytes(db):
+        return db.execute("SELECT bytes FROM artifact_totals WHERE id = 0").fetchone()[0]
+
+    def _enforce_quota(self, keep=None):
+        # Called with the lock held. Whole artifacts (image and params) go together.
+        db = self._db()
+        total = self._total_bytes(db)
+        while total > self.max_bytes:
+            row = db.execute(
+                "SELECT artifact_id FROM artifacts WHERE artifact_id != ? "
+                "GROUP BY artifact_id ORDER BY MAX(last_access) LIMIT 1",
+                (keep or "",),
+            ).fetchone()
+            if row is None:
+                break
+            files = db.execute("SELECT filename, path, size FROM artifacts WHERE artifact_id = ?", row).fetchall()
+            for filename, path, size in files:
+                # The delete is queued before the row's removal commits, so a file is
+                # never left on disk without a row (which the quota could never reclaim)
+                try:
+                    with db:
+                        db.execute("DELETE FROM artifacts WHERE filename = ?", (filename,))
+                        self.writer.delete(path, timeout=0)
+                except queue.Full:
+                    # The writer is backed up; what's left is evicted on a later put
+                    return
+                total -= size
+            self.evictions += 1
+
+    def stats(self):
+        """Return counts, total bytes and eviction/dedup counters."""
+        with self._lock:
+            db = self._db()
+            count = db.execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+            total = self._total_bytes(db)
+        return {
+            "files": count,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "dedup_hits": self.dedup_hits,
+        }
@@ -0,0 +1,269 @@
+"""
+Backgrounds for honse scenes.
+
+The sky gradient is built with NumPy in one go, and a seeded library of
+prebuilt backgrounds is kept in memory so a request only has to copy a ready
+canvas before drawing honses on top of it.
+"""
+
+from collections import OrderedDict
+from PIL import Image, ImageDraw
+import numpy as np
+import random
+import threading
+from display_list import DisplayList
+
+# Scene colours
+SKY_COLOR = (135, 206, 235)          # Sky blue
+SKY_BOTTOM_COLOR = (100, 150, 200)   # Darker blue at the bottom of the gradient
+GRASS_COLOR = (34, 139, 34)          # Forest green
+
+# Fraction of the canvas height where the grass starts
+HORIZON = 0.7
+
+# Most libraries kept by get_library, and the most bytes of backgrounds they may hold
+MAX_LIBRARIES = 8
+MAX_LIBRARY_BYTES = 256 * 1024 * 1024
+
+
+def sky_gradient(width, height, y0=0, y1=None):
+    """
+    Build a vertical sky gradient as an RGB array.
+
+    Args:
+        width: width of the canvas (or tile) in pixels
+        height: height of the canvas in pixels
+        y0, y1: only build rows y0 <= y < y1 (by default the whole canvas)
+
+    Returns:
+        A (y1 - y0, width, 3) uint8 array going from light to darker blue
+    """
+    y1 = height if y1 is None else y1
+    t = np.arange(y0, y1, dtype=np.float64)[:, None] / height
+    top = np.array(SKY_COLOR, dtype=np.float64)
+    bottom = np.array(SKY_BOTTOM_COLOR, dtype=np.float64)
+    # Truncate like int() does so the colours match the old per-line drawing
+    row_colors = (top * (1 - t) + bottom * t).astype(np.uint8)
+    return np.ascontiguousarray(np.broadcast_to(row_colors[:, None, :], (y1 - y0, width, 3)))
+
+
+def generate_hill_specs(width, rng=None, count=3):
+    """Pick the position, size and colour of the background hills."""
+    rng = rng or random
+    hills = []
+    for _ in range(count):
+        hills.append({
+            "height": rng.uniform(0.2, 0.4),
+            "width": rng.uniform(0.5, 1.5),
+            "x": rng.uniform(-0.3, 0.7) * width,
+            "color": (
+                rng.randint(30, 100),
+                rng.randint(100, 160),
+                rng.randint(30, 80)
+            ),
+        })
+    return hills
+
+
+def hill_polygon(hill, width, height, x0=0, x1=None):
+    """
+    Turn a hill spec into polygon points (a parabolic curve closed at the bottom).
+
+    x0 and x1 limit the curve to the columns x0 <= x < x1 (e.g. one tile);
+    by default it spans the whole canvas.
+    """
+    x1 = width if x1 is None else x1
+    xs = np.arange(x0, x1, dtype=np.float64)
+    dx = (xs - hill["x"]) / (width * hill["width"])
+    ys = height * (HORIZON - hill["height"] * (1 - dx * dx))
+    visible = ys < height
+    points = list(zip(xs[visible].tolist(), ys[visible].tolist()))
+    if points:
+        points.append((x1, height))
+        points.append((x0, height))
+    return points
+
+
+def generate_grass_tufts(width, height, rng=None, count=100):
+    """Pick the position, height and colour of the grass tufts."""
+    rng = rng or random
+    tufts = []
+    for _ in range(count):
+        x = rng.randint(0, width)
+        y = rng.randint(int(height * HORIZON), height)
+        grass_height = rng.randint(5, 15)
+        grass_color = (
+            rng.randint(30, 100),
+            rng.randint(120, 180),
+            rng.randint(30, 80)
+        )
+        tufts.append((x, y, grass_height, grass_color))
+    return tufts
+
+
+def field_display_list(width, height):
+    """Return the plain sky and grass background as a display list."""
+    display_list = DisplayList()
+    display_list.rectangle([(0, 0), (width, height)], fill=SKY_COLOR)
+    display_list.rectangle([(0, height * HORIZON), (width, height)], fill=GRASS_COLOR)
+    return display_list
+
+
+def render_field_background(width, height):
+    """Render the plain sky and grass background used for single honses."""
+    image = Image.new('RGB', (width, height), color=SKY_COLOR)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([(0, height * HORIZON), (width, height)], fill=GRASS_COLOR)
+    return image
+
+
+def herd_background_spec(width, height, rng=None, tufts=100):
+    """Pick the random parts of a herd background: its hills and grass tufts."""
+    return {
+        "hills": generate_hill_specs(width, rng),
+        "tufts": generate_grass_tufts(width, height, rng, count=tufts),
+    }
+
+
+def scale_herd_background_spec(spec, factor):
+    """Scale a herd_background_spec picked for one canvas size to a canvas factor times as wide."""
+    hills = [dict(hill, x=hill["x"] * factor) for hill in spec["hills"]]
+    tufts = [(x * factor, y * factor, grass_height * factor, grass_color)
+             for x, y, grass_height, grass_color in spec["tufts"]]
+    return {"hills": hills, "tufts": tufts}
+
+
+def render_herd_background(width, height, rng=None, spec=None):
+    """
+    Render the herd background: sky gradient, hills, grass and grass tufts.
+
+    Args:
+        width: width of the canvas in pixels
+        height: height of the canvas in pixels
+        rng: random.Random instance (or the random module) to place hills and tufts
+        spec: a herd_background_spec to draw instead of picking a new one
+
+    Returns:
+        A new RGB PIL Image
+    """
+    spec = spec or herd_background_spec(width, height, rng)
+    image = Image.fromarray(sky_gradient(width, height), 'RGB')
+    draw = ImageDraw.Draw(image)
+
+    # Draw hills in the background
+    for hill in spec["hills"]:
+        points = hill_polygon(hill, width, height)
+        if points:
+            draw.polygon(points, fill=hill["color"])
+
+    # Draw grass in the foreground
+    draw.rectangle([(0, height * HORIZON), (width, height)], fill=GRASS_COLOR)
+
+    # Draw some random grass tufts
+    for x, y, grass_height, grass_color in spec["tufts"]:
+        draw.line([(x, y), (x, y - grass_height)], fill=grass_color, width=2)
+
+    return image
+
+
+class BackgroundLibrary:
+    """
+    A seeded, in-memory set of prebuilt backgrounds of one size.
+
+    Each background is built on first use; get() returns a copy so
+    callers can draw on it without touching the library.
+
+    The random layout of each background is picked for reference_size
+    (by default the library's own size) and scaled to the library's size,
+    so libraries of the same scene at different resolutions match.
+    """
+
+    def __init__(self, width, height, size=16, seed=0, kind="herd", reference_size=None):
+        self.width = width
+        self.height = height
+        self.size = max(1, size)
+        self.seed = seed
+        self.kind = kind
+        self.reference_size = reference_size or (width, height)
+        self._backgrounds = {}
+        self._lock = threading.Lock()
+
+    def spec(self, index):
+        """Return the herd_background_spec of background index (None for field backgrounds)."""
+        if self.kind == "field":
+            return None
+        ref_width, ref_height = self.reference_size
+        rng = random.Random(f"{self.seed}:{ref_width}x{ref_height}:{index}")
+        spec = herd_background_spec(ref_width, ref_height, rng)
+        if (ref_width, ref_height) != (self.width, self.height):
+            spec = scale_herd_background_spec(spec, self.width / ref_width)
+        return spec
+
+    def _build_one(self, index):
+        if self.kind == "field":
+            return render_field_background(self.width, self.height)
+        return render_herd_background(self.width, self.height, spec=self.spec(index))
+
+    def background(self, index):
+        """Return background index, building it if needed (callers must not draw on it)."""
+        with self._lock:
+            background = self._backgrounds.get(index)
+            if background is None:
+                background = self._backgrounds[index] = self._build_one(index)
+        return background
+
+    def build(self):
+        """Build every background in the library (e.g. to warm up before serving)."""
+        for index in range(len(self)):
+            self.background(index)
+        return self
+
+    @property
+    def nbytes(self):
+        """Bytes of pixels held by the backgrounds built so far."""
+        return len(self._backgrounds) * self.width * self.height * 3
+
+    def __len__(self):
+        return 1 if self.kind == "field" else self.size
+
+    def pick_index(self, rng=None):
+        """Pick which background to use with rng."""
+        rng = rng or random
+        return rng.randrange(len(self)) if len(self) > 1 else 0
+
+    def copy(self, index):
+        """Return a copy of background index."""
+        return self.background(index).copy()
+
+    def get(self, rng=None):
+        """Return a copy of one background from the library, picked with rng."""
+        return self.copy(self.pick_index(rng))
+
+
+# Least recently used first
+_libraries = OrderedDict()
+_libraries_lock = threading.Lock()
+
+
+def get_library(width, height, kind="herd", size=16, seed=0, reference_size=None,
+                max_libraries=MAX_LIBRARIES, max_bytes=MAX_LIBRARY_BYTES):
+    """
+    Return the shared library for a canvas size and kind, creating it if needed.
+
+    The least recently used libraries are dropped once there are more than
+    max_libraries, or their backgrounds hold more than max_bytes.
+    """
+    reference_size = tuple(reference_size or (width, height))
+    key = (kind, width, height, size, seed, reference_size)
+    with _libraries_lock:
+        library = _libraries.get(key)
+        if library is None:
+            library = BackgroundLibrary(width, height, size=size, seed=seed, kind=kind,
+                                        reference_size=reference_size)
+            _libraries[key] = library
+        _libraries.move_to_end(key)
+        # Never drop the library being returned
+        while len(_libraries) > 1 and (len(_libraries) > max_libraries or
+                                       sum(lib.nbytes for lib in _libraries.values()) > max_bytes):
+            _libraries.popitem(last=False)
+    return library
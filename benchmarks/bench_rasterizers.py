@@ -0,0 +1,78 @@
+"""
+Compare the rasterizer backends on the same display lists.
+
+Times Pillow, aggdraw and 4x supersampled Pillow on single honses and on
+herds, rasterization only (geometry and backgrounds are prepared up front).
+
+Usage:
+    python benchmarks/bench_rasterizers.py [--honses 50] [--herd-size 10] [--repeat 5]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backgrounds import render_field_background, render_herd_background
+from draw_honse import build_honse_display_list, generate_random_honse_params
+from herd_geometry import honse_params_array, build_herd_display_list
+from rasterizers import RASTERIZERS, get_rasterizer
+
+
+def make_scenes(num_honses, herd_size, seed):
+    """Build the display lists and backgrounds every backend will draw."""
+    rng = random.Random(seed)
+    singles = []
+    for _ in range(num_honses):
+        display_list, _ = build_honse_display_list(400, 420, generate_random_honse_params(rng), 1.0, rng)
+        singles.append(display_list)
+
+    herds = []
+    for _ in range(max(1, num_honses // herd_size)):
+        sizes = [rng.uniform(0.3, 1.0) for _ in range(herd_size)]
+        xs = [rng.uniform(120, 1080) for _ in range(herd_size)]
+        ys = [800 * (0.7 - 0.1 * (1 - size)) for size in sizes]
+        params = [generate_random_honse_params(rng) for _ in range(herd_size)]
+        herds.append(build_herd_display_list(honse_params_array(params, xs, ys, sizes), rng))
+
+    return (render_field_background(800, 600), singles), (render_herd_background(1200, 800, rng), herds)
+
+
+def time_backend(rasterizer, background, display_lists, repeat):
+    """Return the best mean time per image (in ms) over repeat runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for display_list in display_lists:
+            rasterizer.render(background.copy(), display_list)
+        best = min(best, (time.perf_counter() - start) / len(display_lists))
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--honses", type=int, default=50, help="number of single honses")
+    parser.add_argument("--herd-size", type=int, default=10, help="honses per herd")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per backend (best is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    (field, singles), (herd_background, herds) = make_scenes(args.honses, args.herd_size, args.seed)
+
+    print(f"{'backend':<22}{'single ms':>12}{'herd ms':>12}")
+    for name in RASTERIZERS:
+        try:
+            rasterizer = get_rasterizer(name)
+        except RuntimeError as error:
+            print(f"{name:<22}{'skipped':>12}  ({error})")
+            continue
+        single_ms = time_backend(rasterizer, field, singles, args.repeat)
+        herd_ms = time_backend(rasterizer, herd_background, herds, args.repeat)
+        print(f"{name:<22}{single_ms:>12.2f}{herd_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
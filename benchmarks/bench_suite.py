@@ -0,0 +1,234 @@
+"""
+Microbenchmarks for drawing, backgrounds, encoding and the Flask routes.
+
+Cases:
+    draw_honse/<mane>-<tail>-<eye>-<pose>   every style combination (geometry + rasterization)
+    background/...                           sky gradient, field and herd backgrounds
+    encode/...                               PNG, WebP and JPEG encoding of a herd image
+    route/...                                each route through the Flask test client
+
+Each case is run in a loop for at least --min-time seconds, --repeat times,
+and the best time per call is kept. Results can be saved as a baseline and
+later runs compared against it; the run fails (exit status 1) when any case
+is slower than baseline x --threshold. Baselines are machine-specific.
+
+Usage:
+    python benchmarks/bench_suite.py [--filter draw_honse/braided] [--save-baseline]
+    python benchmarks/bench_suite.py --compare [--threshold 1.25]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from PIL import ImageDraw
+
+from backgrounds import sky_gradient, render_field_background, render_herd_background, BackgroundLibrary
+from draw_honse import draw_honse, merge_default_params
+from encoding import encode_image
+from herd_geometry import LEG_POSES, MANE_STYLES, TAIL_STYLES, EYE_STYLES
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+def honse_cases():
+    """draw_honse on the field background for every style combination."""
+    field = render_field_background(800, 600)
+    cases = []
+    for mane, tail, eye, pose in itertools.product(MANE_STYLES, TAIL_STYLES, EYE_STYLES, LEG_POSES):
+        params = merge_default_params({"mane_style": mane, "tail_style": tail,
+                                       "eye_style": eye, "leg_pose": pose})
+
+        def run(params=params):
+            image = field.copy()
+            draw_honse(ImageDraw.Draw(image), 400, 420, dict(params), 1.0, random.Random(0))
+
+        cases.append((f"draw_honse/{mane}-{tail}-{eye}-{pose}", run))
+    return cases
+
+
+def background_cases():
+    """Background building blocks and the prebuilt library."""
+    library = BackgroundLibrary(1200, 800, size=4).build()
+    rng = random.Random(0)
+    return [
+        ("background/sky_gradient", lambda: sky_gradient(1200, 800)),
+        ("background/field", lambda: render_field_background(800, 600)),
+        ("background/herd", lambda: render_herd_background(1200, 800, random.Random(0))),
+        ("background/library_copy", lambda: library.get(rng)),
+    ]
+
+
+def encoding_cases():
+    """Encoding a herd-sized image in each output format."""
+    image = render_herd_background(1200, 800, random.Random(0))
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(0)
+    for i in range(5):
+        draw_honse(draw, 200 + i * 200, 540, None, 0.6, rng)
+    return [(f"encode/{fmt}", lambda fmt=fmt: encode_image(image, fmt)) for fmt in ("png", "webp", "jpeg")]
+
+
+def route_cases():
+    """
+    Every route through the Flask test client, streamed bodies read to the end.
+
+    The app runs in a temporary directory so generated artifacts don't land
+    in the repository. Seeds change on every call so renders are not served
+    from the render cache, except for the explicitly cached cases.
+    """
+    workdir = tempfile.mkdtemp(prefix="honse-bench-")
+    os.environ.setdefault("HONSE_STORE_DB", os.path.join(workdir, "artifacts.sqlite3"))
+    os.chdir(workdir)
+    from main import app
+
+    client = app.test_client()
+    seeds = itertools.count(1)
+
+    def check(response, url):
+        # Read the whole body, so streamed responses (posters, multipart batches) are rendered too
+        response.get_data()
+        response.close()
+        assert response.status_code == 200, (url, response.status_code)
+
+    def post(path, body, fresh=True):
+        def run():
+            check(client.post(path, json=dict(body, seed=next(seeds) if fresh else 0)), path)
+        return run
+
+    def get(path, fresh=True):
+        def run():
+            url = path.format(seed=next(seeds) if fresh else 0)
+            check(client.get(url), url)
+        return run
+
+    # A saved image for the file-serving routes
+    response = client.post("/generate_random", json={"seed": 0})
+    assert response.status_code == 200, ("/generate_random", response.status_code)
+    filename = response.get_json()["filename"]
+
+    poster = "width=1536&height=1024&num_honses=20"
+    return [
+        ("route/index", get("/", fresh=False)),
+        ("route/generate_random", post("/generate_random", {})),
+        ("route/generate_random_binary", post("/generate_random", {"response": "binary"})),
+        ("route/customize_honse", post("/customize_honse", {"params": {}})),
+        ("route/customize_honse_cached", post("/customize_honse", {"params": {}}, fresh=False)),
+        ("route/honse_geometry", post("/honse_geometry", {"params": {}})),
+        ("route/animate_honse", post("/animate_honse", {})),
+        ("route/generate_herd", post("/generate_herd", {"num_honses": 10})),
+        ("route/generate_batch_zip", post("/generate_batch", {"num_honses": 8})),
+        ("route/generate_batch_multipart", post("/generate_batch", {"num_honses": 8, "container": "multipart"})),
+        ("route/honse_png", get("/honse/{seed}.png")),
+        ("route/honse_png_cached", get("/honse/{seed}.png", fresh=False)),
+        ("route/honse_svg", get("/honse/{seed}.svg")),
+        ("route/honse_thumbnail", get("/honse/{seed}.png?size=thumbnail")),
+        ("route/herd_png", get("/herd/{seed}.png?num_honses=10")),
+        ("route/gait_gif", get("/honse/{seed}/gait.gif")),
+        ("route/poster_png", get(f"/poster/{{seed}}.png?{poster}")),
+        ("route/poster_tile", get(f"/poster/{{seed}}/tiles/0/0.png?{poster}")),
+        ("route/poster_tile_cached_poster", get(f"/poster/{{seed}}/tiles/1/1.png?{poster}", fresh=False)),
+        ("route/images", get(f"/images/{filename}", fresh=False)),
+        ("route/images_thumbnail", get(f"/images/{filename}?size=thumbnail", fresh=False)),
+        ("route/download", get(f"/download/{filename}", fresh=False)),
+        ("route/render_cache_stats", get("/render_cache/stats", fresh=False)),
+    ]
+
+
+CASE_GROUPS = [honse_cases, background_cases, encoding_cases, route_cases]
+
+
+def measure(run, repeat, min_time):
+    """Return the best time per call in ms: loop until min_time has passed, repeat times."""
+    run()  # Warm up (imports, caches, libraries)
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best * 1000
+
+
+def compare(results, baseline, threshold, min_delta):
+    """Return the names of cases slower than baseline * threshold (and by more than min_delta ms)."""
+    regressions = []
+    for name, ms in results.items():
+        base = baseline.get(name)
+        if base is not None and ms > base * threshold and ms - base > min_delta:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case (best is kept)")
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per timed run")
+    parser.add_argument("--save-baseline", nargs="?", const=str(DEFAULT_BASELINE), metavar="PATH",
+                        help=f"write the results as a baseline (default {DEFAULT_BASELINE.name})")
+    parser.add_argument("--compare", nargs="?", const=str(DEFAULT_BASELINE), metavar="PATH",
+                        help="compare against a baseline and fail on regressions")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="fail when a case takes more than baseline x this")
+    parser.add_argument("--min-delta", type=float, default=0.05,
+                        help="ignore slowdowns smaller than this many ms (timer noise)")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    print(f"{'case':<52}{'ms':>10}{'baseline':>10}{'ratio':>8}")
+    for group in CASE_GROUPS:
+        cases = [(name, run) for name, run in group() if args.filter in name] if args.filter else group()
+        for name, run in cases:
+            ms = results[name] = measure(run, args.repeat, args.min_time)
+            base = baseline.get(name)
+            if base is None:
+                print(f"{name:<52}{ms:>10.3f}")
+            else:
+                flag = "  SLOWER" if name in compare({name: ms}, baseline, args.threshold, args.min_delta) else ""
+                print(f"{name:<52}{ms:>10.3f}{base:>10.3f}{ms / base:>8.2f}{flag}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.platform(),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.compare:
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        if regressions:
+            print(f"{len(regressions)} case(s) slower than baseline x {args.threshold}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"No case slower than baseline x {args.threshold}")
+
+
+if __name__ == "__main__":
+    main()
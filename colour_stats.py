@@ -0,0 +1,326 @@
+"""
+Colour statistics over the mark specs of a corpus, in bounded memory.
+
+Marks are read in chunks of specs rows (r, g, b, is_pen, pen width, opacity;
+see painting_dataset.py) and folded into fixed-size histograms with
+np.bincount, so a corpus of any size costs one chunk of memory plus the
+histograms. A PaintingDataset (or a list of them, read as one corpus) is read
+straight from its memory-mapped specs column; lists or generators of paintings (dicts or pickled DataFrames with a
+mark_specs column) are encoded a chunk at a time.
+
+Usage:
+    liked = colour_statistics(update_corpus("data/like"))   # see analyse_art.py
+    disliked = colour_statistics(update_corpus("data/dislike"))
+    differences = compare(liked, disliked)
+    histogram_image(liked, "hue").save("liked_hues.png")
+"""
+
+from colorsys import hsv_to_rgb
+import numpy as np
+from PIL import Image
+from painting_dataset import PaintingDataset, encode_mark_spec
+
+# Marks folded into the histograms at a time (6 bytes of specs each)
+CHUNK_MARKS = 1 << 20
+RGB_BINS = 16
+HUE_BINS = 36
+SV_BINS = 16
+# Features with one histogram each, as returned by ColourStats.distributions()
+FEATURES = ("channels", "rgb", "hue", "saturation", "value", "opacity", "width")
+
+
+def _datasets(source):
+    # A PaintingDataset or a list of them as a list, or None for an iterable of paintings
+    if isinstance(source, PaintingDataset):
+        return [source]
+    if isinstance(source, (list, tuple)) and source and all(isinstance(s, PaintingDataset) for s in source):
+        return list(source)
+    return None
+
+
+def iter_spec_chunks(source, chunk_marks=CHUNK_MARKS):
+    """
+    Yield the mark specs of a corpus as uint8 arrays of at most chunk_marks rows.
+
+    Args:
+        source: a PaintingDataset (or a list of them), or an iterable of paintings with a mark_specs column
+        chunk_marks: most marks per chunk
+    """
+    datasets = _datasets(source)
+    if datasets is not None:
+        for dataset in datasets:
+            specs = dataset.specs
+            for start in range(0, len(specs), chunk_marks):
+                # Copy the slice so only this chunk's pages are held
+                yield np.array(specs[start:start + chunk_marks])
+        return
+
+    pending = []
+    pending_marks = 0
+    for painting in source:
+        rows = np.array([encode_mark_spec(mark_spec) for mark_spec in painting["mark_specs"]],
+                        dtype=np.uint8).reshape(-1, 6)
+        pending.append(rows)
+        pending_marks += len(rows)
+        if pending_marks >= chunk_marks:
+            yield np.concatenate(pending)
+            pending = []
+            pending_marks = 0
+    if pending:
+        yield np.concatenate(pending)
+
+
+def rgb_to_hsv(rgb):
+    """
+    Convert colours to HSV, like colorsys.rgb_to_hsv but for a whole array.
+
+    Args:
+        rgb: (n, 3) array of 0-255 colours
+
+    Returns:
+        (n, 3) float32 array of hue, saturation and value, each in [0, 1]
+    """
+    rgb = np.asarray(rgb, dtype=np.float32) / 255
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    maxc = rgb.max(axis=1)
+    delta = maxc - rgb.min(axis=1)
+    grey = delta == 0
+    saturation = np.divide(delta, maxc, out=np.zeros_like(maxc), where=maxc > 0)
+
+    # Distance of each channel from the brightest one, as a fraction of the spread
+    spread = np.where(grey, 1, delta)
+    rc, gc, bc = (maxc - r) / spread, (maxc - g) / spread, (maxc - b) / spread
+    hue = np.select([r == maxc, g == maxc], [bc - gc, 2 + rc - bc], 4 + gc - rc)
+    hue = np.where(grey, 0, (hue / 6) % 1)
+    return np.stack([hue, saturation, maxc], axis=1)
+
+
+def _bin(values, bins):
+    # Map [0, 1] floats to bin indices, with 1.0 in the last bin
+    return np.minimum((values * bins).astype(np.intp), bins - 1)
+
+
+class ColourStats:
+    """Histograms of mark colours, opacities and pen widths, accumulated chunk by chunk."""
+
+    def __init__(self, rgb_bins=RGB_BINS, hue_bins=HUE_BINS, sv_bins=SV_BINS):
+        """
+        Args:
+            rgb_bins: bins per channel of the joint RGB histogram
+            hue_bins: bins of the hue histogram
+            sv_bins: bins of the saturation and value histograms
+        """
+        self.rgb_bins = rgb_bins
+        self.marks = 0
+        self.pens = 0
+        self.channels = np.zeros((3, 256), dtype=np.int64)
+        self.rgb = np.zeros((rgb_bins,) * 3, dtype=np.int64)
+        self.hue = np.zeros(hue_bins, dtype=np.int64)
+        self.saturation = np.zeros(sv_bins, dtype=np.int64)
+        self.value = np.zeros(sv_bins, dtype=np.int64)
+        self.opacity = np.zeros(256, dtype=np.int64)
+        # Widths of pens only; brushes have none
+        self.width = np.zeros(256, dtype=np.int64)
+
+    @property
+    def brushes(self):
+        return self.marks - self.pens
+
+    def update(self, specs):
+        """Fold a (n, 6) uint8 array of specs rows into the histograms."""
+        specs = np.asarray(specs, dtype=np.uint8)
+        if not len(specs):
+            return self
+        colours = specs[:, :3]
+        is_pen = specs[:, 3].astype(bool)
+        self.marks += len(specs)
+        self.pens += int(is_pen.sum())
+
+        for channel in range(3):
+            self.channels[channel] += np.bincount(colours[:, channel], minlength=256)
+        bins = self.rgb_bins
+        binned = (colours.astype(np.intp) * bins) >> 8
+        joint = (binned[:, 0] * bins + binned[:, 1]) * bins + binned[:, 2]
+        self.rgb += np.bincount(joint, minlength=bins ** 3).reshape(self.rgb.shape)
+
+        hsv = rgb_to_hsv(colours)
+        self.hue += np.bincount(_bin(hsv[:, 0], len(self.hue)), minlength=len(self.hue))
+        self.saturation += np.bincount(_bin(hsv[:, 1], len(self.saturation)), minlength=len(self.saturation))
+        self.value += np.bincount(_bin(hsv[:, 2], len(self.value)), minlength=len(self.value))
+
+        self.opacity += np.bincount(specs[:, 5], minlength=256)
+        self.width += np.bincount(specs[is_pen, 4], minlength=256)
+        return self
+
+    def merge(self, other):
+        """Add the histograms of other (e.g. from another process or split) into these."""
+        self.marks += other.marks
+        self.pens += other.pens
+        for feature in FEATURES:
+            getattr(self, feature)[...] += getattr(other, feature)
+        return self
+
+    def mean_colour(self):
+        """Return the mean (r, g, b) of every mark."""
+        if not self.marks:
+            return np.zeros(3)
+        return self.channels @ np.arange(256) / self.marks
+
+    def distributions(self):
+        """
+        Return every histogram normalised to sum to 1 (zeros for an empty corpus).
+
+        Returns:
+            A dict of feature name (see FEATURES) -> float64 array; channels are normalised per channel
+        """
+        distributions = {}
+        for feature in FEATURES:
+            counts = getattr(self, feature).astype(np.float64)
+            total = counts.sum(axis=-1, keepdims=True) if feature == "channels" else counts.sum()
+            distributions[feature] = np.divide(counts, total, out=np.zeros_like(counts), where=total > 0)
+        return distributions
+
+    def summary(self):
+        """Return the mark counts, pen share, mean colour and mean opacity and pen width."""
+        levels = np.arange(256)
+        return {
+            "marks": self.marks,
+            "pens": self.pens,
+            "brushes": self.brushes,
+            "pen_share": self.pens / self.marks if self.marks else 0.0,
+            "mean_colour": self.mean_colour().tolist(),
+            "mean_opacity": float(self.opacity @ levels / self.marks) if self.marks else 0.0,
+            "mean_pen_width": float(self.width @ levels / self.pens) if self.pens else 0.0,
+        }
+
+
+def colour_statistics(source, chunk_marks=CHUNK_MARKS, **bins):
+    """
+    Compute the ColourStats of a corpus one chunk of marks at a time.
+
+    Args:
+        source: a PaintingDataset (or a list of them), or an iterable of paintings with a mark_specs column
+        chunk_marks: most marks held in memory at once
+        bins: rgb_bins, hue_bins or sv_bins for ColourStats
+
+    Returns:
+        The corpus' ColourStats
+    """
+    stats = ColourStats(**bins)
+    for specs in iter_spec_chunks(source, chunk_marks):
+        stats.update(specs)
+    return stats
+
+
+def compare(liked, disliked):
+    """
+    Compare the colour distributions of two corpora (e.g. liked and disliked paintings).
+
+    Returns:
+        A dict of feature name -> liked minus disliked distribution, plus
+        "total_variation": feature name -> distance between the two (0 same, 1 disjoint)
+        and "pen_share": liked minus disliked share of marks made with a pen
+    """
+    liked_distributions = liked.distributions()
+    disliked_distributions = disliked.distributions()
+    differences = {feature: liked_distributions[feature] - disliked_distributions[feature]
+                   for feature in FEATURES}
+    differences["total_variation"] = {
+        # Channels hold three distributions, so average their distances
+        feature: float(np.abs(difference).sum() / (3 if feature == "channels" else 1) / 2)
+        for feature, difference in differences.items()
+    }
+    differences["pen_share"] = liked.summary()["pen_share"] - disliked.summary()["pen_share"]
+    return differences
+
+
+def _bin_colours(feature, bins):
+    # The colour to draw each bin of a one-dimensional histogram in
+    centres = (np.arange(bins) + 0.5) / bins
+    if feature == "hue":
+        return np.array([hsv_to_rgb(centre, 1, 1) for centre in centres]) * 255
+    if feature == "saturation":
+        return np.array([hsv_to_rgb(0, centre, 1) for centre in centres]) * 255
+    return np.repeat(centres[:, None] * 255, 3, axis=1)
+
+
+def histogram_image(stats, feature="hue", size=(512, 128)):
+    """
+    Draw one of the one-dimensional histograms of stats as bars on a black image.
+
+    Args:
+        stats: ColourStats
+        feature: hue, saturation, value, opacity or width
+        size: (width, height) of the image
+
+    Returns:
+        A PIL RGB image
+    """
+    counts = getattr(stats, feature).astype(np.float64)
+    width, height = size
+    heights = counts / counts.max() * height if counts.max() else counts
+    bin_of_column = np.arange(width) * len(counts) // width
+    filled = np.arange(height)[::-1, None] < heights[bin_of_column][None, :]
+    colours = _bin_colours(feature, len(counts))[bin_of_column].astype(np.uint8)
+    pixels = np.where(filled[:, :, None], colours[None, :, :], 0).astype(np.uint8)
+    return Image.fromarray(pixels, "RGB")
+
+
+def palette_image(stats, size=(512, 64)):
+    """
+    Draw the corpus' palette: a stripe per RGB histogram bin, ordered by hue, as wide as its share of marks.
+
+    Returns:
+        A PIL RGB image
+    """
+    bins = stats.rgb_bins
+    counts = stats.rgb.ravel()
+    used = np.flatnonzero(counts)
+    width, height = size
+    if not len(used):
+        return Image.new("RGB", size)
+    # Bin centres, back in 0-255
+    indices = np.stack(np.unravel_index(used, stats.rgb.shape), axis=1)
+    colours = ((indices + 0.5) * 256 / bins).astype(np.uint8)
+    hsv = rgb_to_hsv(colours)
+    order = np.lexsort((hsv[:, 2], hsv[:, 0]))
+    colours, shares = colours[order], counts[used][order]
+    edges = np.cumsum(shares) / shares.sum()
+    stripe_of_column = np.minimum(np.searchsorted(edges, (np.arange(width) + 0.5) / width), len(edges) - 1)
+    pixels = np.broadcast_to(colours[stripe_of_column][None, :, :], (height, width, 3))
+    return Image.fromarray(np.ascontiguousarray(pixels), "RGB")
+
+
+def swatch_image(source, marks=None, chunk_marks=CHUNK_MARKS):
+    """
+    Draw every mark's colour as one pixel of the largest square the corpus fills.
+
+    The pixels are written chunk by chunk into the image's own buffer, so
+    apart from the image only one chunk of marks is in memory.
+
+    Args:
+        source: a PaintingDataset (or a list of them), or an iterable of paintings with a mark_specs column
+        marks: number of marks in source; needed for one-shot iterators (e.g. a
+            generator), otherwise a list of paintings is counted in a first pass
+
+    Returns:
+        A PIL RGB image
+    """
+    if marks is None:
+        datasets = _datasets(source)
+        if datasets is not None:
+            marks = sum(len(dataset.specs) for dataset in datasets)
+        elif iter(source) is source:
+            raise TypeError("Pass marks= to draw a swatch from a one-shot iterator")
+        else:
+            marks = sum(len(painting["mark_specs"]) for painting in source)
+    width = int(np.sqrt(marks))
+    pixels = np.zeros((width * width, 3), dtype=np.uint8)
+    filled = 0
+    for specs in iter_spec_chunks(source, chunk_marks):
+        if filled == len(pixels):
+            break
+        take = min(len(specs), len(pixels) - filled)
+        pixels[filled:filled + take] = specs[:take, :3]
+        filled += take
+    return Image.fromarray(pixels.reshape(width, width, 3), "RGB")
@@ -0,0 +1,96 @@
+"""
+Display lists: a compact, backend-neutral record of drawing primitives.
+
+Geometry code draws onto a DisplayList exactly as it would onto an
+ImageDraw object (ellipse, polygon, line, rectangle). The recorded primitives
+can then be rasterized with Pillow, or sent to the browser as JSON and drawn
+on a <canvas>.
+"""
+
+
+def flatten_points(xy):
+    """Turn [(x, y), ...] or [x0, y0, x1, y1, ...] into a flat list of floats."""
+    flat = []
+    for item in xy:
+        if isinstance(item, (tuple, list)):
+            flat.append(float(item[0]))
+            flat.append(float(item[1]))
+        else:
+            flat.append(float(item))
+    return flat
+
+
+def pair_points(flat):
+    """Turn a flat [x0, y0, x1, y1, ...] list back into [(x, y), ...]."""
+    return list(zip(flat[0::2], flat[1::2]))
+
+
+class DisplayList:
+    """
+    Records drawing primitives with the same call signature as ImageDraw.
+
+    Each item is a tuple (op, xy, fill, width) where xy is a flat list of
+    floats: the bounding box for "ellipse" and "rectangle", the points for
+    "polygon" and "line".
+    """
+
+    def __init__(self, items=None):
+        self.items = list(items) if items else []
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def ellipse(self, xy, fill=None):
+        self.items.append(("ellipse", flatten_points(xy), fill, 0))
+
+    def rectangle(self, xy, fill=None):
+        self.items.append(("rectangle", flatten_points(xy), fill, 0))
+
+    def polygon(self, xy, fill=None):
+        self.items.append(("polygon", flatten_points(xy), fill, 0))
+
+    def line(self, xy, fill=None, width=1):
+        self.items.append(("line", flatten_points(xy), fill, int(width)))
+
+    def extend(self, other):
+        """Append every primitive from another display list."""
+        self.items.extend(other.items)
+
+    def rasterize(self, draw):
+        """Draw every primitive onto a Pillow ImageDraw object."""
+        for op, xy, fill, width in self.items:
+            if op == "ellipse":
+                draw.ellipse(xy, fill=fill)
+            elif op == "rectangle":
+                draw.rectangle(xy, fill=fill)
+            elif op == "polygon":
+                draw.polygon(pair_points(xy), fill=fill)
+            elif op == "line":
+                draw.line(pair_points(xy), fill=fill, width=width)
+
+    def to_json(self, precision=1):
+        """
+        Return the display list as JSON-friendly dicts.
+
+        Args:
+            precision: decimal places kept for coordinates
+
+        Returns:
+            A list of {"op", "xy", "fill"[, "width"]} dicts
+        """
+        items = []
+        for op, xy, fill, width in self.items:
+            item = {"op": op, "xy": [round(v, precision) for v in xy], "fill": list(fill)}
+            if op == "line":
+                item["width"] = width
+            items.append(item)
+        return items
+
+    @classmethod
+    def from_json(cls, items):
+        """Build a display list from the output of to_json()."""
+        return cls((item["op"], [float(v) for v in item["xy"]], tuple(item["fill"]),
+                    int(item.get("width", 0))) for item in items)
@@ -1,67 +1,87 @@
 """
 This script draws a parameterized horse (honse) using the PIL (Pillow) library.
 It can create horses with various body shapes, leg lengths, mane styles, and more.
+
+The geometry is computed into a DisplayList of primitives, which is then
+rasterized (or sent to the browser as-is).
 """
 
 from PIL import Image, ImageDraw
 import numpy as np
 import random
 import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from backgrounds import render_field_background, render_herd_background
+from encoding import encode_image, VECTOR_FORMATS
+from display_list import DisplayList
+from rasterizers import get_rasterizer
+from svg import render_svg
+
+# Default parameters
+DEFAULT_PARAMS = {
+    # Body parameters
+    "body_length": 1.0,        # Relative body length (1.0 is default)
+    "body_height": 1.0,        # Relative body height
+    "neck_length": 1.0,        # Relative neck length
+    "neck_thickness": 1.0,     # Relative neck thickness
+    "head_size": 1.0,          # Relative head size
+    "leg_length": 1.0,         # Relative leg length
+    "leg_thickness": 1.0,      # Relative leg thickness
+    "tail_length": 1.0,        # Relative tail length
+    "tail_thickness": 1.0,     # Relative tail thickness
+    "mane_length": 1.0,        # Relative mane length
+    "mane_density": 1.0,       # Relative mane density (number of strands)
+    
+    # Color parameters (RGB values)
+    "body_color": (139, 69, 19),    # Brown
+    "mane_color": (51, 25, 0),      # Dark brown
+    "eye_color": (0, 0, 0),         # Black
+    
+    # Pose parameters
+    "head_angle": 0,           # Head angle in degrees (0 is straight)
+    "neck_angle": 0,           # Neck angle in degrees
+    "tail_angle": 45,          # Tail angle in degrees
+    "leg_pose": "standing",    # "standing", "walking", "running", "rearing"
+    
+    # Style parameters
+    "mane_style": "flowing",   # "flowing", "short", "mohawk", "braided"
+    "tail_style": "flowing",   # "flowing", "short", "braided"
+    "eye_style": "normal",     # "normal", "cartoon", "realistic"
+}
 
-def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
+def merge_default_params(params=None):
+    """Fill in any missing parameters with their defaults (in place) and return them."""
+    # Use provided parameters or defaults
+    if params is None:
+        params = {}
+    
+    # Merge provided parameters with defaults
+    for key in DEFAULT_PARAMS:
+        if key not in params:
+            params[key] = DEFAULT_PARAMS[key]
+    return params
+
+def build_honse_body(center_x, center_y, params=None, size_factor=1.0, rng=None,
+                     display_list=None):
     """
-    Draw a parameterized horse at the specified position with given parameters.
+    Compute the still parts of a horse (body, neck, head and mane) as a display list.
     
     Args:
-        draw: ImageDraw object to draw on
         center_x: x-coordinate of the horse's center
         center_y: y-coordinate of the horse's center
         params: dictionary of parameters to customize the horse appearance
         size_factor: scaling factor for the horse (1.0 is original size)
+        rng: random.Random used for mane strands (defaults to the random module)
+        display_list: DisplayList to append to (a new one is created if None)
     
     Returns:
-        A dictionary of the parameters used (for reference)
+        (display list, dictionary of the parameters used)
     """
-    # Default parameters
-    default_params = {
-        # Body parameters
-        "body_length": 1.0,        # Relative body length (1.0 is default)
-        "body_height": 1.0,        # Relative body height
-        "neck_length": 1.0,        # Relative neck length
-        "neck_thickness": 1.0,     # Relative neck thickness
-        "head_size": 1.0,          # Relative head size
-        "leg_length": 1.0,         # Relative leg length
-        "leg_thickness": 1.0,      # Relative leg thickness
-        "tail_length": 1.0,        # Relative tail length
-        "tail_thickness": 1.0,     # Relative tail thickness
-        "mane_length": 1.0,        # Relative mane length
-        "mane_density": 1.0,       # Relative mane density (number of strands)
-        
-        # Color parameters (RGB values)
-        "body_color": (139, 69, 19),    # Brown
-        "mane_color": (51, 25, 0),      # Dark brown
-        "eye_color": (0, 0, 0),         # Black
-        
-        # Pose parameters
-        "head_angle": 0,           # Head angle in degrees (0 is straight)
-        "neck_angle": 0,           # Neck angle in degrees
-        "tail_angle": 45,          # Tail angle in degrees
-        "leg_pose": "standing",    # "standing", "walking", "running", "rearing"
-        
-        # Style parameters
-        "mane_style": "flowing",   # "flowing", "short", "mohawk", "braided"
-        "tail_style": "flowing",   # "flowing", "short", "braided"
-        "eye_style": "normal",     # "normal", "cartoon", "realistic"
-    }
-    
-    # Use provided parameters or defaults
-    if params is None:
-        params = {}
-    
-    # Merge provided parameters with defaults
-    for key in default_params:
-        if key not in params:
-            params[key] = default_params[key]
+    rng = rng or random
+    params = merge_default_params(params)
+    canvas = display_list if display_list is not None else DisplayList()
     
     # Base dimensions
     base_body_length = 200 * params["body_length"] * size_factor
@@ -69,8 +89,6 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
     base_neck_length = 100 * params["neck_length"] * size_factor
     base_neck_thickness = 40 * params["neck_thickness"] * size_factor
     base_head_size = 60 * params["head_size"] * size_factor
-    base_leg_length = 120 * params["leg_length"] * size_factor
-    base_leg_thickness = 15 * params["leg_thickness"] * size_factor
     
     # Body position
     body_left = center_x - base_body_length/2
@@ -79,7 +97,7 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
     body_bottom = body_top + base_body_height
     
     # Draw body (oval)
-    draw.ellipse([body_left, body_top, body_right, body_bottom], fill=params["body_color"])
+    canvas.ellipse([body_left, body_top, body_right, body_bottom], fill=params["body_color"])
     
     # Calculate neck start position (on the body)
     neck_start_x = body_left + base_body_length * 0.8
@@ -108,7 +126,7 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
     ny4 = neck_end_y + np.sin(neck_angle_perp) * (neck_width * 0.9)
     
     # Draw the neck
-    draw.polygon([(nx1, ny1), (nx2, ny2), (nx3, ny3), (nx4, ny4)], fill=params["body_color"])
+    canvas.polygon([(nx1, ny1), (nx2, ny2), (nx3, ny3), (nx4, ny4)], fill=params["body_color"])
     
     # Calculate head angle in radians (relative to neck)
     head_rad = neck_rad + np.radians(params["head_angle"])
@@ -127,7 +145,7 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
     head_bottom = head_center_y + head_height/2
     
     # Draw the main head oval
-    draw.ellipse([head_left, head_top, head_right, head_bottom], fill=params["body_color"])
+    canvas.ellipse([head_left, head_top, head_right, head_bottom], fill=params["body_color"])
     
     # Add elongated nose/muzzle
     nose_length = base_head_size * 0.9  # Longer nose
@@ -153,8 +171,8 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
     ]
     
     # Draw the nose extension
-    draw.polygon(nose_points, fill=params["body_color"])
-    draw.ellipse([nose_left, nose_top, nose_right, nose_bottom], fill=params["body_color"])
+    canvas.polygon(nose_points, fill=params["body_color"])
+    canvas.ellipse([nose_left, nose_top, nose_right, nose_bottom], fill=params["body_color"])
     
     # Draw eye - moved back on the head
     eye_size = base_head_size * 0.15
@@ -162,26 +180,26 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
     eye_y = head_center_y - base_head_size * 0.15
     
     if params["eye_style"] == "normal":
-        draw.ellipse([eye_x - eye_size/2, eye_y - eye_size/2, 
+        canvas.ellipse([eye_x - eye_size/2, eye_y - eye_size/2, 
                       eye_x + eye_size/2, eye_y + eye_size/2], 
                      fill=params["eye_color"])
     elif params["eye_style"] == "cartoon":
         # Larger eye with white background
-        draw.ellipse([eye_x - eye_size, eye_y - eye_size, 
+        canvas.ellipse([eye_x - eye_size, eye_y - eye_size, 
                       eye_x + eye_size, eye_y + eye_size], 
                      fill=(255, 255, 255))
-        draw.ellipse([eye_x - eye_size/2, eye_y - eye_size/2, 
+        canvas.ellipse([eye_x - eye_size/2, eye_y - eye_size/2, 
                       eye_x + eye_size/2, eye_y + eye_size/2], 
                      fill=params["eye_color"])
     elif params["eye_style"] == "realistic":
         # More detailed eye
-        draw.ellipse([eye_x - eye_size, eye_y - eye_size, 
+        canvas.ellipse([eye_x - eye_size, eye_y - eye_size, 
                       eye_x + eye_size, eye_y + eye_size], 
                      fill=(255, 255, 255))
-        draw.ellipse([eye_x - eye_size*0.7, eye_y - eye_size*0.7, 
+        canvas.ellipse([eye_x - eye_size*0.7, eye_y - eye_size*0.7, 
                       eye_x + eye_size*0.7, eye_y + eye_size*0.7], 
                      fill=(139, 69, 19))  # Brown iris
-        draw.ellipse([eye_x - eye_size*0.3, eye_y - eye_size*0.3, 
+        canvas.ellipse([eye_x - eye_size*0.3, eye_y - eye_size*0.3, 
                       eye_x + eye_size*0.3, eye_y + eye_size*0.3], 
                      fill=params["eye_color"])  # Pupil
     
@@ -190,17 +208,17 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
     nostril_spacing = nostril_size * 2
     
     # Position nostrils at the end of the nose
-    draw.ellipse([nose_end_x - nostril_spacing/2 - nostril_size/2, nose_end_y - nostril_size/2, 
+    canvas.ellipse([nose_end_x - nostril_spacing/2 - nostril_size/2, nose_end_y - nostril_size/2, 
                   nose_end_x - nostril_spacing/2 + nostril_size/2, nose_end_y + nostril_size/2], 
                  fill=(30, 30, 30))
-    draw.ellipse([nose_end_x + nostril_spacing/2 - nostril_size/2, nose_end_y - nostril_size/2, 
+    canvas.ellipse([nose_end_x + nostril_spacing/2 - nostril_size/2, nose_end_y - nostril_size/2, 
                   nose_end_x + nostril_spacing/2 + nostril_size/2, nose_end_y + nostril_size/2], 
                  fill=(30, 30, 30))
     
     # Add a mouth line
     mouth_length = nose_width * 0.6
     mouth_y = nose_end_y + nose_width/4
-    draw.line([
+    canvas.line([
         (nose_end_x - mouth_length/2, mouth_y),
         (nose_end_x + mouth_length/2, mouth_y)
     ], fill=(30, 30, 30), width=max(1, int(size_factor * 2)))
@@ -213,14 +231,14 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
     ear_right_y = head_center_y - base_head_size * 0.3
     
     # Left ear
-    draw.polygon([
+    canvas.polygon([
         (ear_left_x, ear_left_y),
         (ear_left_x - ear_size, ear_left_y - ear_size*1.5),
         (ear_left_x + ear_size, ear_left_y - ear_size*1.5)
     ], fill=params["body_color"])
     
     # Right ear
-    draw.polygon([
+    canvas.polygon([
         (ear_right_x, ear_right_y),
         (ear_right_x - ear_size, ear_right_y - ear_size*1.5),
         (ear_right_x + ear_size, ear_right_y - ear_size*1.5)
@@ -242,14 +260,14 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
             strand_length = mane_length * (1 - 0.5 * abs(2*t - 1))  # Longest in the middle
             
             # Direction perpendicular to neck, slightly random
-            angle = neck_angle_perp + np.radians(random.uniform(-20, 20))
+            angle = neck_angle_perp + np.radians(rng.uniform(-20, 20))
             
             # End point of the strand
             strand_end_x = mane_x + np.cos(angle) * strand_length
             strand_end_y = mane_y + np.sin(angle) * strand_length
             
             # Draw the strand
-            draw.line([(mane_x, mane_y), (strand_end_x, strand_end_y)], 
+            canvas.line([(mane_x, mane_y), (strand_end_x, strand_end_y)], 
                       fill=params["mane_color"], 
                       width=max(1, int(2 * size_factor)))
     
@@ -263,7 +281,7 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
             
             # Short spikes
             strand_length = mane_length * 0.3
-            angle = neck_angle_perp + np.radians(random.uniform(-10, 10))
+            angle = neck_angle_perp + np.radians(rng.uniform(-10, 10))
             
             mane_points.append((mane_x, mane_y))
             mane_points.append((
@@ -272,7 +290,7 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
             ))
         
         if mane_points:
-            draw.polygon(mane_points, fill=params["mane_color"])
+            canvas.polygon(mane_points, fill=params["mane_color"])
     
     elif params["mane_style"] == "mohawk":
         # Mohawk style - straight up
@@ -289,7 +307,7 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
             strand_end_y = mane_y + np.sin(angle) * strand_length
             
             # Draw thicker strands
-            draw.line([(mane_x, mane_y), (strand_end_x, strand_end_y)], 
+            canvas.line([(mane_x, mane_y), (strand_end_x, strand_end_y)], 
                       fill=params["mane_color"], 
                       width=max(2, int(3 * size_factor)))
     
@@ -315,10 +333,44 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
         if braid_points:
             # Draw the braid as a thick line
             for i in range(len(braid_points) - 1):
-                draw.line([braid_points[i], braid_points[i+1]], 
+                canvas.line([braid_points[i], braid_points[i+1]], 
                           fill=params["mane_color"], 
                           width=max(3, int(5 * size_factor)))
     
+    # Return the primitives and the parameters used
+    return canvas, params
+
+def build_honse_limbs(center_x, center_y, params=None, size_factor=1.0, rng=None,
+                      display_list=None, leg_angles=None, tail_angle=None):
+    """
+    Compute the moving parts of a horse (legs and tail) as a display list.
+    
+    Args:
+        center_x: x-coordinate of the horse's center
+        center_y: y-coordinate of the horse's center
+        params: dictionary of parameters to customize the horse appearance
+        size_factor: scaling factor for the horse (1.0 is original size)
+        rng: random.Random used for tail strands (defaults to the random module)
+        display_list: DisplayList to append to (a new one is created if None)
+        leg_angles: four leg angles in degrees, overriding the leg pose's
+        tail_angle: tail angle in degrees, overriding params["tail_angle"]
+    
+    Returns:
+        (display list, dictionary of the parameters used)
+    """
+    rng = rng or random
+    params = merge_default_params(params)
+    canvas = display_list if display_list is not None else DisplayList()
+    
+    # Base dimensions and body position (as in build_honse_body)
+    base_body_length = 200 * params["body_length"] * size_factor
+    base_body_height = 80 * params["body_height"] * size_factor
+    base_leg_length = 120 * params["leg_length"] * size_factor
+    base_leg_thickness = 15 * params["leg_thickness"] * size_factor
+    body_left = center_x - base_body_length/2
+    body_top = center_y - base_body_height/2
+    body_bottom = body_top + base_body_height
+    
     # Draw legs based on pose
     leg_positions = [
         (body_left + base_body_length * 0.2, body_bottom),  # Front left
@@ -327,23 +379,27 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
         (body_left + base_body_length * 0.8, body_bottom),  # Back right
     ]
     
-    leg_angles = []
+    pose_angles = []
     if params["leg_pose"] == "standing":
         # Standing - all legs straight down
-        leg_angles = [0, 0, 0, 0]
+        pose_angles = [0, 0, 0, 0]
     elif params["leg_pose"] == "walking":
         # Walking - alternating legs forward/backward
-        leg_angles = [15, -15, -15, 15]
+        pose_angles = [15, -15, -15, 15]
     elif params["leg_pose"] == "running":
         # Running - front legs forward, back legs backward
-        leg_angles = [30, 30, -30, -30]
+        pose_angles = [30, 30, -30, -30]
     elif params["leg_pose"] == "rearing":
         # Rearing - front legs up, back legs straight
-        leg_angles = [-60, -60, 0, 0]
+        pose_angles = [-60, -60, 0, 0]
         # Adjust front leg positions for rearing
         leg_positions[0] = (leg_positions[0][0], leg_positions[0][1] - base_body_height * 0.3)
         leg_positions[1] = (leg_positions[1][0], leg_positions[1][1] - base_body_height * 0.3)
     
+    # Explicit angles (e.g. one frame of a gait cycle) replace the pose's
+    if leg_angles is None:
+        leg_angles = pose_angles
+    
     # Draw each leg
     for i, (leg_x, leg_y) in enumerate(leg_positions):
         leg_angle_rad = np.radians(leg_angles[i])
@@ -353,13 +409,13 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
         leg_end_y = leg_y + np.cos(leg_angle_rad) * base_leg_length
         
         # Draw the leg
-        draw.line([(leg_x, leg_y), (leg_end_x, leg_end_y)], 
+        canvas.line([(leg_x, leg_y), (leg_end_x, leg_end_y)], 
                   fill=params["body_color"], 
                   width=max(1, int(base_leg_thickness)))
         
         # Draw hoof
         hoof_size = base_leg_thickness * 0.8
-        draw.ellipse([
+        canvas.ellipse([
             leg_end_x - hoof_size, leg_end_y - hoof_size/2,
             leg_end_x + hoof_size, leg_end_y + hoof_size/2
         ], fill=(30, 30, 30))  # Dark hooves
@@ -369,22 +425,22 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
     tail_start_y = body_top + base_body_height * 0.4
     
     tail_length = base_body_length * 0.6 * params["tail_length"]
-    tail_angle_rad = np.radians(params["tail_angle"])
+    tail_angle_rad = np.radians(params["tail_angle"] if tail_angle is None else tail_angle)
     
     if params["tail_style"] == "flowing":
         # Flowing tail with multiple strands
         tail_strands = int(7 * params["tail_thickness"])
         for i in range(tail_strands):
             # Vary the angle slightly for each strand
-            strand_angle = tail_angle_rad + np.radians(random.uniform(-20, 20))
-            strand_length = tail_length * (0.7 + 0.3 * random.random())
+            strand_angle = tail_angle_rad + np.radians(rng.uniform(-20, 20))
+            strand_length = tail_length * (0.7 + 0.3 * rng.random())
             
             # End point of the strand
             strand_end_x = tail_start_x - np.cos(strand_angle) * strand_length
             strand_end_y = tail_start_y + np.sin(strand_angle) * strand_length
             
             # Draw the strand with varying thickness
-            draw.line([(tail_start_x, tail_start_y), (strand_end_x, strand_end_y)], 
+            canvas.line([(tail_start_x, tail_start_y), (strand_end_x, strand_end_y)], 
                       fill=params["mane_color"], 
                       width=max(1, int(2 * size_factor * params["tail_thickness"])))
     
@@ -405,7 +461,7 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
              tail_end_y - np.sin(perp_angle) * tail_width)
         ]
         
-        draw.polygon(tail_points, fill=params["mane_color"])
+        canvas.polygon(tail_points, fill=params["mane_color"])
     
     elif params["tail_style"] == "braided":
         # Braided tail - similar to braided mane but longer
@@ -430,64 +486,101 @@ def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0):
         if braid_points:
             # Draw the braid as a thick line
             for i in range(len(braid_points) - 1):
-                draw.line([braid_points[i], braid_points[i+1]], 
+                canvas.line([braid_points[i], braid_points[i+1]], 
                           fill=params["mane_color"], 
                           width=max(3, int(5 * size_factor * params["tail_thickness"])))
     
-    # Return the parameters used
-    return params
+    # Return the primitives and the parameters used
+    return canvas, params
+
+def build_honse_display_list(center_x, center_y, params=None, size_factor=1.0, rng=None,
+                             display_list=None):
+    """
+    Compute a parameterized horse's geometry as a display list of primitives.
+    
+    Args:
+        center_x: x-coordinate of the horse's center
+        center_y: y-coordinate of the horse's center
+        params: dictionary of parameters to customize the horse appearance
+        size_factor: scaling factor for the horse (1.0 is original size)
+        rng: random.Random used for mane and tail strands (defaults to the random module)
+        display_list: DisplayList to append to (a new one is created if None)
+    
+    Returns:
+        (display list, dictionary of the parameters used)
+    """
+    canvas, params = build_honse_body(center_x, center_y, params, size_factor, rng, display_list)
+    return build_honse_limbs(center_x, center_y, params, size_factor, rng, canvas)
+
+def draw_honse(draw, center_x, center_y, params=None, size_factor=1.0, rng=None):
+    """
+    Draw a parameterized horse at the specified position with given parameters.
+    
+    Args:
+        draw: ImageDraw object to draw on
+        center_x: x-coordinate of the horse's center
+        center_y: y-coordinate of the horse's center
+        params: dictionary of parameters to customize the horse appearance
+        size_factor: scaling factor for the horse (1.0 is original size)
+        rng: random.Random used for mane and tail strands (defaults to the random module)
+    
+    Returns:
+        A dictionary of the parameters used (for reference)
+    """
+    display_list, used_params = build_honse_display_list(center_x, center_y, params,
+                                                         size_factor, rng)
+    display_list.rasterize(draw)
+    return used_params
 
-def generate_random_honse_params():
-    """Generate random parameters for a honse."""
+def generate_random_honse_params(rng=None):
+    """Generate random parameters for a honse, drawing from rng (defaults to the random module)."""
+    rng = rng or random
     return {
         # Body parameters - vary within reasonable ranges
-        "body_length": random.uniform(0.8, 1.2),
-        "body_height": random.uniform(0.8, 1.2),
-        "neck_length": random.uniform(0.7, 1.3),
-        "neck_thickness": random.uniform(1.0, 1.5),  # Thicker necks
-        "head_size": random.uniform(0.8, 1.2),
-        "leg_length": random.uniform(0.8, 1.2),
-        "leg_thickness": random.uniform(0.8, 1.2),
-        "tail_length": random.uniform(0.7, 1.3),
-        "tail_thickness": random.uniform(0.8, 1.2),
-        "mane_length": random.uniform(0.7, 1.3),
-        "mane_density": random.uniform(0.7, 1.3),
+        "body_length": rng.uniform(0.8, 1.2),
+        "body_height": rng.uniform(0.8, 1.2),
+        "neck_length": rng.uniform(0.7, 1.3),
+        "neck_thickness": rng.uniform(1.0, 1.5),  # Thicker necks
+        "head_size": rng.uniform(0.8, 1.2),
+        "leg_length": rng.uniform(0.8, 1.2),
+        "leg_thickness": rng.uniform(0.8, 1.2),
+        "tail_length": rng.uniform(0.7, 1.3),
+        "tail_thickness": rng.uniform(0.8, 1.2),
+        "mane_length": rng.uniform(0.7, 1.3),
+        "mane_density": rng.uniform(0.7, 1.3),
         
         # Color parameters - keep within brown/chestnut range for realism
         "body_color": (
-            random.randint(100, 160),  # R - brown range
-            random.randint(50, 90),    # G - brown range
-            random.randint(10, 30)     # B - brown range
+            rng.randint(100, 160),  # R - brown range
+            rng.randint(50, 90),    # G - brown range
+            rng.randint(10, 30)     # B - brown range
         ),
         "mane_color": (
-            random.randint(30, 70),    # R - darker brown
-            random.randint(15, 40),    # G - darker brown
-            random.randint(0, 15)      # B - darker brown
+            rng.randint(30, 70),    # R - darker brown
+            rng.randint(15, 40),    # G - darker brown
+            rng.randint(0, 15)      # B - darker brown
         ),
         "eye_color": (0, 0, 0),  # Black eyes
         
         # Pose parameters
-        "head_angle": random.uniform(-20, 20),
-        "neck_angle": random.uniform(-10, 30),
-        "tail_angle": random.uniform(30, 60),
-        "leg_pose": random.choice(["standing", "walking", "running", "rearing"]),
+        "head_angle": rng.uniform(-20, 20),
+        "neck_angle": rng.uniform(-10, 30),
+        "tail_angle": rng.uniform(30, 60),
+        "leg_pose": rng.choice(["standing", "walking", "running", "rearing"]),
         
         # Style parameters
-        "mane_style": random.choice(["flowing", "short", "mohawk", "braided"]),
-        "tail_style": random.choice(["flowing", "short", "braided"]),
-        "eye_style": random.choice(["normal", "cartoon", "realistic"]),
+        "mane_style": rng.choice(["flowing", "short", "mohawk", "braided"]),
+        "tail_style": rng.choice(["flowing", "short", "braided"]),
+        "eye_style": rng.choice(["normal", "cartoon", "realistic"]),
     }
 
 def draw_single_honse(params=None, filename="honse.png"):
     """Draw a single honse with the given parameters."""
     # Set up a canvas with a light blue sky background
     width, height = 800, 600
-    image = Image.new('RGB', (width, height), color=(135, 206, 235))  # Sky blue
+    image = render_field_background(width, height)  # Sky blue with grass
     draw = ImageDraw.Draw(image)
     
-    # Draw some grass
-    draw.rectangle([(0, height*0.7), (width, height)], fill=(34, 139, 34))  # Forest green
-    
     # Generate random parameters if none provided
     if params is None:
         params = generate_random_honse_params()
@@ -508,75 +601,16 @@ def draw_multiple_honses(num_honses=5, filename="honse_herd.png"):
     """Draw multiple honses with different parameters."""
     # Set up a larger canvas
     width, height = 1200, 800
-    image = Image.new('RGB', (width, height), color=(135, 206, 235))  # Sky blue
+    # Sky gradient, hills, grass and grass tufts
+    image = render_herd_background(width, height)
     draw = ImageDraw.Draw(image)
     
-    # Draw sky with gradient
-    for y in range(height):
-        # Create a gradient from light blue to darker blue
-        t = y / height
-        r = int(135 * (1 - t) + 100 * t)
-        g = int(206 * (1 - t) + 150 * t)
-        b = int(235 * (1 - t) + 200 * t)
-        draw.line([(0, y), (width, y)], fill=(r, g, b))
-    
-    # Draw hills in the background
-    for i in range(3):
-        hill_height = random.uniform(0.2, 0.4)
-        hill_width = random.uniform(0.5, 1.5)
-        hill_x = random.uniform(-0.3, 0.7) * width
-        
-        # Draw a hill as a green arc
-        hill_color = (
-            random.randint(30, 100),
-            random.randint(100, 160),
-            random.randint(30, 80)
-        )
-        
-        # Create hill points
-        hill_points = []
-        for x in range(int(width * 1.5)):
-            # Parabolic curve for the hill
-            dx = (x - hill_x) / (width * hill_width)
-            y = height * (0.7 - hill_height * (1 - dx*dx))
-            if 0 <= x < width and y < height:
-                hill_points.append((x, y))
-        
-        # Add bottom corners to complete the polygon
-        if hill_points:
-            hill_points.append((width, height))
-            hill_points.append((0, height))
-            draw.polygon(hill_points, fill=hill_color)
-    
-    # Draw grass in the foreground
-    draw.rectangle([(0, height*0.7), (width, height)], fill=(34, 139, 34))  # Forest green
-    
-    # Draw some random grass tufts
-    for _ in range(100):
-        x = random.randint(0, width)
-        y = random.randint(int(height*0.7), height)
-        grass_height = random.randint(5, 15)
-        grass_color = (
-            random.randint(30, 100),
-            random.randint(120, 180),
-            random.randint(30, 80)
-        )
-        draw.line([(x, y), (x, y-grass_height)], fill=grass_color, width=2)
-    
-    # Draw multiple honses
-    honses_params = []
-    for i in range(num_honses):
-        # Random position, with larger honses in the foreground
-        size = random.uniform(0.3, 1.0)
-        y_pos = height * (0.7 - 0.1 * (1 - size))  # Larger honses lower in the scene
-        x_pos = random.uniform(width * 0.1, width * 0.9)
-        
-        # Generate random parameters
-        params = generate_random_honse_params()
-        
-        # Draw the honse
-        used_params = draw_honse(draw, x_pos, y_pos, params, size)
-        honses_params.append(used_params)
+    # Place multiple honses at random, larger ones in the foreground, then
+    # compute every honse's geometry at once and draw them in one pass
+    # (imported here because herd_geometry builds on this module)
+    from herd_geometry import place_herd, build_herd_display_list
+    honses, honses_params = place_herd(num_honses, width, height)
+    build_herd_display_list(honses).rasterize(draw)
     
     # Show the image
     image.show()
@@ -587,6 +621,99 @@ def draw_multiple_honses(num_honses=5, filename="honse_herd.png"):
     
     return honses_params
 
+def render_single_honse(params=None, seed=None, fmt="png", encoder_settings=None,
+                        width=800, height=600, rasterizer="pillow"):
+    """
+    Render one honse on the sky and grass background and encode it.
+    
+    Args:
+        params: honse parameters (random ones are generated from the seed if None)
+        seed: seed for the random parameters and the mane and tail strands
+        fmt: output format ("png", "webp", "jpeg" or "svg")
+        encoder_settings: compression settings passed to encode_image
+        width, height: canvas size; the honse is scaled with the width
+            (800 pixels is its original size)
+        rasterizer: name of the rasterizer backend ("pillow" or "aggdraw")
+    
+    Returns:
+        (encoded image bytes, parameters used)
+    """
+    rng = random.Random(seed)
+    if params is None:
+        params = generate_random_honse_params(rng)
+    display_list, used_params = build_honse_display_list(width/2, height*0.7, dict(params),
+                                                         width / 800, rng)
+    if fmt in VECTOR_FORMATS:
+        return render_svg(width, height, display_list), used_params
+    
+    image = render_field_background(width, height)
+    get_rasterizer(rasterizer).render(image, display_list)
+    return encode_image(image, fmt, encoder_settings), used_params
+
+def _render_batch_item(job):
+    # Top-level so the process pool can pickle it
+    params, seed, fmt, encoder_settings, rasterizer, (width, height) = job
+    return render_single_honse(params, seed, fmt, encoder_settings, width, height, rasterizer)
+
+_render_pool = None
+_render_pool_workers = None
+_render_pool_pid = None
+_render_pool_lock = threading.Lock()
+
+def get_render_pool(workers=None):
+    """
+    Return the persistent process pool used for batch rendering.
+    
+    The pool is created on first use and reused; asking for a different
+    worker count, a worker dying, or a fork (a pool belongs to the process
+    that created it) replaces it.
+    """
+    global _render_pool, _render_pool_workers, _render_pool_pid
+    workers = workers or os.cpu_count() or 1
+    with _render_pool_lock:
+        if (_render_pool is None or _render_pool_workers != workers
+                or _render_pool_pid != os.getpid() or getattr(_render_pool, "_broken", False)):
+            if _render_pool is not None and _render_pool_pid == os.getpid():
+                _render_pool.shutdown(wait=False)
+            # Spawned workers don't inherit the parent's threads or locks
+            _render_pool = ProcessPoolExecutor(max_workers=workers,
+                                               mp_context=multiprocessing.get_context("spawn"))
+            _render_pool_workers = workers
+            _render_pool_pid = os.getpid()
+        return _render_pool
+
+def render_honse_batch(params_list=None, num_honses=None, seed=None, fmt="png",
+                       encoder_settings=None, workers=None, rasterizer="pillow", size=(800, 600)):
+    """
+    Render many independent honses across the persistent process pool.
+    
+    Args:
+        params_list: list of parameter dicts (None entries are random honses)
+        num_honses: number of random honses to render when params_list is None
+        seed: batch seed; each honse gets its own seed derived from it
+        fmt: output format ("png", "webp", "jpeg" or "svg")
+        encoder_settings: compression settings passed to encode_image
+        workers: number of worker processes (defaults to the CPU count)
+        rasterizer: name of the rasterizer backend ("pillow" or "aggdraw")
+        size: (width, height) of each image
+    
+    Returns:
+        An iterator of (encoded image bytes, parameters used, honse seed),
+        in the same order as the input
+    """
+    if params_list is None:
+        params_list = [None] * (num_honses or 1)
+    
+    batch_rng = random.Random(seed)
+    seeds = [batch_rng.getrandbits(32) for _ in params_list]
+    jobs = [(params, honse_seed, fmt, encoder_settings, rasterizer, tuple(size))
+            for params, honse_seed in zip(params_list, seeds)]
+    
+    pool = get_render_pool(workers)
+    results = pool.map(_render_batch_item, jobs)
+    return ((image_bytes, used_params, honse_seed)
+            for (image_bytes, used_params), honse_seed in zip(results, seeds))
+
 if __name__ == "__main__":
     # Uncomment one of these lines to choose what to draw
     # draw_single_honse()  # Draw a single honse with random parameters
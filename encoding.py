@@ -0,0 +1,186 @@
+"""
+Image encoding for rendered honses.
+
+Each render is encoded exactly once; the resulting bytes are used both for the
+response and for the copy written to disk. The output format can be PNG,
+lossless WebP or JPEG, picked per request from the Accept header or an
+explicit format field. SVG is also a format, but it is written straight from
+the geometry (see svg.py) rather than encoded from pixels. Animations are
+encoded separately, as GIF, APNG or animated WebP.
+"""
+
+import io
+from PIL import Image
+
+# format name -> (Pillow format, MIME type, file extension)
+FORMATS = {
+    "png": ("PNG", "image/png", "png"),
+    "webp": ("WEBP", "image/webp", "webp"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+    "svg": (None, "image/svg+xml", "svg"),
+}
+
+# Formats that are not rasterized
+VECTOR_FORMATS = {"svg"}
+
+# Other names clients may use for the same formats
+FORMAT_ALIASES = {
+    "jpg": "jpeg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/jpeg": "jpeg",
+    "image/svg+xml": "svg",
+}
+
+# Animation format name -> (Pillow format, MIME type, file extension)
+ANIMATION_FORMATS = {
+    "gif": ("GIF", "image/gif", "gif"),
+    "apng": ("PNG", "image/png", "png"),
+    "webp": ("WEBP", "image/webp", "webp"),
+}
+
+ANIMATION_ALIASES = {
+    "png": "apng",
+    "image/gif": "gif",
+    "image/apng": "apng",
+    "image/png": "apng",
+    "image/webp": "webp",
+}
+
+# Default encoder settings
+DEFAULT_SETTINGS = {
+    "png_compress_level": 6,   # 0 (fastest, biggest) to 9 (slowest, smallest)
+    "webp_method": 4,          # 0 (fastest) to 6 (smallest)
+    "jpeg_quality": 90,        # 1 to 95
+}
+
+
+def normalize_format(name):
+    """Return the canonical format name for name, or None if it is not supported."""
+    if not name:
+        return None
+    name = str(name).strip().lower()
+    name = FORMAT_ALIASES.get(name, name)
+    return name if name in FORMATS else None
+
+
+def normalize_animation_format(name):
+    """Return the canonical animation format name for name, or None if it is not supported."""
+    if not name:
+        return None
+    name = str(name).strip().lower()
+    name = ANIMATION_ALIASES.get(name, name)
+    return name if name in ANIMATION_FORMATS else None
+
+
+def mime_type(fmt):
+    """Return the MIME type of a format (still or animated)."""
+    return (FORMATS.get(fmt) or ANIMATION_FORMATS[fmt])[1]
+
+
+def extension(fmt):
+    """Return the file extension (without the dot) of a format (still or animated)."""
+    return (FORMATS.get(fmt) or ANIMATION_FORMATS[fmt])[2]
+
+
+def negotiate_format(requested=None, accept=None, default="png"):
+    """
+    Pick the output format for a request.
+
+    Args:
+        requested: explicit format asked for by the client (e.g. "webp"), or None
+        accept: werkzeug MIMEAccept for the request's Accept header, or None
+        default: format to use when nothing else decides it
+
+    Returns:
+        A format name from FORMATS
+    """
+    fmt = normalize_format(requested)
+    if fmt:
+        return fmt
+
+    default = normalize_format(default) or "png"
+    if accept:
+        # The default comes first so "*/*" keeps it
+        mimetypes = [mime_type(default)] + [m for _, m, _ in FORMATS.values() if m != mime_type(default)]
+        best = accept.best_match(mimetypes)
+        if best:
+            return normalize_format(best)
+    return default
+
+
+def encode_image(image, fmt="png", settings=None):
+    """
+    Encode a PIL image once into the given format.
+
+    Args:
+        image: PIL Image to encode
+        fmt: format name from FORMATS
+        settings: dict overriding DEFAULT_SETTINGS
+
+    Returns:
+        The encoded image as bytes
+
+    Raises:
+        ValueError: for vector formats, which are not encoded from pixels
+    """
+    if fmt in VECTOR_FORMATS:
+        raise ValueError(f"'{fmt}' is a vector format; render it with svg.render_svg")
+
+    options = dict(DEFAULT_SETTINGS)
+    if settings:
+        options.update(settings)
+
+    pil_format = FORMATS[fmt][0]
+    if fmt == "png":
+        save_args = {"compress_level": options["png_compress_level"]}
+    elif fmt == "webp":
+        save_args = {"lossless": True, "method": options["webp_method"]}
+    else:
+        save_args = {"quality": options["jpeg_quality"]}
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **save_args)
+    return buffer.getvalue()
+
+
+def encode_animation(frames, fmt="gif", duration=80, settings=None):
+    """
+    Encode RGB frames as a looping animation.
+
+    Only the region that changed since the previous frame is stored: Pillow
+    crops GIF and APNG frames to their difference, and libwebp's animation
+    encoder does the same for WebP. GIF frames share one palette taken from
+    the first frame, so unchanged pixels keep the same index in every frame.
+
+    Args:
+        frames: list of RGB PIL Images of the same size
+        fmt: format name from ANIMATION_FORMATS
+        duration: display time of each frame in milliseconds
+        settings: dict overriding DEFAULT_SETTINGS
+
+    Returns:
+        The encoded animation as bytes
+    """
+    options = dict(DEFAULT_SETTINGS)
+    if settings:
+        options.update(settings)
+
+    pil_format = ANIMATION_FORMATS[fmt][0]
+    if fmt == "gif":
+        palette = frames[0].quantize(256)
+        frames = [frame.quantize(palette=palette, dither=Image.Dither.NONE) for frame in frames]
+        # The shared palette is already minimal; Pillow's default palette
+        # optimization would only add time
+        save_args = {"optimize": False, "disposal": 1}
+    elif fmt == "apng":
+        save_args = {"compress_level": options["png_compress_level"], "disposal": 0, "blend": 0}
+    else:
+        save_args = {"lossless": True, "method": options["webp_method"]}
+
+    buffer = io.BytesIO()
+    frames[0].save(buffer, pil_format, save_all=True, append_images=frames[1:],
+                   duration=duration, loop=0, **save_args)
+    return buffer.getvalue()
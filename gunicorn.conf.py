@@ -0,0 +1,42 @@
+"""
+Gunicorn settings for the honse app.
+
+The app is preloaded in the master: importing main builds the prebuilt
+backgrounds and loads the codecs once (see main.warm_up), and the forked
+workers share that memory copy-on-write instead of each building their own.
+Each worker then starts its own background threads in post_fork.
+
+Each worker also keeps its own metrics and profiler samples, so the workers
+share snapshots of them through HONSE_METRICS_DIR (instance/metrics unless
+set) and /metrics and /profiler add them up, whichever worker answers.
+"""
+
+import gc
+import os
+
+bind = os.environ.get("HONSE_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+threads = int(os.environ.get("HONSE_THREADS", 4))
+preload_app = True
+
+# Set before the app is loaded, so main picks it up
+metrics_dir = os.environ.setdefault(
+    "HONSE_METRICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "metrics"))
+
+
+def on_starting(server):
+    # Snapshots left by a previous server's workers would be counted again
+    from metrics import SharedSnapshots
+    SharedSnapshots(metrics_dir).clear()
+
+
+def when_ready(server):
+    # Called in the master once the app is loaded, before any worker is forked.
+    # Freezing moves everything built so far out of the garbage collector's
+    # reach, so collections in the workers don't write to (and un-share) it.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from main import start_worker
+    start_worker()
@@ -0,0 +1,418 @@
+"""
+Vectorized geometry for drawing many honses at once.
+
+The parameters of K honses are packed into a NumPy structured array, and every
+body, neck, head, leg, mane and tail coordinate is computed with array
+operations across all K honses together. The result is a single display list
+(honses in input order, each drawn back to front exactly like draw_honse),
+which is then rasterized in one pass.
+"""
+
+import numpy as np
+import random
+from display_list import DisplayList
+from draw_honse import merge_default_params, generate_random_honse_params
+
+# Style names in the order of their integer codes in the structured array
+LEG_POSES = ["standing", "walking", "running", "rearing"]
+MANE_STYLES = ["flowing", "short", "mohawk", "braided"]
+TAIL_STYLES = ["flowing", "short", "braided"]
+EYE_STYLES = ["normal", "cartoon", "realistic"]
+
+# Leg angles (front left, front right, back left, back right) for each leg pose
+LEG_POSE_ANGLES = np.radians(np.array([
+    [0, 0, 0, 0],          # standing
+    [15, -15, -15, 15],    # walking
+    [30, 30, -30, -30],    # running
+    [-60, -60, 0, 0],      # rearing
+], dtype=np.float64))
+
+# Where each leg joins the body, as a fraction of the body length
+LEG_OFFSETS = np.array([0.2, 0.3, 0.7, 0.8])
+
+SCALAR_FIELDS = [
+    "body_length", "body_height", "neck_length", "neck_thickness", "head_size",
+    "leg_length", "leg_thickness", "tail_length", "tail_thickness",
+    "mane_length", "mane_density", "head_angle", "neck_angle", "tail_angle",
+]
+
+HONSE_DTYPE = np.dtype(
+    [("center_x", np.float64), ("center_y", np.float64), ("size_factor", np.float64)]
+    + [(name, np.float64) for name in SCALAR_FIELDS]
+    + [("body_color", np.uint8, 3), ("mane_color", np.uint8, 3), ("eye_color", np.uint8, 3),
+       ("leg_pose", np.int8), ("mane_style", np.int8), ("tail_style", np.int8), ("eye_style", np.int8)]
+)
+
+HOOF_COLOR = (30, 30, 30)
+NOSTRIL_COLOR = (30, 30, 30)
+EYE_WHITE = (255, 255, 255)
+IRIS_COLOR = (139, 69, 19)
+
+
+def _style_code(names, value):
+    return names.index(value) if value in names else -1
+
+
+def honse_params_array(params_list, centers_x, centers_y, size_factors):
+    """
+    Pack the parameters and placement of K honses into a structured array.
+
+    Args:
+        params_list: K parameter dicts (missing keys get their defaults, in place)
+        centers_x, centers_y: K centre coordinates
+        size_factors: K scaling factors
+
+    Returns:
+        A (K,) array of HONSE_DTYPE
+    """
+    honses = np.zeros(len(params_list), dtype=HONSE_DTYPE)
+    honses["center_x"] = centers_x
+    honses["center_y"] = centers_y
+    honses["size_factor"] = size_factors
+    merged = [merge_default_params(params) for params in params_list]
+    for name in SCALAR_FIELDS:
+        honses[name] = [params[name] for params in merged]
+    for name in ("body_color", "mane_color", "eye_color"):
+        honses[name] = [tuple(params[name]) for params in merged]
+    honses["leg_pose"] = [_style_code(LEG_POSES, p["leg_pose"]) for p in merged]
+    honses["mane_style"] = [_style_code(MANE_STYLES, p["mane_style"]) for p in merged]
+    honses["tail_style"] = [_style_code(TAIL_STYLES, p["tail_style"]) for p in merged]
+    honses["eye_style"] = [_style_code(EYE_STYLES, p["eye_style"]) for p in merged]
+    return honses
+
+
+def place_herd(num_honses, width, height, rng=None, scale=1.0):
+    """
+    Place random honses on a herd canvas, larger honses lower in the scene.
+
+    Args:
+        num_honses: number of honses
+        width: width of the canvas in pixels
+        height: height of the canvas in pixels
+        rng: random.Random instance (or the random module) for every random choice
+        scale: extra size factor for every honse (e.g. for canvases larger than 1200x800)
+
+    Returns:
+        (honses structured array, list of parameter dicts)
+    """
+    rng = rng or random
+    sizes, xs, ys, honses_params = [], [], [], []
+    for _ in range(num_honses):
+        size = rng.uniform(0.3, 1.0)
+        sizes.append(size * scale)
+        ys.append(height * (0.7 - 0.1 * (1 - size)))
+        xs.append(rng.uniform(width * 0.1, width * 0.9))
+        honses_params.append(generate_random_honse_params(rng))
+    return honse_params_array(honses_params, xs, ys, sizes), honses_params
+
+
+def _numpy_rng(rng):
+    # Accept a numpy Generator, a random.Random, or None (the random module)
+    if isinstance(rng, np.random.Generator):
+        return rng
+    return np.random.default_rng((rng or random).getrandbits(64))
+
+
+def _strand_t(counts, width):
+    """Positions 0..1 along a row of strands for each honse (padded to width)."""
+    index = np.arange(width)[None, :]
+    denominators = np.maximum(counts - 1, 1)[:, None]
+    return index / denominators
+
+
+def _bbox(x, y, half_w, half_h):
+    return np.stack([x - half_w, y - half_h, x + half_w, y + half_h], axis=-1)
+
+
+def _points(*xy):
+    return np.stack(xy, axis=-1)
+
+
+def build_herd_display_list(honses, rng=None, display_list=None):
+    """
+    Compute the geometry of every honse in a structured array at once.
+
+    Args:
+        honses: (K,) array of HONSE_DTYPE (see honse_params_array)
+        rng: numpy Generator or random.Random for the mane and tail strands
+        display_list: DisplayList to append to (a new one is created if None)
+
+    Returns:
+        The display list, with each honse's primitives in draw_honse order
+    """
+    canvas = display_list if display_list is not None else DisplayList()
+    count = len(honses)
+    if count == 0:
+        return canvas
+    np_rng = _numpy_rng(rng)
+
+    sf = honses["size_factor"]
+    cx = honses["center_x"]
+    cy = honses["center_y"]
+
+    # Base dimensions
+    body_length = 200 * honses["body_length"] * sf
+    body_height = 80 * honses["body_height"] * sf
+    neck_length = 100 * honses["neck_length"] * sf
+    neck_thickness = 40 * honses["neck_thickness"] * sf
+    head_size = 60 * honses["head_size"] * sf
+    leg_length = 120 * honses["leg_length"] * sf
+    leg_thickness = 15 * honses["leg_thickness"] * sf
+
+    # Body
+    body_left = cx - body_length / 2
+    body_top = cy - body_height / 2
+    body_bottom = body_top + body_height
+    body = np.stack([body_left, body_top, body_left + body_length, body_bottom], axis=-1)
+
+    # Neck
+    neck_start_x = body_left + body_length * 0.8
+    neck_start_y = body_top + body_height * 0.3
+    neck_rad = np.radians(honses["neck_angle"])
+    neck_end_x = neck_start_x + np.sin(neck_rad) * neck_length
+    neck_end_y = neck_start_y - np.cos(neck_rad) * neck_length
+    neck_width = neck_thickness * 0.8
+    neck_perp = neck_rad + np.pi / 2
+    perp_cos = np.cos(neck_perp)
+    perp_sin = np.sin(neck_perp)
+    neck = _points(
+        neck_start_x + perp_cos * neck_width, neck_start_y + perp_sin * neck_width,
+        neck_start_x - perp_cos * neck_width, neck_start_y - perp_sin * neck_width,
+        neck_end_x - perp_cos * (neck_width * 0.9), neck_end_y - perp_sin * (neck_width * 0.9),
+        neck_end_x + perp_cos * (neck_width * 0.9), neck_end_y + perp_sin * (neck_width * 0.9),
+    )
+
+    # Head
+    head_rad = neck_rad + np.radians(honses["head_angle"])
+    head_x = neck_end_x + np.sin(head_rad) * (head_size * 0.3)
+    head_y = neck_end_y - np.cos(head_rad) * (head_size * 0.3)
+    head = _bbox(head_x, head_y, head_size / 2, head_size * 0.7 / 2)
+
+    # Nose
+    nose_width = head_size * 0.4
+    nose_x = head_x + np.cos(head_rad) * (head_size * 0.9)
+    nose_y = head_y + np.sin(head_rad) * (head_size * 0.9)
+    nose_bridge = _points(
+        head_x + head_size / 4, head_y,
+        head_x - head_size / 4, head_y,
+        nose_x - nose_width / 3, nose_y,
+        nose_x + nose_width / 3, nose_y,
+    )
+    nose = _bbox(nose_x, nose_y, nose_width / 2, nose_width / 3)
+
+    # Eyes: outer white, iris and pupil boxes (which are used depends on the style)
+    eye_size = head_size * 0.15
+    eye_x = head_x + head_size * 0.15
+    eye_y = head_y - head_size * 0.15
+    eye_outer = _bbox(eye_x, eye_y, eye_size, eye_size)
+    eye_half = _bbox(eye_x, eye_y, eye_size / 2, eye_size / 2)
+    eye_iris = _bbox(eye_x, eye_y, eye_size * 0.7, eye_size * 0.7)
+    eye_pupil = _bbox(eye_x, eye_y, eye_size * 0.3, eye_size * 0.3)
+
+    # Nostrils and mouth
+    nostril_size = head_size * 0.08
+    nostril_spacing = nostril_size * 2
+    nostril_left = _bbox(nose_x - nostril_spacing / 2, nose_y, nostril_size / 2, nostril_size / 2)
+    nostril_right = _bbox(nose_x + nostril_spacing / 2, nose_y, nostril_size / 2, nostril_size / 2)
+    mouth_length = nose_width * 0.6
+    mouth_y = nose_y + nose_width / 4
+    mouth = _points(nose_x - mouth_length / 2, mouth_y, nose_x + mouth_length / 2, mouth_y)
+    mouth_width = np.maximum(1, (sf * 2).astype(int))
+
+    # Ears
+    ear_size = head_size * 0.25
+    ear_y = head_y - head_size * 0.3
+    ears = []
+    for ear_x in (head_x - head_size * 0.2, head_x + head_size * 0.2):
+        ears.append(_points(
+            ear_x, ear_y,
+            ear_x - ear_size, ear_y - ear_size * 1.5,
+            ear_x + ear_size, ear_y - ear_size * 1.5,
+        ))
+
+    # Mane: one row of strands per honse, padded to the densest mane
+    mane_length = neck_length * honses["mane_length"] * 0.5
+    mane_counts = (10 * honses["mane_density"]).astype(int)
+    mane_style = honses["mane_style"]
+    # Braided manes have twice as many points as the other styles
+    mane_points = np.where(mane_style == MANE_STYLES.index("braided"), mane_counts * 2, mane_counts)
+    width = max(int(mane_points.max()), 1)
+    t = _strand_t(mane_points, width)
+    mane_x = neck_start_x[:, None] + t * (neck_end_x - neck_start_x)[:, None]
+    mane_y = neck_start_y[:, None] + t * (neck_end_y - neck_start_y)[:, None]
+    jitter = np.radians(np.where((mane_style == MANE_STYLES.index("short"))[:, None],
+                                 np_rng.uniform(-10, 10, (count, width)),
+                                 np_rng.uniform(-20, 20, (count, width))))
+    ml = mane_length[:, None]
+    strand_length = np.select(
+        [(mane_style == MANE_STYLES.index("flowing"))[:, None],
+         (mane_style == MANE_STYLES.index("short"))[:, None],
+         (mane_style == MANE_STYLES.index("mohawk"))[:, None]],
+        [ml * (1 - 0.5 * np.abs(2 * t - 1)), ml * 0.3, ml * (0.7 + 0.3 * np.sin(t * np.pi))],
+        default=ml * 0.2,
+    )
+    strand_angle = np.select(
+        [(mane_style == MANE_STYLES.index("mohawk"))[:, None],
+         (mane_style == MANE_STYLES.index("braided"))[:, None]],
+        [np.broadcast_to((neck_rad - np.pi / 2)[:, None], t.shape),
+         np.broadcast_to(neck_perp[:, None], t.shape)],
+        default=neck_perp[:, None] + jitter,
+    )
+    # Braids zigzag from side to side of the neck
+    side = np.where(np.arange(width) % 2 == 0, 1.0, -1.0)[None, :]
+    braided = (mane_style == MANE_STYLES.index("braided"))[:, None]
+    strand_length = np.where(braided, strand_length * side, strand_length)
+    mane_end_x = mane_x + np.cos(strand_angle) * strand_length
+    mane_end_y = mane_y + np.sin(strand_angle) * strand_length
+    mane_thin = np.maximum(1, (2 * sf).astype(int))
+    mane_thick = np.maximum(2, (3 * sf).astype(int))
+    mane_braid = np.maximum(3, (5 * sf).astype(int))
+
+    # Legs: (K, 4) arrays
+    pose = honses["leg_pose"]
+    leg_angles = LEG_POSE_ANGLES[np.clip(pose, 0, None)]
+    leg_x = body_left[:, None] + body_length[:, None] * LEG_OFFSETS[None, :]
+    leg_y = np.repeat(body_bottom[:, None], 4, axis=1)
+    rearing = pose == LEG_POSES.index("rearing")
+    leg_y[rearing, :2] -= (body_height[rearing] * 0.3)[:, None]
+    leg_end_x = leg_x + np.sin(leg_angles) * leg_length[:, None]
+    leg_end_y = leg_y + np.cos(leg_angles) * leg_length[:, None]
+    hoof_size = (leg_thickness * 0.8)[:, None]
+    hooves = _bbox(leg_end_x, leg_end_y, hoof_size, hoof_size / 2)
+    leg_width = np.maximum(1, leg_thickness.astype(int))
+
+    # Tail
+    tail_x = body_left + body_length * 0.1
+    tail_y = body_top + body_height * 0.4
+    tail_length = body_length * 0.6 * honses["tail_length"]
+    tail_rad = np.radians(honses["tail_angle"])
+    tail_thickness = honses["tail_thickness"]
+    tail_cos = np.cos(tail_rad)
+    tail_sin = np.sin(tail_rad)
+    tail_perp = tail_rad + np.pi / 2
+
+    # Flowing: up to 7 * thickness strands at jittered angles and lengths
+    tail_counts = (7 * tail_thickness).astype(int)
+    tail_width = max(int(tail_counts.max()), 1)
+    tail_angles = tail_rad[:, None] + np.radians(np_rng.uniform(-20, 20, (count, tail_width)))
+    tail_lengths = tail_length[:, None] * (0.7 + 0.3 * np_rng.random((count, tail_width)))
+    tail_strand_x = tail_x[:, None] - np.cos(tail_angles) * tail_lengths
+    tail_strand_y = tail_y[:, None] + np.sin(tail_angles) * tail_lengths
+    tail_strand_width = np.maximum(1, (2 * sf * tail_thickness).astype(int))
+
+    # Short: a triangle
+    short_end_x = tail_x - tail_cos * tail_length * 0.4
+    short_end_y = tail_y + tail_sin * tail_length * 0.4
+    short_width = body_height * 0.2 * tail_thickness
+    short_tail = _points(
+        tail_x, tail_y,
+        short_end_x + np.cos(tail_perp) * short_width, short_end_y + np.sin(tail_perp) * short_width,
+        short_end_x - np.cos(tail_perp) * short_width, short_end_y - np.sin(tail_perp) * short_width,
+    )
+
+    # Braided: a 10-point zigzag
+    steps = (np.arange(10) / 9)[None, :]
+    zigzag = (tail_length * 0.1)[:, None] * np.where(np.arange(10) % 2 == 0, 1.0, -1.0)[None, :]
+    braid_x = (tail_x[:, None] - tail_cos[:, None] * tail_length[:, None] * steps
+               + np.cos(tail_perp)[:, None] * zigzag)
+    braid_y = (tail_y[:, None] + tail_sin[:, None] * tail_length[:, None] * steps
+               + np.sin(tail_perp)[:, None] * zigzag)
+    braid_width = np.maximum(3, (5 * sf * tail_thickness).astype(int))
+
+    # Convert everything to Python lists once, then emit primitives honse by honse
+    body_l = body.tolist()
+    neck_l = neck.tolist()
+    head_l = head.tolist()
+    bridge_l = nose_bridge.tolist()
+    nose_l = nose.tolist()
+    eye_outer_l, eye_half_l = eye_outer.tolist(), eye_half.tolist()
+    eye_iris_l, eye_pupil_l = eye_iris.tolist(), eye_pupil.tolist()
+    nostril_left_l, nostril_right_l = nostril_left.tolist(), nostril_right.tolist()
+    mouth_l = mouth.tolist()
+    ears_l = [ear.tolist() for ear in ears]
+    mane_x_l, mane_y_l = mane_x.tolist(), mane_y.tolist()
+    mane_end_x_l, mane_end_y_l = mane_end_x.tolist(), mane_end_y.tolist()
+    leg_x_l, leg_y_l = leg_x.tolist(), leg_y.tolist()
+    leg_end_x_l, leg_end_y_l = leg_end_x.tolist(), leg_end_y.tolist()
+    hooves_l = hooves.tolist()
+    tail_x_l, tail_y_l = tail_x.tolist(), tail_y.tolist()
+    tail_strand_x_l, tail_strand_y_l = tail_strand_x.tolist(), tail_strand_y.tolist()
+    short_tail_l = short_tail.tolist()
+    braid_l = np.stack([braid_x, braid_y], axis=-1).tolist()
+    body_colors = [tuple(c) for c in honses["body_color"].tolist()]
+    mane_colors = [tuple(c) for c in honses["mane_color"].tolist()]
+    eye_colors = [tuple(c) for c in honses["eye_color"].tolist()]
+
+    items = canvas.items
+    for k in range(count):
+        body_color = body_colors[k]
+        mane_color = mane_colors[k]
+
+        items.append(("ellipse", body_l[k], body_color, 0))
+        items.append(("polygon", neck_l[k], body_color, 0))
+        items.append(("ellipse", head_l[k], body_color, 0))
+        items.append(("polygon", bridge_l[k], body_color, 0))
+        items.append(("ellipse", nose_l[k], body_color, 0))
+
+        eye_style = honses["eye_style"][k]
+        if eye_style == 0:
+            items.append(("ellipse", eye_half_l[k], eye_colors[k], 0))
+        elif eye_style == 1:
+            items.append(("ellipse", eye_outer_l[k], EYE_WHITE, 0))
+            items.append(("ellipse", eye_half_l[k], eye_colors[k], 0))
+        elif eye_style == 2:
+            items.append(("ellipse", eye_outer_l[k], EYE_WHITE, 0))
+            items.append(("ellipse", eye_iris_l[k], IRIS_COLOR, 0))
+            items.append(("ellipse", eye_pupil_l[k], eye_colors[k], 0))
+
+        items.append(("ellipse", nostril_left_l[k], NOSTRIL_COLOR, 0))
+        items.append(("ellipse", nostril_right_l[k], NOSTRIL_COLOR, 0))
+        items.append(("line", mouth_l[k], NOSTRIL_COLOR, int(mouth_width[k])))
+        items.append(("polygon", ears_l[0][k], body_color, 0))
+        items.append(("polygon", ears_l[1][k], body_color, 0))
+
+        n = int(mane_points[k])
+        mxs, mys = mane_x_l[k], mane_y_l[k]
+        exs, eys = mane_end_x_l[k], mane_end_y_l[k]
+        style = mane_style[k]
+        if style == 0:
+            width_k = int(mane_thin[k])
+            for i in range(n):
+                items.append(("line", [mxs[i], mys[i], exs[i], eys[i]], mane_color, width_k))
+        elif style == 1:
+            polygon = []
+            for i in range(n):
+                polygon += [mxs[i], mys[i], exs[i], eys[i]]
+            if polygon:
+                items.append(("polygon", polygon, mane_color, 0))
+        elif style == 2:
+            width_k = int(mane_thick[k])
+            for i in range(n):
+                items.append(("line", [mxs[i], mys[i], exs[i], eys[i]], mane_color, width_k))
+        elif style == 3:
+            width_k = int(mane_braid[k])
+            for i in range(n - 1):
+                items.append(("line", [exs[i], eys[i], exs[i + 1], eys[i + 1]], mane_color, width_k))
+
+        if pose[k] >= 0:
+            width_k = int(leg_width[k])
+            for i in range(4):
+                items.append(("line", [leg_x_l[k][i], leg_y_l[k][i], leg_end_x_l[k][i], leg_end_y_l[k][i]],
+                              body_color, width_k))
+                items.append(("ellipse", hooves_l[k][i], HOOF_COLOR, 0))
+
+        style = honses["tail_style"][k]
+        if style == 0:
+            width_k = int(tail_strand_width[k])
+            for i in range(int(tail_counts[k])):
+                items.append(("line", [tail_x_l[k], tail_y_l[k], tail_strand_x_l[k][i], tail_strand_y_l[k][i]],
+                              mane_color, width_k))
+        elif style == 1:
+            items.append(("polygon", short_tail_l[k], mane_color, 0))
+        elif style == 2:
+            width_k = int(braid_width[k])
+            points = braid_l[k]
+            for i in range(9):
+                items.append(("line", points[i] + points[i + 1], mane_color, width_k))
+
+    return canvas
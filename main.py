@@ -3,81 +3,386 @@ Flask app for generating and displaying honses (horses).
 This app allows users to generate random honses or customize parameters.
 """
 
-from flask import Flask, render_template, request, send_file, jsonify
-from PIL import Image, ImageDraw
-import io
+from flask import Flask, render_template, request, send_file, jsonify, abort, url_for
+from PIL import ImageColor
 import base64
+import hmac
+import io
 import random
+import ast
 import os
 import json
-from draw_honse import draw_honse, generate_random_honse_params
+import queue
+import threading
+import time
+import zipfile
+from collections import Counter
+from contextlib import contextmanager
+from draw_honse import (build_honse_display_list, generate_random_honse_params,
+                        merge_default_params, render_honse_batch, get_render_pool)
+from backgrounds import get_library, field_display_list
+from herd_geometry import place_herd, build_herd_display_list
+from rasterizers import get_rasterizer
+from encoding import (encode_image, negotiate_format, normalize_format, mime_type, extension,
+                      VECTOR_FORMATS, encode_animation, normalize_animation_format)
+from svg import render_svg
+from tiled_herd import cached_poster, stream_png
+from animation import render_gait_frames
+from render_cache import RenderCache, canonical_key
+from persistence import create_writer
+from artifact_store import ArtifactStore
+from metrics import (MetricsRegistry, SharedSnapshots, process_alive, start_timer, finish_timer,
+                     current_timer, timed, label)
+from profiler import SamplingProfiler, collapsed
+from render_scheduler import RenderScheduler, SchedulerBusy
+from random_pool import RandomHonsePool
 
 app = Flask(__name__)
 
+# Bump when a change to the drawing code alters the output for the same seed,
+# so cached /honse/<seed> and /herd/<seed> responses get new ETags
+RENDER_VERSION = 2
+
+# Full canvas sizes; smaller sizes scale the honses down with the canvas
+HONSE_CANVAS = (800, 600)
+HERD_CANVAS = (1200, 800)
+FULL_CANVAS = {'honse': HONSE_CANVAS, 'herd': HERD_CANVAS}
+
+# Named output sizes, as a fraction of the full canvas width
+SIZE_PRESETS = {'thumbnail': 0.25, 'medium': 0.5, 'full': 1.0}
+
+# Render scheduling priority by kind of render; lower numbers get a slot first
+RENDER_PRIORITY = {'honse': 0, 'gait': 1, 'herd': 2, 'batch': 3, 'poster': 3}
+
+# Rasterizer backends a request may ask for
+REQUEST_RASTERIZERS = ('pillow', 'aggdraw')
+
+# Honse params that label the timing metrics, so expensive style combinations stand out
+STYLE_LABELS = ('mane_style', 'tail_style', 'eye_style', 'leg_pose')
+
+# Number of prebuilt herd backgrounds kept in memory, and the seed they are built from
+app.config['HERD_BACKGROUNDS'] = int(os.environ.get('HONSE_HERD_BACKGROUNDS', 16))
+app.config['BACKGROUND_SEED'] = int(os.environ.get('HONSE_BACKGROUND_SEED', 0))
+
+# Image encoding: default output format and compression settings
+app.config['IMAGE_FORMAT'] = os.environ.get('HONSE_IMAGE_FORMAT', 'png')
+app.config['PNG_COMPRESS_LEVEL'] = int(os.environ.get('HONSE_PNG_COMPRESS_LEVEL', 6))
+app.config['WEBP_METHOD'] = int(os.environ.get('HONSE_WEBP_METHOD', 4))
+app.config['JPEG_QUALITY'] = int(os.environ.get('HONSE_JPEG_QUALITY', 90))
+
+# Batch rendering: process pool size and largest batch accepted
+app.config['BATCH_WORKERS'] = int(os.environ.get('HONSE_BATCH_WORKERS', os.cpu_count() or 1))
+app.config['BATCH_MAX_HONSES'] = int(os.environ.get('HONSE_BATCH_MAX_HONSES', 500))
+
+# Poster herds: largest canvas (in pixels) and herd accepted, the tile size, and the
+# most bytes of built posters each process (server or render pool) keeps for reuse
+app.config['POSTER_MAX_PIXELS'] = int(os.environ.get('HONSE_POSTER_MAX_PIXELS', 100_000_000))
+app.config['POSTER_MAX_HONSES'] = int(os.environ.get('HONSE_POSTER_MAX_HONSES', 10000))
+app.config['POSTER_TILE_SIZE'] = int(os.environ.get('HONSE_POSTER_TILE_SIZE', 512))
+app.config['POSTER_CACHE_BYTES'] = int(os.environ.get('HONSE_POSTER_CACHE_BYTES', 128 * 1024 * 1024))
+
+# Rasterizer backend used unless a request asks for another ('pillow' or 'aggdraw');
+# the server may also use 'pillow-supersampled', which requests can't pick as it costs ~10x more
+app.config['RASTERIZER'] = os.environ.get('HONSE_RASTERIZER', 'pillow')
+
+# Smallest width, and largest multiple of the full width, a render can ask for
+app.config['MIN_RENDER_WIDTH'] = int(os.environ.get('HONSE_MIN_RENDER_WIDTH', 32))
+app.config['MAX_RENDER_SCALE'] = float(os.environ.get('HONSE_MAX_RENDER_SCALE', 2.0))
+
+# Widths in pixels are rounded to a multiple of 1/RENDER_WIDTH_STEPS of the full
+# width (the presets are multiples of it), so few canvas sizes ever need backgrounds
+app.config['RENDER_WIDTH_STEPS'] = int(os.environ.get('HONSE_RENDER_WIDTH_STEPS', 8))
+
+# Background libraries kept in memory (one per kind and canvas size), and the most bytes they may hold
+app.config['BACKGROUND_LIBRARIES'] = int(os.environ.get('HONSE_BACKGROUND_LIBRARIES', 8))
+app.config['BACKGROUND_CACHE_BYTES'] = int(os.environ.get('HONSE_BACKGROUND_CACHE_BYTES', 256 * 1024 * 1024))
+
+# Gait animations: default format, frame count and speed, and the most frames allowed
+app.config['ANIMATION_FORMAT'] = os.environ.get('HONSE_ANIMATION_FORMAT', 'gif')
+app.config['ANIMATION_FRAMES'] = int(os.environ.get('HONSE_ANIMATION_FRAMES', 12))
+app.config['ANIMATION_FPS'] = int(os.environ.get('HONSE_ANIMATION_FPS', 12))
+app.config['ANIMATION_MAX_FRAMES'] = int(os.environ.get('HONSE_ANIMATION_MAX_FRAMES', 48))
+
+# Default response mode for render routes: 'json', 'url' or 'binary'
+app.config['RESPONSE_MODE'] = os.environ.get('HONSE_RESPONSE_MODE', 'json')
+
+# Render cache limits for /customize_honse
+app.config['RENDER_CACHE_ENTRIES'] = int(os.environ.get('HONSE_RENDER_CACHE_ENTRIES', 256))
+app.config['RENDER_CACHE_BYTES'] = int(os.environ.get('HONSE_RENDER_CACHE_BYTES', 64 * 1024 * 1024))
+render_cache = RenderCache(app.config['RENDER_CACHE_ENTRIES'], app.config['RENDER_CACHE_BYTES'])
+
+# Write-behind persistence of generated images and params
+app.config['WRITE_QUEUE_SIZE'] = int(os.environ.get('HONSE_WRITE_QUEUE_SIZE', 256))
+app.config['WRITE_BATCH_SIZE'] = int(os.environ.get('HONSE_WRITE_BATCH_SIZE', 32))
+app.config['WRITE_FSYNC'] = os.environ.get('HONSE_WRITE_FSYNC', '1') != '0'
+writer = create_writer(max_pending=app.config['WRITE_QUEUE_SIZE'],
+                       batch_size=app.config['WRITE_BATCH_SIZE'],
+                       fsync=app.config['WRITE_FSYNC'])
+
+# Artifact store: sharded under static/images, indexed in the instance folder
+app.config['STORE_MAX_BYTES'] = int(os.environ.get('HONSE_STORE_MAX_BYTES', 1024 * 1024 * 1024))
+app.config['STORE_DB'] = os.environ.get('HONSE_STORE_DB', os.path.join(app.instance_path, 'artifacts.sqlite3'))
+# Seconds to wait for an image another worker has indexed but not yet written
+app.config['STORE_WRITE_WAIT'] = float(os.environ.get('HONSE_STORE_WRITE_WAIT', 2.0))
+store = ArtifactStore('static/images', app.config['STORE_DB'], writer,
+                      max_bytes=app.config['STORE_MAX_BYTES'], write_wait=app.config['STORE_WRITE_WAIT'])
+
+# Render admission control: renders running at once in this worker, renders
+# allowed to wait for a slot, and how long (seconds) one may wait before a 503
+app.config['RENDER_CONCURRENCY'] = int(os.environ.get('HONSE_RENDER_CONCURRENCY', 2))
+app.config['RENDER_QUEUE_SIZE'] = int(os.environ.get('HONSE_RENDER_QUEUE_SIZE', 16))
+app.config['RENDER_QUEUE_TIMEOUT'] = float(os.environ.get('HONSE_RENDER_QUEUE_TIMEOUT', 10))
+scheduler = RenderScheduler(app.config['RENDER_CONCURRENCY'], app.config['RENDER_QUEUE_SIZE'],
+                            app.config['RENDER_QUEUE_TIMEOUT'])
+
+# Pre-rendered random honses for /generate_random: how many are kept ready per
+# format and rasterizer (0 turns the pool off), and the most rendered per second
+app.config['RANDOM_POOL_DEPTH'] = int(os.environ.get('HONSE_RANDOM_POOL_DEPTH', 8))
+app.config['RANDOM_POOL_RATE'] = float(os.environ.get('HONSE_RANDOM_POOL_RATE', 10))
+
+# Per-stage timing: Server-Timing headers on every response, histograms at /metrics
+app.config['SERVER_TIMING'] = os.environ.get('HONSE_SERVER_TIMING', '1') != '0'
+
+# Each worker process keeps its own metrics and profiler. With a directory set
+# (gunicorn.conf.py sets one) they write snapshots there every interval seconds,
+# and /metrics and /profiler merge every worker's, whichever worker serves them.
+# Without one, they describe only the process that serves the request.
+app.config['METRICS_DIR'] = os.environ.get('HONSE_METRICS_DIR') or None
+app.config['METRICS_PUBLISH_INTERVAL'] = float(os.environ.get('HONSE_METRICS_PUBLISH_INTERVAL', 1.0))
+shared_snapshots = SharedSnapshots(app.config['METRICS_DIR']) if app.config['METRICS_DIR'] else None
+metrics_registry = MetricsRegistry(shared_snapshots)
+stage_seconds = metrics_registry.histogram('honse_stage_seconds', 'Time spent in each stage of a request')
+request_seconds = metrics_registry.histogram('honse_request_seconds', 'Time spent handling a request')
+metrics_registry.gauges('honse_render_cache', 'Render cache', render_cache.stats)
+metrics_registry.gauges('honse_store', 'Artifact store', store.stats)
+metrics_registry.gauges('honse_writer', 'Write-behind writer', writer.stats)
+metrics_registry.gauges('honse_scheduler', 'Render scheduler', scheduler.stats)
+
+# Sampling profiler: seconds between samples, and whether each worker starts it.
+# With a token set it can also be switched on and off at /profiler/start and
+# /profiler/stop by requests sending it in an X-Profiler-Token header
+app.config['PROFILER_INTERVAL'] = float(os.environ.get('HONSE_PROFILER_INTERVAL', 0.005))
+app.config['PROFILER'] = os.environ.get('HONSE_PROFILER', '0') != '0'
+app.config['PROFILER_TOKEN'] = os.environ.get('HONSE_PROFILER_TOKEN') or None
+profiler = SamplingProfiler(app.config['PROFILER_INTERVAL'])
+profiler_sync = {'generation': None, 'published': None}
+profiler_sync_lock = threading.Lock()
+
+# Build backgrounds and load codecs at import (see warm_up), rather than on the first requests
+app.config['WARM_START'] = os.environ.get('HONSE_WARM_START', '1') != '0'
+
 # Ensure the static directory exists
 os.makedirs('static', exist_ok=True)
 os.makedirs('static/images', exist_ok=True)
 
+@app.before_request
+def start_request_timer():
+    """Start timing the stages of this request."""
+    start_timer()
+
+@app.after_request
+def record_request_timing(response):
+    """Add the stage timings to the metrics and, if enabled, to a Server-Timing header."""
+    timer = current_timer()
+    if timer is None:
+        return response
+    finish_timer()
+    total = timer.elapsed()
+    
+    # The route pattern, not the URL, so seeds and filenames don't each get a series
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    for stage, seconds in timer.stages.items():
+        stage_seconds.observe(seconds, route=route, stage=stage, **timer.labels)
+    request_seconds.observe(total, route=route, status=response.status_code, **timer.labels)
+    
+    if app.config['SERVER_TIMING']:
+        response.headers['Server-Timing'] = timer.server_timing(total)
+    return response
+
+def label_styles(params):
+    """Label this request's metrics with a honse's styles."""
+    label(**{key: params[key] for key in STYLE_LABELS if key in params})
+
 @app.route('/')
 def index():
     """Render the main page."""
     return render_template('index.html')
 
-@app.route('/generate_random', methods=['POST'])
-def generate_random():
-    """Generate a random honse and return the image."""
-    # Create a new image
-    width, height = 800, 600
-    image = Image.new('RGB', (width, height), color=(135, 206, 235))  # Sky blue
-    draw = ImageDraw.Draw(image)
+@contextmanager
+def render_slot(kind):
+    """Hold one of the worker's render slots, waiting by kind's priority; raises SchedulerBusy."""
+    with timed('queue'):
+        ticket = scheduler.acquire(RENDER_PRIORITY[kind])
+    try:
+        yield
+    finally:
+        scheduler.release(ticket)
+
+def background_library(width, height, kind):
+    """Return the prebuilt background library for the given canvas size."""
+    # Herd layouts are picked for the full canvas, so every size shows the same scene
+    return get_library(width, height, kind=kind,
+                       size=app.config['HERD_BACKGROUNDS'],
+                       seed=app.config['BACKGROUND_SEED'],
+                       reference_size=HERD_CANVAS if kind == 'herd' else None,
+                       max_libraries=app.config['BACKGROUND_LIBRARIES'],
+                       max_bytes=app.config['BACKGROUND_CACHE_BYTES'])
+
+def canvas_size(full_size, size=None, width=None):
+    """
+    Return the (width, height) to render at, keeping the full canvas's aspect ratio.
     
-    # Draw grass
-    draw.rectangle([(0, height*0.7), (width, height)], fill=(34, 139, 34))
+    Args:
+        full_size: (width, height) of the full canvas
+        size: a SIZE_PRESETS name, or None
+        width: a width in pixels, used when size is None; rounded to the
+            nearest 1/RENDER_WIDTH_STEPS of the full width
     
-    # Generate random parameters
-    params = generate_random_honse_params()
+    Raises:
+        ValueError: for an unknown preset or a width outside the allowed range
+    """
+    full_width, full_height = full_size
+    if size is not None:
+        if size not in SIZE_PRESETS:
+            raise ValueError(f"Unknown size '{size}' (choose from {', '.join(SIZE_PRESETS)})")
+        width = round(full_width * SIZE_PRESETS[size])
+    elif width is None:
+        return full_size
     
-    # Draw the honse
-    used_params = draw_honse(draw, width/2, height*0.7, params, 1.0)
+    width = int(width)
+    max_width = int(full_width * app.config['MAX_RENDER_SCALE'])
+    if not app.config['MIN_RENDER_WIDTH'] <= width <= max_width:
+        raise ValueError(f"Width must be between {app.config['MIN_RENDER_WIDTH']} and {max_width}")
+    if size is None:
+        steps = app.config['RENDER_WIDTH_STEPS']
+        width = round(max(1, round(width * steps / full_width)) * full_width / steps)
+    return width, round(width * full_height / full_width)
+
+def request_canvas(data, full_size):
+    """Pick the canvas size from the request's size/width fields (default: full size)."""
+    data = data or {}
+    size = data.get('size') or request.args.get('size')
+    width = data.get('width') or request.args.get('width')
+    # A numeric size is a width
+    if size is not None and str(size).isdigit():
+        size, width = None, size
+    try:
+        return canvas_size(full_size, size, width)
+    except ValueError as error:
+        abort(400, str(error))
+
+def request_format(data=None):
+    """Pick the output format from the request's format field or Accept header."""
+    requested = (data or {}).get('format') or request.args.get('format')
+    return negotiate_format(requested, request.accept_mimetypes, app.config['IMAGE_FORMAT'])
+
+def encoder_settings():
+    """Return the server's image compression settings."""
+    return {
+        'png_compress_level': app.config['PNG_COMPRESS_LEVEL'],
+        'webp_method': app.config['WEBP_METHOD'],
+        'jpeg_quality': app.config['JPEG_QUALITY'],
+    }
+
+def encode(image, fmt):
+    """Encode a rendered image once using the server's compression settings."""
+    with timed('encode'):
+        return encode_image(image, fmt, encoder_settings())
+
+def render_scene(display_list, library, index, fmt, rasterizer='pillow'):
+    """
+    Turn a scene's geometry into image bytes in the requested format.
     
-    # Save to a BytesIO object
-    img_io = io.BytesIO()
-    image.save(img_io, 'PNG')
-    img_io.seek(0)
+    SVG is written straight from the display list and background spec;
+    other formats rasterize onto a copy of the prebuilt background and encode.
+    """
+    if fmt in VECTOR_FORMATS:
+        with timed('svg'):
+            return render_svg(library.width, library.height, display_list, library.spec(index))
+    with timed('background'):
+        image = library.copy(index)
+    with timed('rasterize'):
+        get_rasterizer(rasterizer).render(image, display_list)
+    return encode(image, fmt)
+
+def save_artifact(kind, image_bytes, fmt, params=None, recipe=None):
+    """
+    Store an encoded image (and optionally its params) in the artifact store.
     
-    # Convert to base64 for embedding in HTML
-    img_base64 = base64.b64encode(img_io.getvalue()).decode('utf-8')
+    A recipe (see render_recipe) is stored next to the image so other
+    sizes of it can be rendered later.
     
-    # Save parameters for later reference
-    honse_id = random.randint(10000, 99999)
-    with open(f'static/images/honse_{honse_id}.json', 'w') as f:
-        json.dump(used_params, f)
+    Returns:
+        (artifact_id, image filename)
+    """
+    with timed('store'):
+        artifact_id, filename = store.put(kind, image_bytes, extension(fmt))
+        if params is not None:
+            store.put(kind, json.dumps(params).encode('utf-8'), 'json', artifact_id)
+        if recipe is not None:
+            store.put(kind, json.dumps(recipe).encode('utf-8'), 'json', artifact_id, variant='recipe')
+    return artifact_id, filename
+
+def variant_urls(filename):
+    """Return the URL of every named size of a saved image."""
+    return {name: url_for('serve_image', filename=filename, size=name) for name in SIZE_PRESETS}
+
+def saved_variant(filename, size):
+    """
+    Return the filename of a named size of a saved image, rendering it on first use.
     
-    # Save the image
-    image.save(f'static/images/honse_{honse_id}.png')
+    Variants are stored with the artifact (e.g. honse_<id>_thumbnail.png),
+    so each size is rendered at most once and evicted together with it.
+    """
+    name, dot_ext = os.path.splitext(filename)
+    kind, _, artifact_id = name.partition('_')
+    fmt = normalize_format(dot_ext[1:])
+    if kind not in FULL_CANVAS or not artifact_id or '_' in artifact_id or fmt is None:
+        abort(404)
     
-    return jsonify({
-        'image': f'data:image/png;base64,{img_base64}',
-        'honse_id': honse_id,
-        'params': used_params
-    })
-
-@app.route('/customize_honse', methods=['POST'])
-def customize_honse():
-    """Generate a honse with custom parameters."""
-    # Get parameters from the request
-    data = request.json
-    params = data.get('params', {})
+    recipe = store.read(f'{kind}_{artifact_id}_recipe.json')
+    if recipe is None:
+        abort(404)  # Saved before recipes, or evicted
+    recipe = json.loads(recipe)
     
-    # Create a new image
-    width, height = 800, 600
-    image = Image.new('RGB', (width, height), color=(135, 206, 235))
-    draw = ImageDraw.Draw(image)
+    try:
+        target = canvas_size(FULL_CANVAS[kind], size)
+    except ValueError as error:
+        abort(400, str(error))
+    if list(target) == recipe['size']:
+        return filename
     
-    # Draw grass
-    draw.rectangle([(0, height*0.7), (width, height)], fill=(34, 139, 34))
+    variant = f'{kind}_{artifact_id}_{size}.{dot_ext[1:]}'
+    if store.lookup(variant) is None:
+        with render_slot(kind):
+            image_bytes = render_recipe(recipe, target, fmt)
+        store.put(kind, image_bytes, dot_ext[1:], artifact_id, variant=size)
+    return variant
+
+def send_saved_file(filename, **kwargs):
+    """Send a saved file, from memory if this worker's write is still in flight."""
+    path = store.lookup(filename)
+    if path is None:
+        # Images saved before the artifact store live directly in static/images
+        path = os.path.join('static/images', filename)
+        if not os.path.isfile(path):
+            abort(404)
+        return send_file(os.path.abspath(path), **kwargs)
     
-    # Convert string parameters to appropriate types
+    data = store.pending(path)
+    if data is not None:
+        return send_file(io.BytesIO(data), download_name=filename, **kwargs)
+    if not store.wait_for_file(path):
+        # Saved by another worker whose write hasn't landed (or failed)
+        response = jsonify({'error': 'Image is still being saved, try again shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        abort(response)
+    # Absolute: send_file resolves relative paths against the app's root, not the working directory
+    return send_file(os.path.abspath(path), **kwargs)
+
+def parse_honse_params(params):
+    """Convert honse parameters sent as strings (e.g. from the form) to their real types."""
     for key in params:
         if key in ['body_length', 'body_height', 'neck_length', 'neck_thickness',
                   'head_size', 'leg_length', 'leg_thickness', 'tail_length',
@@ -94,29 +399,313 @@ def customize_honse():
                     params[key] = tuple(int(h[i:i+2], 16) for i in (0, 2, 4))
                 elif params[key].startswith('(') and params[key].endswith(')'):
                     # Tuple string
-                    params[key] = eval(params[key])
+                    params[key] = ast.literal_eval(params[key])
+    return params
+
+def check_honse_colors(params):
+    """Turn JSON colour lists in params into tuples; raise ValueError for a colour the renderer can't draw."""
+    for key in ('body_color', 'mane_color', 'eye_color'):
+        value = params.get(key)
+        if value is None:
+            continue
+        if isinstance(value, str):
+            ImageColor.getrgb(value)
+        elif not (isinstance(value, (list, tuple)) and len(value) in (3, 4)
+                  and all(isinstance(c, int) and not isinstance(c, bool) and 0 <= c <= 255 for c in value)):
+            raise ValueError(f"{key} must be a colour name, #rrggbb or (r, g, b), not {value!r}")
+        else:
+            params[key] = tuple(value)
+
+def request_seed(data=None, default=None):
+    """Return the render seed from the request, or default (a fresh random one if None)."""
+    seed = (data or {}).get('seed')
+    if seed is None:
+        return random.getrandbits(32) if default is None else default
+    # Only whole numbers: int() would truncate 1.5 and turn True into 1
+    if isinstance(seed, int) and not isinstance(seed, bool):
+        return seed
+    if isinstance(seed, str) and seed.strip().removeprefix('-').isdecimal():
+        return int(seed)
+    abort(400, f"Seed must be an integer, not {seed!r}")
+
+def clamp_herd_size(num_honses):
+    """Limit the number of honses in a herd to between 1 and 10."""
+    return min(max(1, num_honses), 10)
+
+def request_rasterizer(data=None):
+    """Pick the rasterizer backend from the request's rasterizer field or the server default."""
+    requested = (data or {}).get('rasterizer') or request.args.get('rasterizer')
+    if requested is not None and str(requested).lower() not in REQUEST_RASTERIZERS:
+        abort(400, f"Unknown rasterizer '{requested}' (choose from {', '.join(REQUEST_RASTERIZERS)})")
+    name = requested or app.config['RASTERIZER']
+    try:
+        return get_rasterizer(name).name
+    except (ValueError, RuntimeError) as error:
+        abort(400, str(error))
+
+def render_custom_honse(params, rng, fmt='png', rasterizer='pillow', size=HONSE_CANVAS):
+    """Draw a honse with the given parameters on the field background and encode it."""
+    width, height = size
+    library = background_library(width, height, 'field')  # Sky and grass
+    
+    # Compute the honse's geometry at the canvas's scale, then rasterize it (or write it as SVG)
+    scale = width / HONSE_CANVAS[0]
+    with timed('geometry'):
+        display_list, used_params = build_honse_display_list(width/2, height*0.7, params, scale, rng)
+    label_styles(used_params)
+    return render_scene(display_list, library, 0, fmt, rasterizer), used_params
+
+def render_random_honse(rng, fmt='png', rasterizer='pillow', size=HONSE_CANVAS):
+    """Draw a random honse on the field background, using rng for every random choice."""
+    # Generate random parameters
+    with timed('params'):
+        params = generate_random_honse_params(rng)
+    return render_custom_honse(params, rng, fmt, rasterizer, size)
+
+def render_pooled_honse(variant):
+    """Render a random honse for the pool; variant is (format, rasterizer)."""
+    fmt, rasterizer = variant
+    seed = random.getrandbits(32)
+    image_bytes, used_params = render_random_honse(random.Random(seed), fmt, rasterizer)
+    return seed, image_bytes, used_params
+
+random_pool = RandomHonsePool(render_pooled_honse, app.config['RANDOM_POOL_DEPTH'],
+                              app.config['RANDOM_POOL_RATE'], scheduler)
+metrics_registry.gauges('honse_random_pool', 'Random honse pool', random_pool.stats)
+
+def render_herd(num_honses, rng, fmt='png', rasterizer='pillow', size=HERD_CANVAS):
+    """Draw a herd of random honses and encode it, using rng for every random choice."""
+    # Pick one of the prebuilt sky, hills and grass backgrounds
+    width, height = size
+    library = background_library(width, height, 'herd')
+    background = library.pick_index(rng)
+    
+    # Place the honses, then compute all their geometry in one vectorized pass
+    label(herd_size=num_honses)
+    with timed('geometry'):
+        honses, honses_params = place_herd(num_honses, width, height, rng,
+                                           scale=width / HERD_CANVAS[0])
+        display_list = build_herd_display_list(honses, rng)
+    return render_scene(display_list, library, background, fmt, rasterizer), honses_params
+
+def render_recipe(recipe, size, fmt):
+    """
+    Render a saved artifact again from its recipe, at any size.
+    
+    Recipes are dicts with the artifact's kind, seed, size and rasterizer, plus
+    'num_honses' for herds and 'params' for honses drawn from given parameters.
+    """
+    rng = random.Random(recipe['seed'])
+    rasterizer = recipe.get('rasterizer', 'pillow')
+    if recipe['kind'] == 'herd':
+        return render_herd(recipe['num_honses'], rng, fmt, rasterizer, size)[0]
+    if recipe.get('params') is None:
+        return render_random_honse(rng, fmt, rasterizer, size)[0]
+    params = {key: tuple(value) if isinstance(value, list) else value
+              for key, value in recipe['params'].items()}
+    return render_custom_honse(params, rng, fmt, rasterizer, size)[0]
+
+def request_animation(data=None):
+    """
+    Pick the animation format, frame count and frame rate from the request.
+    
+    Returns:
+        (format, frames, fps)
+    """
+    data = data or {}
+    requested = data.get('format') or request.args.get('format') or app.config['ANIMATION_FORMAT']
+    fmt = normalize_animation_format(requested)
+    if fmt is None:
+        abort(400, f"Unsupported animation format '{requested}' (choose from gif, apng, webp)")
+    
+    frames = data.get('frames') or request.args.get('frames') or app.config['ANIMATION_FRAMES']
+    fps = data.get('fps') or request.args.get('fps') or app.config['ANIMATION_FPS']
+    try:
+        frames, fps = int(frames), int(fps)
+    except (TypeError, ValueError):
+        abort(400, f"frames and fps must be integers, not {frames!r} and {fps!r}")
+    if not 1 <= frames <= app.config['ANIMATION_MAX_FRAMES']:
+        abort(400, f"An animation must have between 1 and {app.config['ANIMATION_MAX_FRAMES']} frames")
+    if not 1 <= fps <= 50:
+        abort(400, "fps must be between 1 and 50")
+    return fmt, frames, fps
+
+def render_gait(params, rng, fmt='gif', frames=12, fps=12, rasterizer='pillow', size=HONSE_CANVAS):
+    """Animate a honse's gait on the field background and encode the loop."""
+    width, height = size
+    with timed('background'):
+        background = background_library(width, height, 'field').copy(0)
+    with timed('frames'):
+        images, used_params = render_gait_frames(background, width/2, height*0.7, params,
+                                                 width / HONSE_CANVAS[0], rng, frames, rasterizer)
+    label_styles(used_params)
+    with timed('encode'):
+        return encode_animation(images, fmt, round(1000 / fps), encoder_settings()), used_params
+
+def render_response(data, image_bytes, fmt, payload):
+    """
+    Build the response for a render in the mode the client asked for.
+    
+    Modes (from a 'response' field or ?response=, default RESPONSE_MODE):
+        json: JSON with the image embedded as a base64 data URI
+        url: JSON with an image_url pointing at the saved image
+        binary: the image itself, with ids and filename in X- headers
+    """
+    mode = (data or {}).get('response') or request.args.get('response') or app.config['RESPONSE_MODE']
+    
+    if mode == 'binary':
+        response = app.response_class(image_bytes, mimetype=mime_type(fmt))
+        for key, value in payload.items():
+            if not isinstance(value, (dict, list)):
+                response.headers['X-' + key.replace('_', '-').title()] = str(value)
+        return response
+    
+    if mode == 'url':
+        return jsonify(dict(payload, image_url=url_for('serve_image', filename=payload['filename'])))
+    
+    with timed('base64'):
+        img_base64 = base64.b64encode(image_bytes).decode('ascii')
+        return jsonify(dict(payload, image=f'data:{mime_type(fmt)};base64,{img_base64}'))
+
+@app.route('/generate_random', methods=['POST'])
+def generate_random():
+    """Generate a random honse and return the image."""
+    data = request.get_json(silent=True)
+    fmt = request_format(data)
+    rasterizer = request_rasterizer(data)
+    size = request_canvas(data, HONSE_CANVAS)
+    
+    # Take a pre-rendered honse if one is ready (full size and no seed asked for);
+    # otherwise draw one, encoded once for both the response and the disk.
+    # Either way the seed reproduces it at /honse/<seed>.<format>
+    pooled = None
+    if (data or {}).get('seed') is None and size == HONSE_CANVAS:
+        pooled = random_pool.get((fmt, rasterizer))
+    if pooled is not None:
+        seed, image_bytes, used_params = pooled
+        label_styles(used_params)
+    else:
+        seed = request_seed(data)
+        with render_slot('honse'):
+            image_bytes, used_params = render_random_honse(random.Random(seed), fmt, rasterizer, size)
+    
+    # Save the image and its parameters for later reference
+    recipe = {'kind': 'honse', 'seed': seed, 'size': size, 'rasterizer': rasterizer}
+    honse_id, filename = save_artifact('honse', image_bytes, fmt, used_params, recipe)
+    
+    return render_response(data, image_bytes, fmt, {
+        'honse_id': honse_id,
+        'seed': seed,
+        'filename': filename,
+        'width': size[0],
+        'height': size[1],
+        'variants': variant_urls(filename),
+        'params': used_params
+    })
+
+@app.route('/customize_honse', methods=['POST'])
+def customize_honse():
+    """Generate a honse with custom parameters."""
+    # Get parameters from the request
+    data = request.json
+    params = data.get('params', {})
+    fmt = request_format(data)
+    rasterizer = request_rasterizer(data)
     
-    # Draw the honse
-    used_params = draw_honse(draw, width/2, height*0.7, params, 1.0)
+    # Convert string parameters and fill in defaults
+    with timed('params'):
+        params = merge_default_params(parse_honse_params(params))
     
-    # Save to a BytesIO object
-    img_io = io.BytesIO()
-    image.save(img_io, 'PNG')
-    img_io.seek(0)
+    # The same parameters and seed always draw the same honse
+    seed = request_seed(data, default=0)
+    size = request_canvas(data, HONSE_CANVAS)
+    cache_key = canonical_key(params, seed, format=fmt, width=size[0], height=size[1],
+                              rasterizer=rasterizer)
+    cached = render_cache.get(cache_key)
     
-    # Convert to base64 for embedding in HTML
-    img_base64 = base64.b64encode(img_io.getvalue()).decode('utf-8')
+    if cached is None:
+        # Draw the honse; the same bytes go to the response and to disk
+        with render_slot('honse'):
+            image_bytes, used_params = render_custom_honse(params, random.Random(seed), fmt,
+                                                           rasterizer, size)
+        render_cache.put(cache_key, (image_bytes, used_params), len(image_bytes))
+    else:
+        image_bytes, used_params = cached
     
     # Save parameters and image
-    honse_id = random.randint(10000, 99999)
-    with open(f'static/images/honse_{honse_id}.json', 'w') as f:
-        json.dump(used_params, f)
+    recipe = {'kind': 'honse', 'seed': seed, 'size': size, 'rasterizer': rasterizer,
+              'params': used_params}
+    honse_id, filename = save_artifact('honse', image_bytes, fmt, used_params, recipe)
     
-    image.save(f'static/images/honse_{honse_id}.png')
+    return render_response(data, image_bytes, fmt, {
+        'honse_id': honse_id,
+        'seed': seed,
+        'filename': filename,
+        'width': size[0],
+        'height': size[1],
+        'variants': variant_urls(filename),
+        'params': used_params
+    })
+
+@app.route('/honse_geometry', methods=['POST'])
+def honse_geometry():
+    """
+    Return a honse as a display list of primitives instead of an image.
+    
+    Takes the same body as /customize_honse. The browser draws the result on a
+    <canvas>, so the server only does the geometry math.
+    """
+    data = request.get_json(silent=True) or {}
+    with timed('params'):
+        params = merge_default_params(parse_honse_params(data.get('params', {})))
+    seed = request_seed(data, default=0)
     
+    width, height = request_canvas(data, HONSE_CANVAS)
+    with timed('geometry'):
+        display_list, used_params = build_honse_display_list(width/2, height*0.7, params,
+                                                             width / HONSE_CANVAS[0], random.Random(seed))
+    label_styles(used_params)
     return jsonify({
-        'image': f'data:image/png;base64,{img_base64}',
+        'width': width,
+        'height': height,
+        'background': field_display_list(width, height).to_json(),
+        'items': display_list.to_json(),
+        'seed': seed,
+        'params': used_params
+    })
+
+@app.route('/animate_honse', methods=['POST'])
+def animate_honse():
+    """
+    Generate a looping gait animation of a honse.
+    
+    Takes 'params' (a random honse is drawn from the seed if absent), 'seed',
+    'frames', 'fps', 'format' ('gif', 'apng' or 'webp') and 'size'. The gait
+    follows the honse's leg_pose.
+    """
+    data = request.get_json(silent=True) or {}
+    fmt, frames, fps = request_animation(data)
+    rasterizer = request_rasterizer(data)
+    size = request_canvas(data, HONSE_CANVAS)
+    seed = request_seed(data)
+    rng = random.Random(seed)
+    
+    with timed('params'):
+        if data.get('params') is not None:
+            params = merge_default_params(parse_honse_params(data['params']))
+        else:
+            params = generate_random_honse_params(rng)
+    
+    with render_slot('gait'):
+        animation_bytes, used_params = render_gait(params, rng, fmt, frames, fps, rasterizer, size)
+    honse_id, filename = save_artifact('honse', animation_bytes, fmt, used_params)
+    
+    return render_response(data, animation_bytes, fmt, {
         'honse_id': honse_id,
+        'seed': seed,
+        'filename': filename,
+        'frames': frames,
+        'fps': fps,
         'params': used_params
     })
 
@@ -125,96 +714,440 @@ def generate_herd():
     """Generate a herd of honses."""
     # Get the number of honses to generate
     data = request.json
-    num_honses = data.get('num_honses', 5)
-    num_honses = min(max(1, num_honses), 10)  # Limit between 1 and 10
-    
-    # Create a new image
-    width, height = 1200, 800
-    image = Image.new('RGB', (width, height), color=(135, 206, 235))
-    draw = ImageDraw.Draw(image)
-    
-    # Draw sky with gradient
-    for y in range(height):
-        t = y / height
-        r = int(135 * (1 - t) + 100 * t)
-        g = int(206 * (1 - t) + 150 * t)
-        b = int(235 * (1 - t) + 200 * t)
-        draw.line([(0, y), (width, y)], fill=(r, g, b))
-    
-    # Draw hills in the background
-    for i in range(3):
-        hill_height = random.uniform(0.2, 0.4)
-        hill_width = random.uniform(0.5, 1.5)
-        hill_x = random.uniform(-0.3, 0.7) * width
-        
-        hill_color = (
-            random.randint(30, 100),
-            random.randint(100, 160),
-            random.randint(30, 80)
-        )
-        
-        hill_points = []
-        for x in range(int(width * 1.5)):
-            dx = (x - hill_x) / (width * hill_width)
-            y = height * (0.7 - hill_height * (1 - dx*dx))
-            if 0 <= x < width and y < height:
-                hill_points.append((x, y))
+    num_honses = clamp_herd_size(data.get('num_honses', 5))
+    fmt = request_format(data)
+    rasterizer = request_rasterizer(data)
+    size = request_canvas(data, HERD_CANVAS)
+    
+    # Draw the herd, encoded once for both the response and the disk;
+    # the seed reproduces it at /herd/<seed>.<format>
+    seed = request_seed(data)
+    with render_slot('herd'):
+        image_bytes, honses_params = render_herd(num_honses, random.Random(seed), fmt, rasterizer, size)
+    
+    # Save the image
+    recipe = {'kind': 'herd', 'seed': seed, 'size': size, 'rasterizer': rasterizer,
+              'num_honses': num_honses}
+    herd_id, filename = save_artifact('herd', image_bytes, fmt, recipe=recipe)
+    
+    return render_response(data, image_bytes, fmt, {
+        'herd_id': herd_id,
+        'seed': seed,
+        'filename': filename,
+        'width': size[0],
+        'height': size[1],
+        'variants': variant_urls(filename)
+    })
+
+@app.route('/generate_batch', methods=['POST'])
+def generate_batch():
+    """
+    Render many honses in parallel and return them as a zip or multipart stream.
+    
+    The body holds either 'params' (a list of parameter dicts, with null for a
+    random honse and {} for the default one) or 'num_honses' random honses,
+    plus optional 'seed', 'format' and 'container' ('zip' or 'multipart').
+    Results come back in the same order as the input.
+    """
+    data = request.get_json(silent=True) or {}
+    fmt = request_format(data)
+    seed = request_seed(data)
+    
+    params_list = data.get('params')
+    if params_list is not None:
+        if not isinstance(params_list, list) or not all(p is None or isinstance(p, dict) for p in params_list):
+            abort(400, "params must be a list of parameter objects (or null for a random honse)")
+        try:
+            params_list = [parse_honse_params(dict(p)) if p is not None else None for p in params_list]
+            for params in params_list:
+                if params is not None:
+                    check_honse_colors(params)
+        except (TypeError, ValueError, SyntaxError) as error:
+            abort(400, f"Invalid honse params: {error}")
+        count = len(params_list)
+    else:
+        try:
+            count = int(data.get('num_honses', 10))
+        except (TypeError, ValueError):
+            abort(400, f"num_honses must be an integer, not {data.get('num_honses')!r}")
+    if not 1 <= count <= app.config['BATCH_MAX_HONSES']:
+        abort(400, f"A batch must contain between 1 and {app.config['BATCH_MAX_HONSES']} honses")
+    
+    rasterizer = request_rasterizer(data)
+    size = request_canvas(data, HONSE_CANVAS)
+    
+    def render_batch():
+        # Lazy: the honses are rendered as the results are read
+        return render_honse_batch(params_list, count, seed, fmt, encoder_settings(),
+                                  app.config['BATCH_WORKERS'], rasterizer, size)
+    
+    if data.get('container', 'zip') == 'multipart':
+        boundary = f'honse-batch-{seed}'
         
-        if hill_points:
-            hill_points.append((width, height))
-            hill_points.append((0, height))
-            draw.polygon(hill_points, fill=hill_color)
-    
-    # Draw grass
-    draw.rectangle([(0, height*0.7), (width, height)], fill=(34, 139, 34))
-    
-    # Draw grass tufts
-    for _ in range(100):
-        x = random.randint(0, width)
-        y = random.randint(int(height*0.7), height)
-        grass_height = random.randint(5, 15)
-        grass_color = (
-            random.randint(30, 100),
-            random.randint(120, 180),
-            random.randint(30, 80)
-        )
-        draw.line([(x, y), (x, y-grass_height)], fill=grass_color, width=2)
-    
-    # Draw multiple honses
-    honses_params = []
-    for i in range(num_honses):
-        size = random.uniform(0.3, 1.0)
-        y_pos = height * (0.7 - 0.1 * (1 - size))
-        x_pos = random.uniform(width * 0.1, width * 0.9)
+        def generate():
+            for index, (image_bytes, used_params, honse_seed) in enumerate(results):
+                yield (f'--{boundary}\r\n'
+                       f'Content-Type: {mime_type(fmt)}\r\n'
+                       f'Content-Disposition: attachment; filename="honse_{index:04d}.{extension(fmt)}"\r\n'
+                       f'X-Seed: {honse_seed}\r\n'
+                       f'X-Params: {json.dumps(used_params)}\r\n\r\n').encode('utf-8')
+                yield image_bytes
+                yield b'\r\n'
+            yield f'--{boundary}--\r\n'.encode('utf-8')
         
-        params = generate_random_honse_params()
-        used_params = draw_honse(draw, x_pos, y_pos, params, size)
-        honses_params.append(used_params)
+        # The honses are rendered while the response streams, so the slot is held until it closes
+        with timed('queue'):
+            ticket = scheduler.acquire(RENDER_PRIORITY['batch'])
+        try:
+            results = render_batch()
+            response = app.response_class(generate(), mimetype=f'multipart/mixed; boundary={boundary}')
+        except BaseException:
+            scheduler.release(ticket)
+            raise
+        response.call_on_close(lambda: scheduler.release(ticket))
+        return response
     
-    # Save to a BytesIO object
-    img_io = io.BytesIO()
-    image.save(img_io, 'PNG')
-    img_io.seek(0)
+    with render_slot('batch'), timed('render'):
+        results = list(render_batch())
     
-    # Convert to base64
-    img_base64 = base64.b64encode(img_io.getvalue()).decode('utf-8')
+    # PNG/WebP/JPEG are already compressed, so the zip just stores them;
+    # SVG is text and is deflated. Fixed ZipInfo timestamps keep the archive
+    # identical for the same seed.
+    compression = zipfile.ZIP_DEFLATED if fmt in VECTOR_FORMATS else zipfile.ZIP_STORED
+    archive = io.BytesIO()
+    manifest = []
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zf:
+        for index, (image_bytes, used_params, honse_seed) in enumerate(results):
+            name = f'honse_{index:04d}.{extension(fmt)}'
+            zf.writestr(zipfile.ZipInfo(name), image_bytes, compress_type=compression)
+            manifest.append({'file': name, 'seed': honse_seed, 'params': used_params})
+        zf.writestr(zipfile.ZipInfo('params.json'), json.dumps(manifest))
+    archive.seek(0)
+    return send_file(archive, mimetype='application/zip', as_attachment=True,
+                     download_name=f'honse_batch_{seed}.zip')
+
+def seeded_image_response(kind, seed, ext, render, parse_format=normalize_format, **options):
+    """
+    Serve an immutable image fully determined by its seed.
     
-    # Save the image
-    herd_id = random.randint(10000, 99999)
-    image.save(f'static/images/herd_{herd_id}.png')
+    The strong ETag is derived from everything that affects the bytes, so a
+    matching If-None-Match gets a 304 without rendering anything.
+    """
+    fmt = parse_format(ext)
+    if fmt is None:
+        abort(404)
     
-    return jsonify({
-        'image': f'data:image/png;base64,{img_base64}',
-        'herd_id': herd_id
-    })
+    etag = canonical_key({}, seed, kind=kind, format=fmt, version=RENDER_VERSION,
+                         encoder=encoder_settings(),
+                         backgrounds=[app.config['HERD_BACKGROUNDS'], app.config['BACKGROUND_SEED']],
+                         **options)
+    cache_control = 'public, max-age=31536000, immutable'
+    
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        cached = render_cache.get(etag)
+        if cached is None:
+            with render_slot(kind):
+                image_bytes, used_params = render(random.Random(seed), fmt)
+            render_cache.put(etag, (image_bytes, used_params), len(image_bytes))
+        else:
+            image_bytes, used_params = cached
+        response = app.response_class(image_bytes, mimetype=mime_type(fmt))
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+@app.route('/honse/<int:seed>.<ext>')
+def honse_by_seed(seed, ext):
+    """Return the random honse for a seed (at ?size= or ?width=) as a cacheable image."""
+    rasterizer = request_rasterizer()
+    size = request_canvas(None, HONSE_CANVAS)
+    return seeded_image_response('honse', seed, ext,
+                                 lambda rng, fmt: render_random_honse(rng, fmt, rasterizer, size),
+                                 rasterizer=rasterizer, size=size)
+
+@app.route('/honse/<int:seed>/gait.<ext>')
+def gait_by_seed(seed, ext):
+    """
+    Return the random honse for a seed as a looping gait animation.
+    
+    The extension picks the format (gif, png for APNG, webp); ?frames=, ?fps=
+    and ?size= work as for /animate_honse. Frame 0 is /honse/<seed>.png.
+    """
+    _, frames, fps = request_animation({'format': ext})
+    rasterizer = request_rasterizer()
+    size = request_canvas(None, HONSE_CANVAS)
+    
+    def render(rng, fmt):
+        params = generate_random_honse_params(rng)
+        return render_gait(params, rng, fmt, frames, fps, rasterizer, size)
+    
+    return seeded_image_response('gait', seed, ext, render, normalize_animation_format,
+                                 frames=frames, fps=fps, rasterizer=rasterizer, size=size)
+
+@app.route('/herd/<int:seed>.<ext>')
+def herd_by_seed(seed, ext):
+    """Return the herd for a seed (and ?num_honses=, ?size= or ?width=) as a cacheable image."""
+    num_honses = clamp_herd_size(request.args.get('num_honses', 5, type=int))
+    rasterizer = request_rasterizer()
+    size = request_canvas(None, HERD_CANVAS)
+    return seeded_image_response('herd', seed, ext,
+                                 lambda rng, fmt: render_herd(num_honses, rng, fmt, rasterizer, size),
+                                 num_honses=num_honses, rasterizer=rasterizer, size=size)
+
+def poster_request(seed):
+    """Return the cached HerdPoster described by ?width=&height=&num_honses=."""
+    width = request.args.get('width', 6000, type=int)
+    height = request.args.get('height', 2000, type=int)
+    num_honses = request.args.get('num_honses', 200, type=int)
+    if width < 1 or height < 1 or width * height > app.config['POSTER_MAX_PIXELS']:
+        abort(400, f"A poster must have between 1 and {app.config['POSTER_MAX_PIXELS']} pixels")
+    if not 1 <= num_honses <= app.config['POSTER_MAX_HONSES']:
+        abort(400, f"A poster must contain between 1 and {app.config['POSTER_MAX_HONSES']} honses")
+    return cached_poster(width, height, num_honses, seed, app.config['POSTER_TILE_SIZE'],
+                         max_bytes=app.config['POSTER_CACHE_BYTES'])
+
+def poster_etag(poster, rasterizer, **options):
+    """Return the strong ETag of a poster (or one of its tiles)."""
+    return canonical_key({}, poster.seed, kind='poster', width=poster.width, height=poster.height,
+                         num_honses=poster.num_honses, tile_size=poster.tile_size,
+                         version=RENDER_VERSION, rasterizer=rasterizer, **options)
+
+@app.route('/poster/<int:seed>.png')
+def poster_by_seed(seed):
+    """
+    Stream a poster-sized herd as a PNG, rendered one row of tiles at a time.
+    
+    Takes ?width=, ?height= and ?num_honses=. The image is never held in
+    memory whole, so it is neither cached nor saved to the artifact store.
+    """
+    poster = poster_request(seed)
+    rasterizer = request_rasterizer()
+    etag = poster_etag(poster, rasterizer, compress_level=app.config['PNG_COMPRESS_LEVEL'])
+    
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        # The slot is held until the whole stream has been sent
+        with timed('queue'):
+            ticket = scheduler.acquire(RENDER_PRIORITY['poster'])
+        try:
+            workers = app.config['BATCH_WORKERS']
+            executor = get_render_pool(workers) if workers > 1 else None
+            bands = poster.iter_bands(rasterizer, executor, app.config['POSTER_CACHE_BYTES'])
+            response = app.response_class(
+                stream_png(poster.width, poster.height, bands, app.config['PNG_COMPRESS_LEVEL']),
+                mimetype='image/png')
+        except BaseException:
+            scheduler.release(ticket)
+            raise
+        response.call_on_close(lambda: scheduler.release(ticket))
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/poster/<int:seed>/tiles/<int:row>/<int:col>.<ext>')
+def poster_tile(seed, row, col, ext):
+    """Return one tile of a poster (same query parameters), so clients can fetch tiles in parallel."""
+    fmt = normalize_format(ext)
+    poster = poster_request(seed)
+    if fmt is None or fmt in VECTOR_FORMATS or not (0 <= row < poster.rows and 0 <= col < poster.cols):
+        abort(404)
+    rasterizer = request_rasterizer()
+    etag = poster_etag(poster, rasterizer, row=row, col=col, format=fmt, encoder=encoder_settings())
+    
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        with render_slot('herd'):
+            with timed('rasterize'):
+                tile = poster.render_tile(col, row, rasterizer)
+            image_bytes = encode(tile, fmt)
+        response = app.response_class(image_bytes, mimetype=mime_type(fmt))
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/render_cache/stats')
+def render_cache_stats():
+    """Return the render cache hit/miss/eviction counters."""
+    return jsonify(render_cache.stats())
+
+@app.route('/store/stats')
+def store_stats():
+    """Return the artifact store's size, quota and eviction counters."""
+    return jsonify(dict(store.stats(), writer=writer.stats()))
+
+@app.route('/scheduler/stats')
+def scheduler_stats():
+    """Return the running and queued renders and the admission counters."""
+    return jsonify(scheduler.stats())
+
+@app.route('/random_pool/stats')
+def random_pool_stats():
+    """Return how many random honses are ready, the pool hit rate and the refill rate."""
+    return jsonify(random_pool.stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Return the request and stage timing histograms and cache/store counters for Prometheus."""
+    return app.response_class(metrics_registry.exposition(), mimetype='text/plain; version=0.0.4')
+
+def apply_profiler_control(control):
+    """Start, stop or reset this worker's profiler as a /profiler/start or /profiler/stop asked."""
+    if control['reset']:
+        profiler.reset()
+    if control['running']:
+        profiler.start(control['interval'])
+    else:
+        profiler.stop()
+    profiler_sync['generation'] = control['generation']
+
+def sync_profiler(force=False):
+    """Follow the latest profiler control sent to any worker, and share this worker's samples."""
+    with profiler_sync_lock:
+        control = shared_snapshots.read('profiler_control')
+        if control is not None and control['generation'] != profiler_sync['generation']:
+            apply_profiler_control(control)
+        state = (profiler.samples, profiler.running)
+        if force or state != profiler_sync['published']:
+            shared_snapshots.write_own('profiler', {'stats': profiler.stats(), 'stacks': profiler.stacks()})
+            profiler_sync['published'] = state
+
+def profiler_workers():
+    """Return the profiler stats and stacks of every live worker, as {pid: {'stats', 'stacks'}}."""
+    if shared_snapshots is None:
+        return {os.getpid(): {'stats': profiler.stats(), 'stacks': profiler.stacks()}}
+    sync_profiler(force=True)
+    return {pid: snapshot for pid, snapshot in shared_snapshots.read_all('profiler').items()
+            if process_alive(pid)}
+
+def profiler_response():
+    """Return every worker's profiler stats as JSON."""
+    return jsonify({'workers': [snapshot['stats'] for _, snapshot in sorted(profiler_workers().items())]})
+
+def control_profiler(running, interval=None, reset=False):
+    """Apply a profiler start or stop here, and hand it to the other workers (within the publish interval)."""
+    control = {'generation': time.time_ns(), 'running': running,
+               'interval': interval or profiler.interval, 'reset': reset}
+    with profiler_sync_lock:
+        if shared_snapshots is not None:
+            shared_snapshots.write('profiler_control', control)
+        apply_profiler_control(control)
+
+@app.route('/profiler')
+def profiler_stats():
+    """Return whether each worker's sampling profiler is running and how much it has collected."""
+    return profiler_response()
+
+@app.route('/profiler/stacks')
+def profiler_stacks():
+    """Return every worker's sampled stacks, added up, in collapsed-stack format (for flamegraph.pl or speedscope)."""
+    stacks = Counter()
+    for snapshot in profiler_workers().values():
+        stacks.update(snapshot['stacks'])
+    return app.response_class(collapsed(stacks), mimetype='text/plain')
+
+def require_profiler_token():
+    """Abort unless profiler control is enabled and the request carries its token."""
+    token = app.config['PROFILER_TOKEN']
+    if not token:
+        abort(404)
+    given = request.headers.get('X-Profiler-Token', '')
+    if not hmac.compare_digest(given.encode('utf-8'), token.encode('utf-8')):
+        abort(403)
+
+@app.route('/profiler/start', methods=['POST'])
+def profiler_start():
+    """Start every worker's sampling profiler (?interval= seconds; ?reset=0 keeps earlier samples)."""
+    require_profiler_token()
+    interval = request.args.get('interval', type=float)
+    if interval is not None and not 0.001 <= interval <= 1:
+        abort(400, "interval must be between 0.001 and 1 second")
+    control_profiler(True, interval, reset=request.args.get('reset', '1') != '0')
+    return profiler_response()
+
+@app.route('/profiler/stop', methods=['POST'])
+def profiler_stop():
+    """Stop every worker's sampling profiler; their stacks stay available at /profiler/stacks."""
+    require_profiler_token()
+    control_profiler(False)
+    return profiler_response()
+
+@app.errorhandler(queue.Full)
+def persistence_backlogged(error):
+    """The disk writer is too far behind to accept more renders; ask clients to retry."""
+    response = jsonify({'error': 'Image storage is busy, try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+@app.errorhandler(SchedulerBusy)
+def renders_backlogged(error):
+    """Every render slot is busy and the queue is full (or the wait timed out); shed the request."""
+    response = jsonify({'error': 'Too many renders in progress, try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+@app.route('/images/<filename>')
+def serve_image(filename):
+    """Serve a saved image inline (used by the url response mode), or ?size= a variant of it."""
+    size = request.args.get('size')
+    if size:
+        filename = saved_variant(filename, size)
+    return send_saved_file(filename, max_age=31536000)
 
 @app.route('/download/<filename>')
 def download_image(filename):
-    """Download a saved image."""
-    return send_file(f'static/images/{filename}', as_attachment=True)
+    """Download a saved image, or ?size= a variant of it."""
+    size = request.args.get('size')
+    if size:
+        filename = saved_variant(filename, size)
+    return send_saved_file(filename, as_attachment=True)
+
+def warm_up():
+    """
+    Build the read-only state every worker shares, once.
+    
+    Runs at import, so under gunicorn --preload it happens in the master and
+    the workers share the prebuilt backgrounds and loaded codecs copy-on-write.
+    It starts no threads and opens no connections, which wouldn't survive the fork.
+    """
+    background_library(*HONSE_CANVAS, 'field').build()
+    background_library(*HERD_CANVAS, 'herd').build()
+    
+    # A throwaway render of each kind loads the image codecs and the rasterizer
+    # backend, and runs NumPy's first-call setup
+    fmt, rasterizer = app.config['IMAGE_FORMAT'], app.config['RASTERIZER']
+    render_random_honse(random.Random(0), fmt, rasterizer)
+    render_herd(1, random.Random(0), fmt, rasterizer)
+
+def start_worker():
+    """
+    Start this process's background threads; call once per worker, after any fork.
+    
+    The disk writer and the artifact store's database connection start on
+    first use by themselves. This starts the profiler (if HONSE_PROFILER is
+    set), the thread that shares this worker's metrics (if HONSE_METRICS_DIR
+    is set) and the random honse pool's refill thread, so the pool is full
+    before the first request arrives.
+    """
+    if app.config['PROFILER']:
+        profiler.start()
+    metrics_registry.start_publishing(app.config['METRICS_PUBLISH_INTERVAL'], on_publish=sync_profiler)
+    random_pool.want((normalize_format(app.config['IMAGE_FORMAT']), app.config['RASTERIZER']))
+
+if app.config['WARM_START']:
+    warm_up()
 
 # if __name__ == '__main__':
 #     app.run(debug=True)
 
 if __name__ == "__main__":
+    start_worker()
     app.run(host="0.0.0.0", port=8000, debug=False)
\ No newline at end of file
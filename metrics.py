@@ -0,0 +1,323 @@
+"""
+Per-stage render timing and Prometheus metrics.
+
+Each request gets a StageTimer. Render code wraps its stages in
+timed("encode") and friends, and attaches labels such as the honse's styles
+with label(). When the request finishes, the stage times go out as a
+Server-Timing header and are added to histograms, which /metrics serves in
+the Prometheus text format.
+
+The timer is kept in a context variable, so the drawing and encoding helpers
+don't need a reference to the request. Outside a request, timed() and label()
+do nothing.
+
+Under gunicorn each worker process has its own histograms. Given a
+SharedSnapshots directory, every worker writes its metrics there and
+/metrics merges them, whichever worker serves the scrape: histograms are
+summed over all workers (including exited ones, so counts never go
+backwards when a worker is replaced) and gauges, which describe one
+process's caches and queues, get a worker="<pid>" label.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+import bisect
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = contextvars.ContextVar("stage_timer", default=None)
+
+
+class StageTimer:
+    """Accumulates the time spent in each named stage of one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}   # stage -> seconds, in the order stages first ran
+        self.labels = {}
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self):
+        """Return the seconds since the timer started."""
+        return time.perf_counter() - self.start
+
+    def server_timing(self, total=None):
+        """Return the stages (and the total, if given) as a Server-Timing header value."""
+        entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.stages.items()]
+        if total is not None:
+            entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+def start_timer():
+    """Start timing the current request and return its StageTimer."""
+    timer = StageTimer()
+    _current.set(timer)
+    return timer
+
+
+def finish_timer():
+    """Stop recording stages for the current request."""
+    _current.set(None)
+
+
+def current_timer():
+    """Return the current request's StageTimer, or None outside a request."""
+    return _current.get()
+
+
+@contextmanager
+def timed(stage):
+    """Add the time spent in the with block to stage of the current request."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(stage, time.perf_counter() - start)
+
+
+def label(**labels):
+    """Attach labels (e.g. mane_style='braided') to the current request's metrics."""
+    timer = _current.get()
+    if timer is not None:
+        timer.labels.update((key, str(value)) for key, value in labels.items())
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """A thread-safe Prometheus histogram with one series per label set."""
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # sorted label pairs -> [count per bucket..., count above, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        """Record one observation with the given labels."""
+        key = tuple(sorted((key, str(value)) for key, value in labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, seconds)] += 1
+            series[-1] += seconds
+
+    def snapshot(self):
+        """Return a copy of every series, as {sorted label pairs: [bucket counts..., count above, sum]}."""
+        with self._lock:
+            return {key: list(values) for key, values in self._series.items()}
+
+    def exposition(self, series=None):
+        """Return the histogram (or the given merged series of it) in the Prometheus text format, as a list of lines."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        if series is None:
+            series = self.snapshot()
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, le=repr(bound))} {cumulative}")
+            cumulative += values[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{_format_labels(key, le="+Inf")} {cumulative}')
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_number(values[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+def process_alive(pid):
+    """Return whether a process with this pid is still running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedSnapshots:
+    """
+    JSON snapshots in a directory shared by every worker process.
+
+    Each process writes its own file per kind (<kind>_<pid>.json), replacing
+    it whole, so readers never see half a snapshot; any process can read all
+    of them back to merge them.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.json")
+
+    def write(self, name, data):
+        """Replace the snapshot called name with data."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(name)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def read(self, name):
+        """Return the snapshot called name, or None if there isn't one."""
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def write_own(self, kind, data):
+        """Replace this process's snapshot of kind with data."""
+        self.write(f"{kind}_{os.getpid()}", data)
+
+    def read_all(self, kind):
+        """Return {pid: snapshot} of every process that has written a snapshot of kind."""
+        snapshots = {}
+        for path in glob.glob(os.path.join(glob.escape(self.directory), f"{kind}_*.json")):
+            name = os.path.basename(path)[len(kind) + 1:-len(".json")]
+            if not name.isdigit():
+                continue
+            data = self.read(f"{kind}_{name}")
+            if data is not None:
+                snapshots[int(name)] = data
+        return snapshots
+
+    def clear(self):
+        """Delete every snapshot; call before starting a fresh set of workers."""
+        for path in glob.glob(os.path.join(glob.escape(self.directory), "*.json")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _numeric(stats):
+    return {key: value for key, value in stats.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)}
+
+
+class MetricsRegistry:
+    """Histograms plus gauges read from stats() callbacks, served together."""
+
+    def __init__(self, shared=None):
+        """
+        Args:
+            shared: SharedSnapshots to merge every worker's metrics through, or
+                None to serve only this process's
+        """
+        self.shared = shared
+        self._histograms = []
+        self._gauges = []   # (name prefix, documentation, callback returning a dict)
+        self._thread = None
+        self.publish_errors = 0
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        """Create and register a Histogram."""
+        histogram = Histogram(name, documentation, buckets)
+        self._histograms.append(histogram)
+        return histogram
+
+    def gauges(self, prefix, documentation, stats):
+        """Export every numeric value of stats() as a gauge named <prefix>_<key>."""
+        self._gauges.append((prefix, documentation, stats))
+
+    def publish(self):
+        """Write this process's histograms and gauges to the shared directory."""
+        self.shared.write_own("metrics", {
+            "histograms": {histogram.name: [[list(map(list, key)), values]
+                                            for key, values in histogram.snapshot().items()]
+                           for histogram in self._histograms},
+            "gauges": {prefix: _numeric(stats()) for prefix, _, stats in self._gauges},
+        })
+
+    def start_publishing(self, interval=1.0, on_publish=None):
+        """
+        Publish every interval seconds from a background thread; call once per worker.
+
+        Args:
+            interval: seconds between snapshots, so other workers' figures are at most this old
+            on_publish: optional callable run just before each snapshot
+        """
+        if self.shared is None or self._thread is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    if on_publish is not None:
+                        on_publish()
+                    self.publish()
+                except Exception:
+                    # A full or unwritable disk costs freshness, not the thread
+                    self.publish_errors += 1
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=run, name="metrics-publisher", daemon=True)
+        self._thread.start()
+
+    def exposition(self):
+        """Return every metric (merged over the workers, if shared) in the Prometheus text format."""
+        if self.shared is None:
+            gauges = {None: {prefix: _numeric(stats()) for prefix, _, stats in self._gauges}}
+            lines = []
+            for histogram in self._histograms:
+                lines.extend(histogram.exposition())
+        else:
+            self.publish()
+            snapshots = self.shared.read_all("metrics")
+            gauges = {pid: snapshot["gauges"] for pid, snapshot in sorted(snapshots.items())
+                      if process_alive(pid)}
+            lines = []
+            for histogram in self._histograms:
+                merged = {}
+                for snapshot in snapshots.values():
+                    for key, values in snapshot["histograms"].get(histogram.name, ()):
+                        key = tuple(map(tuple, key))
+                        total = merged.setdefault(key, [0] * len(values))
+                        for i, value in enumerate(values):
+                            total[i] += value
+                lines.extend(histogram.exposition(merged))
+
+        for prefix, documentation, _ in self._gauges:
+            by_key = defaultdict(list)
+            for pid, worker_gauges in gauges.items():
+                for key, value in worker_gauges.get(prefix, {}).items():
+                    by_key[key].append((pid, value))
+            for key, values in by_key.items():
+                name = f"{prefix}_{key}"
+                lines.append(f"# HELP {name} {documentation} ({key})")
+                lines.append(f"# TYPE {name} gauge")
+                for pid, value in values:
+                    worker = "" if pid is None else _format_labels((), worker=str(pid))
+                    lines.append(f"{name}{worker} {_format_number(value)}")
+        return "\n".join(lines) + "\n"
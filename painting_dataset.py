@@ -0,0 +1,352 @@
+"""
+A columnar, memory-mappable dataset of paintings (one file per split, e.g. data/like.paintings).
+
+Each painting is a run of marks. Rather than a pickled DataFrame of Python
+objects per painting, every column is stored as one flat array in a single
+file, so opening a split with 100k paintings is a handful of np.memmap views.
+
+Columns (T marks in total, n paintings):
+    mark_offsets   int64 (n + 1)    painting i owns marks mark_offsets[i]:mark_offsets[i + 1]
+    png_offsets    int64 (n + 1)    byte range of painting i's PNG path in png_paths
+    start_points   float64 (T, 2)   where each mark starts
+    specs          uint8 (T, 6)     r, g, b, is_pen, pen width, opacity
+    path_offsets   int64 (T + 1)    byte range of mark j's stroke path in paths
+    paths          uint8            stroke path strings, packed (ASCII)
+    png_paths      uint8            PNG paths, packed (UTF-8)
+
+The file starts with a JSON header giving each column's offset, capacity and
+length. Columns get spare capacity, so appending writes into the free space
+and then updates the header; when a column is full the file is rewritten with
+double the capacity, which keeps appends amortized O(1). Only one process
+should append to a split at a time.
+
+Usage:
+    python painting_dataset.py migrate data/like data/like.paintings [--remove-pickles]
+"""
+
+import argparse
+import json
+import os
+import pickle
+from pathlib import Path
+import numpy as np
+
+MAGIC = b"PAINTDS1"
+HEADER_SIZE = 4096
+ALIGNMENT = 64
+
+# name -> (dtype, shape of one row)
+COLUMNS = {
+    "mark_offsets": (np.int64, ()),
+    "png_offsets": (np.int64, ()),
+    "start_points": (np.float64, (2,)),
+    "specs": (np.uint8, (6,)),
+    "path_offsets": (np.int64, ()),
+    "paths": (np.uint8, ()),
+    "png_paths": (np.uint8, ()),
+}
+
+# Rows reserved for each column in a new file: room for about 64 paintings of
+# 100 marks with typical stroke paths (the file is sparse until written)
+INITIAL_CAPACITY = {
+    "mark_offsets": 65,
+    "png_offsets": 65,
+    "start_points": 64 * 100,
+    "specs": 64 * 100,
+    "path_offsets": 64 * 100 + 1,
+    "paths": 64 * 100 * 4096,
+    "png_paths": 64 * 64,
+}
+
+
+def _row_bytes(name):
+    dtype, shape = COLUMNS[name]
+    return np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64))
+
+
+def _layout(capacities):
+    """Place the columns one after another (aligned) after the header."""
+    layout = {}
+    offset = HEADER_SIZE
+    for name in COLUMNS:
+        layout[name] = offset
+        offset += -(-capacities[name] * _row_bytes(name) // ALIGNMENT) * ALIGNMENT
+    return layout, offset
+
+
+def split_path(painting_dir):
+    """Return the dataset file of the split whose PNGs are in painting_dir (data/like -> data/like.paintings)."""
+    painting_dir = Path(painting_dir)
+    return painting_dir.with_name(painting_dir.name + ".paintings")
+
+
+def encode_mark_spec(mark_spec):
+    """Turn an art.py mark spec into a specs row: (colour, width, opacity) pens, (colour, opacity, None) brushes."""
+    colour, second, third = mark_spec
+    if third:
+        return (*colour, 1, second, third)
+    return (*colour, 0, 0, second)
+
+
+def decode_mark_spec(row):
+    """Turn a specs row back into an art.py mark spec."""
+    r, g, b, is_pen, width, opacity = (int(value) for value in row)
+    if is_pen:
+        return ((r, g, b), width, opacity)
+    return ((r, g, b), opacity, None)
+
+
+class PaintingDataset:
+    """One split of paintings, with every column memory-mapped read-only."""
+
+    def __init__(self, path, create=True):
+        """
+        Args:
+            path: the split's file
+            create: create an empty split if the file doesn't exist (else FileNotFoundError)
+        """
+        self.path = Path(path)
+        if not self.path.exists():
+            if not create:
+                raise FileNotFoundError(f"No painting dataset at {self.path}")
+            self._create()
+        self._map()
+
+    def _create(self, capacities=None):
+        capacities = dict(capacities or INITIAL_CAPACITY)
+        layout, size = _layout(capacities)
+        header = {"paintings": 0, "capacity": capacities, "offset": layout,
+                  "length": {name: 0 for name in COLUMNS}}
+        # Both offset columns start with a 0 (the start of painting 0)
+        header["length"]["mark_offsets"] = header["length"]["png_offsets"] = 1
+        header["length"]["path_offsets"] = 1
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.truncate(size)
+            self._write_header(f, header)
+        os.replace(tmp, self.path)
+
+    @staticmethod
+    def _write_header(f, header):
+        data = MAGIC + json.dumps(header).encode("utf-8")
+        if len(data) > HEADER_SIZE:
+            raise ValueError("Dataset header is too large")
+        f.seek(0)
+        f.write(data.ljust(HEADER_SIZE, b" "))
+
+    def _read_header(self):
+        with open(self.path, "rb") as f:
+            data = f.read(HEADER_SIZE)
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{self.path} is not a painting dataset")
+        return json.loads(data[len(MAGIC):])
+
+    def _map(self):
+        self.header = self._read_header()
+        self.columns = {}
+        for name, (dtype, shape) in COLUMNS.items():
+            length = self.header["length"][name]
+            if length == 0:
+                self.columns[name] = np.empty((0, *shape), dtype=dtype)
+            else:
+                self.columns[name] = np.memmap(self.path, dtype=dtype, mode="r",
+                                               offset=self.header["offset"][name], shape=(length, *shape))
+
+    def __len__(self):
+        return self.header["paintings"]
+
+    def __getattr__(self, name):
+        # Columns are attributes: dataset.specs, dataset.start_points, ...
+        columns = self.__dict__.get("columns")
+        if columns is not None and name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    @property
+    def colours(self):
+        """Every mark's (r, g, b), as a (T, 3) uint8 view."""
+        return self.columns["specs"][:, :3]
+
+    def mark_range(self, index):
+        """Return the (start, end) mark indices of painting index."""
+        offsets = self.columns["mark_offsets"]
+        return int(offsets[index]), int(offsets[index + 1])
+
+    def png_path(self, index):
+        """Return the PNG path of painting index."""
+        start, end = self.columns["png_offsets"][index:index + 2]
+        return bytes(self.columns["png_paths"][start:end]).decode("utf-8")
+
+    def marks(self, index):
+        """Return the stroke path strings of painting index."""
+        start, end = self.mark_range(index)
+        offsets = self.columns["path_offsets"][start:end + 1]
+        packed = bytes(self.columns["paths"][offsets[0]:offsets[-1]]).decode("ascii")
+        relative = (offsets - offsets[0]).tolist()
+        return [packed[a:b] for a, b in zip(relative[:-1], relative[1:])]
+
+    def mark_specs(self, index):
+        """Return the mark specs of painting index, in art.py's tuple format."""
+        start, end = self.mark_range(index)
+        return [decode_mark_spec(row) for row in self.columns["specs"][start:end]]
+
+    def painting(self, index):
+        """Return painting index as a dict of start_points, marks, mark_specs and png_path."""
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, end = self.mark_range(index)
+        return {
+            "start_points": [tuple(point) for point in self.columns["start_points"][start:end].tolist()],
+            "marks": self.marks(index),
+            "mark_specs": self.mark_specs(index),
+            "png_path": self.png_path(index),
+        }
+
+    def append(self, paintings):
+        """
+        Append paintings to the end of the split.
+
+        Args:
+            paintings: iterable of (start_points, marks, mark_specs, png_path)
+
+        Returns:
+            The number of paintings appended
+        """
+        start_points, specs, path_lengths, paths, mark_counts, png_paths = [], [], [], [], [], []
+        for points, marks, mark_specs, png_path in paintings:
+            encoded = [mark.encode("ascii") for mark in marks]
+            start_points.extend(points)
+            specs.extend(encode_mark_spec(spec) for spec in mark_specs)
+            path_lengths.extend(len(mark) for mark in encoded)
+            paths.extend(encoded)
+            mark_counts.append(len(encoded))
+            png_paths.append(str(png_path).encode("utf-8"))
+        if not mark_counts:
+            return 0
+
+        header = self.header
+        length = header["length"]
+        marks_before = length["start_points"]
+        paths_before = length["paths"]
+        pngs_before = length["png_paths"]
+        new = {
+            "mark_offsets": marks_before + np.cumsum(mark_counts, dtype=np.int64),
+            "png_offsets": pngs_before + np.cumsum([len(p) for p in png_paths], dtype=np.int64),
+            "start_points": np.asarray(start_points, dtype=np.float64).reshape(-1, 2),
+            "specs": np.asarray(specs, dtype=np.uint8).reshape(-1, 6),
+            "path_offsets": paths_before + np.cumsum(path_lengths, dtype=np.int64),
+            "paths": np.frombuffer(b"".join(paths), dtype=np.uint8),
+            "png_paths": np.frombuffer(b"".join(png_paths), dtype=np.uint8),
+        }
+
+        if any(length[name] + len(rows) > header["capacity"][name] for name, rows in new.items()):
+            self._grow({name: length[name] + len(rows) for name, rows in new.items()})
+            header = self.header
+            length = header["length"]
+
+        # Write the rows into the free space, then publish them in the header
+        with open(self.path, "r+b") as f:
+            for name, rows in new.items():
+                f.seek(header["offset"][name] + length[name] * _row_bytes(name))
+                f.write(np.ascontiguousarray(rows).tobytes())
+            f.flush()
+            header = dict(header, paintings=header["paintings"] + len(mark_counts),
+                          length={name: length[name] + len(new[name]) for name in COLUMNS})
+            self._write_header(f, header)
+        self._map()
+        return len(mark_counts)
+
+    def compact(self, drop, batch_size=1000):
+        """
+        Rewrite the split without the paintings whose indices are in drop.
+
+        Returns:
+            A dict mapping the old index of every kept painting to its new index
+        """
+        keep = [index for index in range(len(self)) if index not in drop]
+        tmp = self.path.with_name(self.path.name + ".compact")
+        if tmp.exists():
+            tmp.unlink()
+        compacted = PaintingDataset(tmp)
+        for start in range(0, len(keep), batch_size):
+            compacted.append((p["start_points"], p["marks"], p["mark_specs"], p["png_path"])
+                             for p in map(self.painting, keep[start:start + batch_size]))
+        os.replace(tmp, self.path)
+        self._map()
+        return {old: new for new, old in enumerate(keep)}
+
+    def _grow(self, needed):
+        """Rewrite the file with at least double the capacity of every column that is too small."""
+        header = self.header
+        capacities = {name: max(2 * capacity, needed[name]) if needed[name] > capacity else capacity
+                      for name, capacity in header["capacity"].items()}
+        layout, size = _layout(capacities)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(self.path, "rb") as src, open(tmp, "wb") as dst:
+            dst.truncate(size)
+            for name in COLUMNS:
+                src.seek(header["offset"][name])
+                dst.seek(layout[name])
+                remaining = header["length"][name] * _row_bytes(name)
+                while remaining:
+                    chunk = src.read(min(remaining, 1 << 24))
+                    dst.write(chunk)
+                    remaining -= len(chunk)
+            self._write_header(dst, dict(header, capacity=capacities, offset=layout))
+        os.replace(tmp, self.path)
+        self._map()
+
+
+def migrate_pickles(painting_dir, dataset_path, batch_size=1000, remove_pickles=False):
+    """
+    Copy the per-painting DataFrame pickles of a directory into a dataset split.
+
+    Paintings whose PNG is already in the split are skipped, so the migration
+    can be re-run (e.g. after more pickles were saved).
+
+    Returns:
+        The number of paintings added
+    """
+    dataset = PaintingDataset(dataset_path)
+    existing = {dataset.png_path(i) for i in range(len(dataset))}
+    added = 0
+    batch = []
+    migrated = []
+
+    def flush():
+        nonlocal added
+        added += dataset.append(batch)
+        if remove_pickles:
+            for pickle_path in migrated:
+                pickle_path.unlink()
+        batch.clear()
+        migrated.clear()
+
+    for pickle_path in sorted(Path(painting_dir).glob("*.pickle")):
+        png_path = str(pickle_path.with_suffix(".png"))
+        if png_path in existing:
+            continue
+        with open(pickle_path, "rb") as f:
+            df = pickle.load(f)
+        batch.append((list(df["start_points"]), list(df["marks"]), list(df["mark_specs"]), png_path))
+        migrated.append(pickle_path)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Painting dataset tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="copy a directory of pickles into a dataset split")
+    migrate.add_argument("painting_dir", help="directory of art_*.pickle files (e.g. data/like)")
+    migrate.add_argument("dataset", help="dataset file to append to (e.g. data/like.paintings)")
+    migrate.add_argument("--remove-pickles", action="store_true",
+                         help="delete each pickle once it is in the dataset")
+    args = parser.parse_args()
+
+    count = migrate_pickles(args.painting_dir, args.dataset, remove_pickles=args.remove_pickles)
+    print(f"Added {count} paintings to {args.dataset} ({len(PaintingDataset(args.dataset))} in total)")
@@ -0,0 +1,210 @@
+"""
+Write-behind persistence for generated images and parameters.
+
+Render routes hand their encoded bytes to a background writer thread and
+respond straight away. The writer drains a bounded queue in batches, fsyncs
+each batch together, and blocks submitters when the disk falls behind. Until a
+file is on disk its bytes stay available through pending(), so downloads can
+be served from memory. Deletes go through the same queue so they always land
+after the write they undo.
+"""
+
+import atexit
+import os
+import queue
+import threading
+
+# Sentinel telling the writer thread to stop
+_STOP = object()
+
+
+class WriteBehindWriter:
+    """A background thread that writes files from a bounded queue."""
+
+    def __init__(self, max_pending=256, batch_size=32, fsync=True, submit_timeout=10.0):
+        """
+        Args:
+            max_pending: queue size; submit() blocks when this many writes are waiting
+            batch_size: maximum number of files written (and fsynced) together
+            fsync: whether to fsync files and their directory after each batch
+            submit_timeout: seconds submit() waits for room before giving up
+        """
+        self.max_pending = max_pending
+        self.batch_size = max(1, batch_size)
+        self.fsync = fsync
+        self.submit_timeout = submit_timeout
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = {}              # path -> bytes not yet on disk
+        self._pending_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+
+    def _ensure_started(self):
+        # Started lazily (and again after a fork) so it is safe to create at import time
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    # Queue state inherited from another process is not ours to write
+                    self._queue = queue.Queue(maxsize=self.max_pending)
+                    with self._pending_lock:
+                        self._pending = {}
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+
+    def submit(self, path, data, on_error=None):
+        """
+        Queue data (bytes) to be written to path.
+
+        Blocks while the queue is full and raises queue.Full if there is still
+        no room after submit_timeout seconds. If the write later fails,
+        on_error(path) is called from the writer thread.
+        """
+        self._ensure_started()
+        with self._pending_lock:
+            self._pending[path] = data
+        try:
+            self._queue.put((path, data, on_error), timeout=self.submit_timeout)
+        except queue.Full:
+            with self._pending_lock:
+                if self._pending.get(path) is data:
+                    del self._pending[path]
+            raise
+
+    def delete(self, path, timeout=None):
+        """
+        Queue path for deletion, after any write to it that is already queued.
+
+        Raises queue.Full if there is no room after timeout seconds (defaults
+        to submit_timeout; 0 doesn't wait).
+        """
+        self._ensure_started()
+        self._queue.put((path, None, None), timeout=self.submit_timeout if timeout is None else timeout)
+        with self._pending_lock:
+            self._pending.pop(path, None)
+
+    def pending(self, path):
+        """Return the bytes queued for path if they are not on disk yet, else None."""
+        with self._pending_lock:
+            return self._pending.get(path)
+
+    def queue_depth(self):
+        """Return the number of writes waiting in the queue."""
+        return self._queue.qsize()
+
+    def flush(self):
+        """Block until every queued write is on disk."""
+        if self._thread is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """Flush outstanding writes and stop the writer thread."""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+
+            # Take whatever else is already waiting, up to a full batch
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._write_batch(batch)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                self._queue.task_done()
+                return
+
+    def _write_batch(self, batch):
+        written = []
+        for path, data, on_error in batch:
+            if data is None:
+                # A queued delete
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            tmp_path = f"{path}.tmp"
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+                written.append((path, data))
+            except OSError:
+                self.errors += 1
+                with self._pending_lock:
+                    if self._pending.get(path) is data:
+                        del self._pending[path]
+                if on_error is not None:
+                    try:
+                        on_error(path)
+                    except Exception:
+                        pass
+
+        # One directory fsync per batch makes the renames durable
+        if self.fsync:
+            for directory in {os.path.dirname(path) or "." for path, _ in written}:
+                try:
+                    fd = os.open(directory, os.O_RDONLY)
+                except OSError:
+                    continue
+                try:
+                    os.fsync(fd)
+                except OSError:
+                    pass
+                finally:
+                    os.close(fd)
+
+        with self._pending_lock:
+            for path, data in written:
+                # Only drop the entry if a newer write to the same path hasn't replaced it
+                if self._pending.get(path) is data:
+                    del self._pending[path]
+        self.written += len(written)
+        self.batches += 1
+
+    def stats(self):
+        """Return queue depth and write counters."""
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            "queue_depth": self.queue_depth(),
+            "pending": pending,
+            "written": self.written,
+            "batches": self.batches,
+            "errors": self.errors,
+            "max_pending": self.max_pending,
+        }
+
+
+def create_writer(**kwargs):
+    """Create a writer that flushes cleanly when the process exits."""
+    writer = WriteBehindWriter(**kwargs)
+    atexit.register(writer.close)
+    return writer
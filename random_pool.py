@@ -0,0 +1,140 @@
+"""
+A pool of pre-rendered random honses.
+
+A random honse needs no input, so it can be drawn and encoded before anyone
+asks for it. A background thread keeps a ring buffer per output variant
+(e.g. PNG from the pillow rasterizer) topped up, and a request pops a
+finished one in O(1). It only renders when the scheduler has nothing else
+to do, so it never competes with requests for CPU.
+"""
+
+from collections import deque
+import threading
+import time
+
+
+class RandomHonsePool:
+    """Ring buffers of ready-to-send random honses, refilled in the background."""
+
+    def __init__(self, render, depth=8, rate=10.0, scheduler=None, max_variants=8, idle_wait=0.05):
+        """
+        Args:
+            render: function taking a variant key and returning (seed, image bytes, params)
+            depth: number of honses kept ready per variant (0 disables the pool)
+            rate: most honses rendered per second while refilling (0 for no limit)
+            scheduler: RenderScheduler whose idle slots are used for refilling, or None
+            max_variants: most variants kept; requests for others render inline
+            idle_wait: seconds to wait before checking again while the scheduler is busy
+        """
+        self.render = render
+        self.depth = max(0, depth)
+        self.rate = rate
+        self.scheduler = scheduler
+        self.max_variants = max_variants
+        self.idle_wait = idle_wait
+        self._buffers = {}   # variant key -> deque of (seed, image bytes, params)
+        self._wake = threading.Condition()
+        self._thread = None
+        self._produced_at = deque(maxlen=64)
+        self.hits = 0
+        self.misses = 0
+        self.produced = 0
+        self.errors = 0
+
+    def want(self, key):
+        """Start keeping honses of variant key ready (no-op past max_variants)."""
+        if self.depth == 0:
+            return
+        with self._wake:
+            if key not in self._buffers and len(self._buffers) < self.max_variants:
+                self._buffers[key] = deque(maxlen=self.depth)
+            self._wake.notify()
+        self._ensure_started()
+
+    def get(self, key):
+        """
+        Pop a ready honse of variant key.
+
+        Returns:
+            (seed, image bytes, params), or None if none is ready
+        """
+        self.want(key)
+        buffer = self._buffers.get(key)
+        try:
+            item = buffer.popleft() if buffer is not None else None
+        except IndexError:
+            item = None
+        with self._wake:
+            if item is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._wake.notify()
+        return item
+
+    def _ensure_started(self):
+        # Started on first use, so each worker process gets its own thread
+        with self._wake:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="random-honse-pool", daemon=True)
+                self._thread.start()
+
+    def _emptiest(self):
+        buffers = [(len(buffer), key) for key, buffer in self._buffers.items() if len(buffer) < self.depth]
+        return min(buffers, key=lambda entry: entry[0])[1] if buffers else None
+
+    def _run(self):
+        while True:
+            with self._wake:
+                key = self._emptiest()
+                while key is None:
+                    self._wake.wait()
+                    key = self._emptiest()
+
+            ticket = self.scheduler.acquire_if_idle() if self.scheduler is not None else None
+            if self.scheduler is not None and ticket is None:
+                time.sleep(self.idle_wait)
+                continue
+            try:
+                item = self.render(key)
+            except Exception:
+                self.errors += 1
+                time.sleep(self.idle_wait)
+                continue
+            finally:
+                if ticket is not None:
+                    self.scheduler.release(ticket)
+
+            self._buffers[key].append(item)
+            with self._wake:
+                self.produced += 1
+                self._produced_at.append(time.monotonic())
+            if self.rate:
+                time.sleep(1 / self.rate)
+
+    def refill_rate(self):
+        """Return honses rendered per second, over the most recent renders."""
+        with self._wake:
+            times = list(self._produced_at)
+        if len(times) < 2:
+            return 0.0
+        span = time.monotonic() - times[0]
+        return (len(times) - 1) / span if span > 0 else 0.0
+
+    def stats(self):
+        """Return the pool's depth, hit rate and refill rate."""
+        with self._wake:
+            lookups = self.hits + self.misses
+            variants = {"/".join(map(str, key)): len(buffer) for key, buffer in self._buffers.items()}
+            stats = {
+                "ready": sum(variants.values()),
+                "depth": self.depth,
+                "variants": variants,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "produced": self.produced,
+                "errors": self.errors,
+            }
+        stats["refill_rate"] = self.refill_rate()
+        return stats
@@ -0,0 +1,119 @@
+"""
+Rasterizer backends that turn a display list into pixels.
+
+- pillow: Pillow's ImageDraw (fast, aliased edges)
+- aggdraw: the AGG library through aggdraw (native anti-aliasing, no supersampling)
+
+aggdraw is optional; it is only imported when its backend is first used.
+"""
+
+from PIL import Image, ImageDraw
+from display_list import pair_points
+
+
+class PillowRasterizer:
+    """Draw display lists with Pillow's ImageDraw."""
+
+    name = "pillow"
+
+    def render(self, image, display_list):
+        """Draw every primitive of display_list onto image (in place) and return it."""
+        display_list.rasterize(ImageDraw.Draw(image))
+        return image
+
+
+class AggdrawRasterizer:
+    """Draw display lists with aggdraw, which anti-aliases natively."""
+
+    name = "aggdraw"
+
+    def __init__(self):
+        try:
+            import aggdraw
+        except ImportError as error:
+            raise RuntimeError("The aggdraw rasterizer needs the aggdraw package "
+                               "(pip install aggdraw)") from error
+        self._aggdraw = aggdraw
+
+    def render(self, image, display_list):
+        """Draw every primitive of display_list onto image (in place) and return it."""
+        aggdraw = self._aggdraw
+        canvas = aggdraw.Draw(image)
+        brushes = {}
+        pens = {}
+        for op, xy, fill, width in display_list:
+            if op == "line":
+                pen = pens.get((fill, width))
+                if pen is None:
+                    pen = pens[(fill, width)] = aggdraw.Pen(fill, width)
+                canvas.line(xy, pen)
+                continue
+
+            brush = brushes.get(fill)
+            if brush is None:
+                brush = brushes[fill] = aggdraw.Brush(fill)
+            if op == "ellipse":
+                canvas.ellipse(xy, brush)
+            elif op == "rectangle":
+                canvas.rectangle(xy, brush)
+            elif op == "polygon":
+                canvas.polygon(xy, brush)
+        canvas.flush()
+        return image
+
+
+class SupersampledPillowRasterizer:
+    """
+    Draw with Pillow at a multiple of the target size and downscale.
+
+    Anti-aliased, but costs factor**2 times the pixels; kept mainly as a
+    reference point for benchmarks.
+    """
+
+    name = "pillow-supersampled"
+
+    def __init__(self, factor=4):
+        self.factor = factor
+
+    def render(self, image, display_list):
+        """Draw display_list onto image (in place) at factor x size and return it."""
+        factor = self.factor
+        big = image.resize((image.width * factor, image.height * factor), Image.NEAREST)
+        draw = ImageDraw.Draw(big)
+        for op, xy, fill, width in display_list:
+            scaled = [v * factor for v in xy]
+            if op == "ellipse":
+                draw.ellipse(scaled, fill=fill)
+            elif op == "rectangle":
+                draw.rectangle(scaled, fill=fill)
+            elif op == "polygon":
+                draw.polygon(pair_points(scaled), fill=fill)
+            elif op == "line":
+                draw.line(pair_points(scaled), fill=fill, width=width * factor)
+        image.paste(big.resize(image.size, Image.LANCZOS))
+        return image
+
+
+RASTERIZERS = {
+    "pillow": PillowRasterizer,
+    "aggdraw": AggdrawRasterizer,
+    "pillow-supersampled": SupersampledPillowRasterizer,
+}
+
+_instances = {}
+
+
+def get_rasterizer(name="pillow"):
+    """
+    Return the (shared) rasterizer backend called name.
+
+    Raises:
+        ValueError: if there is no backend with that name
+        RuntimeError: if the backend's optional dependency is not installed
+    """
+    name = (name or "pillow").lower()
+    if name not in RASTERIZERS:
+        raise ValueError(f"Unknown rasterizer '{name}' (choose from {', '.join(RASTERIZERS)})")
+    if name not in _instances:
+        _instances[name] = RASTERIZERS[name]()
+    return _instances[name]
@@ -0,0 +1,106 @@
+"""
+In-process LRU cache for rendered honses.
+
+Entries are keyed by a canonical hash of the fully merged honse parameters
+plus the render seed (and anything else that changes the output, such as the
+image format), and are bounded both by entry count and by total bytes.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+
+
+def _canonical(value):
+    """Convert tuples and numpy scalars into plain JSON-friendly values."""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if hasattr(value, "item"):
+        return value.item()
+    if isinstance(value, float) and value.is_integer():
+        # 1 and 1.0 draw the same honse
+        return int(value)
+    return value
+
+
+def canonical_key(params, seed=None, **extra):
+    """
+    Build a stable cache key for a render.
+
+    Args:
+        params: fully merged honse parameters (as returned by merge_default_params)
+        seed: render seed used for the random mane and tail strands
+        **extra: anything else that changes the output (format, canvas size, ...)
+
+    Returns:
+        A hex SHA-256 digest
+    """
+    payload = json.dumps(
+        {"params": _canonical(params), "seed": seed, "extra": _canonical(extra)},
+        sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """A thread-safe LRU cache bounded by entry count and total bytes."""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (value, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for key (marking it recently used), or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        """Store value under key, evicting least recently used entries to stay in bounds."""
+        if self.max_entries <= 0 or nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry (the counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return the cache counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,147 @@
+"""
+Admission control for CPU-heavy renders.
+
+At most max_concurrent renders run at once in a worker; the rest wait in a
+bounded queue ordered by priority (lower numbers first, then arrival order).
+When the queue is full, a request that outranks the lowest-priority waiter
+takes its place and that waiter is turned away; otherwise the new request is
+turned away. Either way the rejected request gets SchedulerBusy straight
+away, with a Retry-After estimate, instead of queueing behind work it can't
+overtake. Waiting is also capped by a timeout, so latency stays bounded
+under overload.
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+
+# Weight of the newest render in the running average of how long a slot is held
+HOLD_SMOOTHING = 0.2
+
+
+class SchedulerBusy(Exception):
+    """Raised when a render can't be admitted; retry_after is in seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many renders in progress, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class RenderScheduler:
+    """A thread-safe render slot pool with a bounded priority wait queue."""
+
+    def __init__(self, max_concurrent=2, max_queue=16, timeout=10.0):
+        """
+        Args:
+            max_concurrent: number of renders allowed to run at once
+            max_queue: number of renders allowed to wait for a slot
+            timeout: longest a render may wait for a slot, in seconds
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self._running = 0
+        self._waiters = []   # heap of [priority, arrival, event, state]
+        self._arrivals = itertools.count()
+        self._lock = threading.Lock()
+        self._hold = None    # running average of seconds a slot is held
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+        self.timeouts = 0
+
+    def acquire(self, priority=0, timeout=None):
+        """
+        Wait for a render slot.
+
+        Args:
+            priority: lower runs sooner (e.g. 0 for a single honse, 2 for a herd)
+            timeout: longest to wait in seconds (defaults to the scheduler's timeout)
+
+        Returns:
+            A ticket to pass to release()
+
+        Raises:
+            SchedulerBusy: if the queue is full, or no slot freed up in time
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if self._running < self.max_concurrent and not self._waiters:
+                self._running += 1
+                self.admitted += 1
+                return time.perf_counter()
+
+            if len(self._waiters) >= self.max_queue:
+                worst = max(self._waiters) if self._waiters else None
+                if worst is None or worst[0] <= priority:
+                    self.rejected += 1
+                    raise SchedulerBusy(self._retry_after())
+                # Turn away the lowest-priority waiter to make room
+                self._waiters.remove(worst)
+                heapq.heapify(self._waiters)
+                worst[3] = "shed"
+                worst[2].set()
+                self.shed += 1
+
+            waiter = [priority, next(self._arrivals), threading.Event(), "waiting"]
+            heapq.heappush(self._waiters, waiter)
+
+        waiter[2].wait(timeout)
+        with self._lock:
+            if waiter[3] == "granted":
+                return time.perf_counter()
+            if waiter[3] == "waiting":
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                self.timeouts += 1
+            raise SchedulerBusy(self._retry_after())
+
+    def acquire_if_idle(self):
+        """
+        Take a slot only if no render is running or waiting, for background work.
+
+        Returns:
+            A ticket to pass to release(), or None if the scheduler is busy
+        """
+        with self._lock:
+            if self._running or self._waiters:
+                return None
+            self._running += 1
+            return time.perf_counter()
+
+    def release(self, ticket):
+        """Give back the slot acquired with ticket, handing it to the next waiter if any."""
+        with self._lock:
+            held = time.perf_counter() - ticket
+            self._hold = held if self._hold is None else \
+                (1 - HOLD_SMOOTHING) * self._hold + HOLD_SMOOTHING * held
+            if self._waiters:
+                # The slot passes straight to the next waiter; running stays the same
+                waiter = heapq.heappop(self._waiters)
+                waiter[3] = "granted"
+                waiter[2].set()
+                self.admitted += 1
+            else:
+                self._running -= 1
+
+    def _retry_after(self):
+        # Seconds until everything queued now (plus one more render) should be done
+        hold = self._hold if self._hold is not None else 1.0
+        return max(1, math.ceil(hold * (len(self._waiters) + 1) / self.max_concurrent))
+
+    def stats(self):
+        """Return the running and queued renders and the admission counters."""
+        with self._lock:
+            return {
+                "running": self._running,
+                "queued": len(self._waiters),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "shed": self.shed,
+                "timeouts": self.timeouts,
+                "average_render_seconds": self._hold or 0.0,
+            }
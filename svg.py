@@ -0,0 +1,154 @@
+"""
+SVG output for honse scenes.
+
+Honses are a few dozen ellipses, polygons and lines, so writing the display
+list out as SVG elements gives a small, resolution-independent image without
+rasterizing or compressing anything. Backgrounds are described the same way:
+the sky gradient becomes a <linearGradient> and each hill a single quadratic
+Bézier curve, which traces the same parabola hill_polygon() samples per pixel.
+"""
+
+from backgrounds import SKY_COLOR, SKY_BOTTOM_COLOR, GRASS_COLOR, HORIZON
+
+
+def _num(value, precision=1):
+    """Format a coordinate compactly (no trailing zeros)."""
+    text = f"{value:.{precision}f}".rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
+
+
+def _color(fill):
+    """Format an RGB tuple as #rrggbb."""
+    r, g, b = (int(c) for c in fill[:3])
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def _points(xy, precision=1):
+    return " ".join(f"{_num(x, precision)},{_num(y, precision)}" for x, y in zip(xy[0::2], xy[1::2]))
+
+
+def display_list_elements(display_list, precision=1):
+    """
+    Turn a display list into SVG elements.
+
+    Args:
+        display_list: DisplayList (or any iterable of (op, xy, fill, width) items)
+        precision: decimal places kept for coordinates
+
+    Returns:
+        A list of SVG element strings, in drawing order
+    """
+    elements = []
+    for op, xy, fill, width in display_list:
+        color = _color(fill)
+        if op == "ellipse":
+            x0, y0, x1, y1 = xy
+            elements.append(
+                f'<ellipse cx="{_num((x0 + x1) / 2, precision)}" cy="{_num((y0 + y1) / 2, precision)}" '
+                f'rx="{_num(abs(x1 - x0) / 2, precision)}" ry="{_num(abs(y1 - y0) / 2, precision)}" '
+                f'fill="{color}"/>')
+        elif op == "rectangle":
+            x0, y0, x1, y1 = xy
+            elements.append(
+                f'<rect x="{_num(min(x0, x1), precision)}" y="{_num(min(y0, y1), precision)}" '
+                f'width="{_num(abs(x1 - x0), precision)}" height="{_num(abs(y1 - y0), precision)}" '
+                f'fill="{color}"/>')
+        elif op == "polygon":
+            elements.append(f'<polygon points="{_points(xy, precision)}" fill="{color}"/>')
+        elif op == "line":
+            elements.append(f'<polyline points="{_points(xy, precision)}" fill="none" '
+                            f'stroke="{color}" stroke-width="{width}"/>')
+    return elements
+
+
+def hill_path(hill, width, height, precision=1):
+    """
+    Return the SVG path of a hill spec.
+
+    The hill's outline is a parabola in x, so one quadratic Bézier whose
+    control point sits where the end tangents meet reproduces it exactly.
+    """
+    scale = width * hill["width"]
+
+    def y(x):
+        dx = (x - hill["x"]) / scale
+        return height * (HORIZON - hill["height"] * (1 - dx * dx))
+
+    slope = 2 * height * hill["height"] * (0 - hill["x"]) / (scale * scale)
+    control_y = y(0) + slope * width / 2
+    return (f'<path d="M0 {_num(y(0), precision)} '
+            f'Q{_num(width / 2, precision)} {_num(control_y, precision)} '
+            f'{_num(width, precision)} {_num(y(width), precision)} '
+            f'L{width} {height} L0 {height}Z" fill="{_color(hill["color"])}"/>')
+
+
+def field_background_elements(width, height):
+    """Return the plain sky and grass background as SVG elements."""
+    return [
+        f'<rect width="{width}" height="{height}" fill="{_color(SKY_COLOR)}"/>',
+        f'<rect y="{_num(height * HORIZON)}" width="{width}" height="{_num(height * (1 - HORIZON))}" '
+        f'fill="{_color(GRASS_COLOR)}"/>',
+    ]
+
+
+def herd_background_elements(width, height, spec):
+    """
+    Return the herd background as SVG elements.
+
+    Args:
+        width: width of the canvas in pixels
+        height: height of the canvas in pixels
+        spec: herd_background_spec with the hills and grass tufts to draw
+
+    Returns:
+        A list of SVG element strings (the sky gradient definition first)
+    """
+    elements = [
+        '<defs><linearGradient id="sky" x1="0" y1="0" x2="0" y2="1">'
+        f'<stop offset="0" stop-color="{_color(SKY_COLOR)}"/>'
+        f'<stop offset="1" stop-color="{_color(SKY_BOTTOM_COLOR)}"/>'
+        '</linearGradient></defs>',
+        f'<rect width="{width}" height="{height}" fill="url(#sky)"/>',
+    ]
+    elements.extend(hill_path(hill, width, height) for hill in spec["hills"])
+    elements.append(f'<rect y="{_num(height * HORIZON)}" width="{width}" '
+                    f'height="{_num(height * (1 - HORIZON))}" fill="{_color(GRASS_COLOR)}"/>')
+
+    # Grass tufts are all 2px vertical strokes; only their colour differs
+    elements.append('<g stroke-width="2">')
+    for x, y, grass_height, grass_color in spec["tufts"]:
+        elements.append(f'<path d="M{_num(x)} {_num(y)}v{_num(-grass_height)}" '
+                        f'stroke="{_color(grass_color)}"/>')
+    elements.append('</g>')
+    return elements
+
+
+def render_svg(width, height, display_list, background=None, precision=1):
+    """
+    Render a scene as an SVG document.
+
+    Args:
+        width: width of the canvas in pixels
+        height: height of the canvas in pixels
+        display_list: DisplayList with the honses to draw
+        background: herd_background_spec for a herd background, or None for
+            the plain field background
+        precision: decimal places kept for coordinates
+
+    Returns:
+        The SVG document as UTF-8 bytes
+    """
+    if background is None:
+        elements = field_background_elements(width, height)
+    else:
+        elements = herd_background_elements(width, height, background)
+    elements.append('<g stroke-linejoin="round">')
+    elements.extend(display_list_elements(display_list, precision))
+    elements.append('</g>')
+
+    return "\n".join([
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}">',
+        *elements,
+        '</svg>\n',
+    ]).encode("utf-8")
@@ -0,0 +1,277 @@
+"""
+Tiled rendering of poster-sized herds.
+
+A poster is split into square tiles. The scene (background spec and every
+honse's geometry) is computed once, and each primitive is assigned to the
+tiles its bounding box overlaps, kept as a compact float32 array. Tiles are
+rendered independently, in this process or on a process pool, and written
+out one row of tiles at a time as a streaming PNG, so peak pixel memory is a
+couple of tile rows however tall the canvas is or however many honses it has.
+"""
+
+from collections import OrderedDict
+import random
+import struct
+import threading
+import zlib
+import numpy as np
+from PIL import Image, ImageDraw
+from backgrounds import GRASS_COLOR, HORIZON, herd_background_spec, hill_polygon, sky_gradient
+from display_list import DisplayList
+from herd_geometry import place_herd, build_herd_display_list
+from rasterizers import get_rasterizer
+
+TILE_SIZE = 512
+
+# Extra pixels drawn around each tile and cropped off. Pillow rasterizes shapes
+# cut by the image edge slightly differently, which would otherwise show as seams.
+TILE_MARGIN = 16
+
+# Posters are scaled up from the regular 1200x800 herd with its 100 grass tufts
+BASE_WIDTH, BASE_HEIGHT = 1200, 800
+BASE_TUFTS = 100
+
+# Number of honses whose geometry is computed in one vectorized pass
+GEOMETRY_CHUNK = 512
+
+# Built posters kept per process: at most this many, holding at most this many
+# bytes of binned geometry (a 10000-honse poster takes about 100MB)
+MAX_POSTERS = 4
+MAX_POSTER_BYTES = 128 * 1024 * 1024
+
+# Approximate bytes per binned primitive besides its coordinates (array header,
+# entry tuple, colour), and per reference to it from a tile; measured with tracemalloc
+ENTRY_OVERHEAD = 240
+BIN_REFERENCE = 8
+
+
+class HerdPoster:
+    """
+    A herd scene of any size, rendered tile by tile.
+
+    The layout is known as soon as the poster is created; the scene itself is
+    built on first use, so a process that only hands tiles to a pool never
+    computes any geometry.
+    """
+
+    def __init__(self, width, height, num_honses, seed=None, tile_size=TILE_SIZE):
+        """
+        Args:
+            width: width of the poster in pixels
+            height: height of the poster in pixels
+            num_honses: number of honses in the herd
+            seed: seed for every random choice (a random one is picked if None)
+            tile_size: width and height of a tile in pixels
+        """
+        self.width = width
+        self.height = height
+        self.num_honses = num_honses
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.tile_size = tile_size
+        self.cols = -(-width // tile_size)
+        self.rows = -(-height // tile_size)
+        self.background = None
+        self.params = None
+        self._bins = None
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        """Approximate bytes held by the binned geometry (0 until built)."""
+        return self._nbytes
+
+    def tile_box(self, col, row):
+        """Return the (x0, y0, x1, y1) pixel box covered by a tile."""
+        x0 = col * self.tile_size
+        y0 = row * self.tile_size
+        return x0, y0, min(x0 + self.tile_size, self.width), min(y0 + self.tile_size, self.height)
+
+    def build(self):
+        """Place the honses and bin every primitive by tile (no-op if already built)."""
+        with self._lock:
+            if self._bins is not None:
+                return self
+            rng = random.Random(self.seed)
+            tufts = round(BASE_TUFTS * self.width * self.height / (BASE_WIDTH * BASE_HEIGHT))
+            self.background = herd_background_spec(self.width, self.height, rng, tufts=tufts)
+            honses, self.params = place_herd(self.num_honses, self.width, self.height, rng,
+                                             scale=self.height / BASE_HEIGHT)
+
+            self._bins = [[] for _ in range(self.cols * self.rows)]
+            # Grass tufts go in first so honses are drawn over them
+            for x, y, grass_height, grass_color in self.background["tufts"]:
+                self._add(("line", [x, y, x, y - grass_height], grass_color, 2))
+            for start in range(0, len(honses), GEOMETRY_CHUNK):
+                for item in build_herd_display_list(honses[start:start + GEOMETRY_CHUNK], rng):
+                    self._add(item)
+        return self
+
+    def _add(self, item):
+        op, xy, fill, width = item
+        xs = xy[0::2]
+        ys = xy[1::2]
+        pad = width / 2 + 1 + TILE_MARGIN
+        size = self.tile_size
+        col0 = max(int((min(xs) - pad) // size), 0)
+        col1 = min(int((max(xs) + pad) // size), self.cols - 1)
+        row0 = max(int((min(ys) - pad) // size), 0)
+        row1 = min(int((max(ys) + pad) // size), self.rows - 1)
+        if col0 > col1 or row0 > row1:
+            return  # Entirely off the canvas
+
+        entry = (op, np.asarray(xy, dtype=np.float32), fill, width)
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                self._bins[row * self.cols + col].append(entry)
+        self._nbytes += entry[1].nbytes + ENTRY_OVERHEAD + BIN_REFERENCE * (row1 - row0 + 1) * (col1 - col0 + 1)
+
+    def render_tile(self, col, row, rasterizer="pillow"):
+        """
+        Render one tile.
+
+        Args:
+            col, row: tile coordinates
+            rasterizer: name of the rasterizer backend
+
+        Returns:
+            An RGB PIL Image the size of the tile
+        """
+        self.build()
+        tile = self.tile_box(col, row)
+        x0 = max(tile[0] - TILE_MARGIN, 0)
+        y0 = max(tile[1] - TILE_MARGIN, 0)
+        x1 = min(tile[2] + TILE_MARGIN, self.width)
+        y1 = min(tile[3] + TILE_MARGIN, self.height)
+        image = Image.fromarray(sky_gradient(x1 - x0, self.height, y0, y1), 'RGB')
+        draw = ImageDraw.Draw(image)
+
+        # Only the part of each hill above this tile's columns
+        for hill in self.background["hills"]:
+            points = hill_polygon(hill, self.width, self.height, x0, x1)
+            if points:
+                draw.polygon([(x - x0, y - y0) for x, y in points], fill=hill["color"])
+        draw.rectangle([(0, self.height * HORIZON - y0), (x1 - x0, self.height - y0)], fill=GRASS_COLOR)
+
+        shift = np.array([x0, y0], dtype=np.float32)
+        display_list = DisplayList(
+            (op, (xy.reshape(-1, 2) - shift).ravel().tolist(), fill, width)
+            for op, xy, fill, width in self._bins[row * self.cols + col]
+        )
+        get_rasterizer(rasterizer).render(image, display_list)
+        return image.crop((tile[0] - x0, tile[1] - y0, tile[2] - x0, tile[3] - y0))
+
+    def iter_bands(self, rasterizer="pillow", executor=None, cache_bytes=MAX_POSTER_BYTES):
+        """
+        Render the poster one row of tiles at a time.
+
+        Args:
+            rasterizer: name of the rasterizer backend
+            executor: process pool to render tiles on; the next row is
+                submitted while the current one is assembled. Tiles are
+                rendered here if None.
+            cache_bytes: max_bytes of the posters each pool process keeps (see cached_poster)
+
+        Yields:
+            (band height, width, 3) uint8 arrays, top to bottom
+        """
+        if executor is None:
+            for row in range(self.rows):
+                yield self._assemble(row, (self.render_tile(col, row, rasterizer)
+                                           for col in range(self.cols)))
+            return
+
+        key = (self.width, self.height, self.num_honses, self.seed, self.tile_size)
+
+        def submit(row):
+            return [executor.submit(_render_tile_job, (key, col, row, rasterizer, cache_bytes))
+                    for col in range(self.cols)]
+
+        pending = submit(0)
+        for row in range(self.rows):
+            futures = pending
+            pending = submit(row + 1) if row + 1 < self.rows else None
+            yield self._assemble(row, (self._tile_image(col, row, future.result())
+                                       for col, future in enumerate(futures)))
+
+    def _tile_image(self, col, row, data):
+        x0, y0, x1, y1 = self.tile_box(col, row)
+        return Image.frombytes('RGB', (x1 - x0, y1 - y0), data)
+
+    def _assemble(self, row, tiles):
+        # tiles is consumed lazily, so only one tile is held besides the band
+        _, y0, _, y1 = self.tile_box(0, row)
+        band = np.empty((y1 - y0, self.width, 3), dtype=np.uint8)
+        for col, tile in enumerate(tiles):
+            x0, _, x1, _ = self.tile_box(col, row)
+            band[:, x0:x1] = np.asarray(tile)
+        return band
+
+
+_posters = OrderedDict()
+_posters_lock = threading.Lock()
+
+
+def cached_poster(width, height, num_honses, seed, tile_size=TILE_SIZE,
+                  max_posters=MAX_POSTERS, max_bytes=MAX_POSTER_BYTES):
+    """
+    Return a HerdPoster shared by every request (and tile job) for the same scene.
+
+    The least recently used posters are dropped when there are more than
+    max_posters, or their binned geometry takes more than max_bytes. A poster
+    is only measured once built, and the one being returned is never dropped,
+    so a process holds at most max_bytes plus the newest poster.
+    """
+    key = (width, height, num_honses, seed, tile_size)
+    with _posters_lock:
+        poster = _posters.get(key)
+        if poster is None:
+            poster = _posters[key] = HerdPoster(*key)
+        _posters.move_to_end(key)
+        while len(_posters) > 1 and (len(_posters) > max_posters or
+                                     sum(p.nbytes for p in _posters.values()) > max_bytes):
+            _posters.popitem(last=False)
+    return poster
+
+
+def _render_tile_job(job):
+    # Top-level so the process pool can pickle it; each worker builds the scene once
+    key, col, row, rasterizer, cache_bytes = job
+    return cached_poster(*key, max_bytes=cache_bytes).render_tile(col, row, rasterizer).tobytes()
+
+
+def _png_chunk(tag, data):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+
+def stream_png(width, height, bands, compress_level=6):
+    """
+    Encode an RGB image as PNG while its rows are still being produced.
+
+    Each row uses the Sub filter (the difference from the pixel to its left),
+    which turns the flat sky, grass and honse colours into runs of zeros.
+
+    Args:
+        width: width of the image in pixels
+        height: height of the image in pixels
+        bands: iterable of (rows, width, 3) uint8 arrays covering the image top to bottom
+        compress_level: zlib level, 0 (fastest) to 9 (smallest)
+
+    Yields:
+        The PNG file in pieces
+    """
+    yield b"\x89PNG\r\n\x1a\n"
+    yield _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    compressor = zlib.compressobj(compress_level)
+    for band in bands:
+        rows = band.reshape(band.shape[0], width * 3)
+        filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 1  # Sub filter
+        filtered[:, 1:4] = rows[:, :3]
+        np.subtract(rows[:, 3:], rows[:, :-3], out=filtered[:, 4:])
+        data = compressor.compress(filtered)
+        if data:
+            yield _png_chunk(b"IDAT", data)
+    yield _png_chunk(b"IDAT", compressor.flush())
+    yield _png_chunk(b"IEND", b"")